@@ -0,0 +1,181 @@
+import calendar
+import datetime
+from decimal import ROUND_DOWN, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, Value, When
+
+from . import dashboard_cache, portfolio
+from .models import AccrualWatermark, Account, Investment
+from .posting import post_many
+
+CENT = Decimal('0.01')
+DAYS_PER_YEAR = 365
+
+
+def _savings_update(days):
+    rate = Decimal(str(getattr(settings, 'SAVINGS_INTEREST_RATE', 2)))
+    factor = Value(days * rate / (100 * DAYS_PER_YEAR), output_field=DecimalField())
+    return {'accrued_interest': F('accrued_interest') + F('balance') * factor}
+
+
+def _investment_update(days):
+    factor = Value(Decimal(days) / (100 * DAYS_PER_YEAR), output_field=DecimalField())
+    return {'accrued_return': F('accrued_return') + F('amount') * F('return_rate') * factor}
+
+
+# name -> (model, eligible rows, update for a number of days)
+ACCRUALS = {
+    'savings': (Account, {'account_type': 'savings', 'balance__gt': 0}, _savings_update),
+    'investments': (Investment, {'amount__gt': 0}, _investment_update),
+}
+
+
+def _start_round(name, through):
+    """
+    Return ``(accrued_through, target_date)`` of the round in progress for
+    ``name``, starting one up to ``through`` if there is none. None when
+    already accrued through ``through``.
+    """
+    while True:
+        with transaction.atomic():
+            watermark, _ = AccrualWatermark.objects.select_for_update().get_or_create(name=name)
+            if watermark.target_date is not None:
+                return watermark.accrued_through, watermark.target_date
+            start = watermark.accrued_through or through - datetime.timedelta(days=1)
+            if start >= through:
+                return None
+            # Conditional, so two runs starting together open one round
+            if AccrualWatermark.objects.filter(
+                    name=name, target_date=None, accrued_through=watermark.accrued_through,
+            ).update(accrued_through=start, target_date=through, next_id=0):
+                return start, through
+
+
+def _accrue_range(name, target, values, low, chunk_size):
+    """
+    Claim the id range starting at ``low`` of the round ending ``target``
+    and apply ``values`` to it, in one transaction. Returns the rows
+    updated, or None if another run has claimed the range or finished the
+    round.
+    """
+    model, eligible, _ = ACCRUALS[name]
+    with transaction.atomic():
+        if not AccrualWatermark.objects.filter(name=name, target_date=target, next_id=low).update(next_id=low + chunk_size):
+            return None
+        return model.objects.filter(id__gte=low, id__lt=low + chunk_size, **eligible).update(**values)
+
+
+def accrue(name, through, chunk_size=100000):
+    """
+    Accrue ``name`` (a key of ``ACCRUALS``) for every day after its watermark
+    up to and including ``through``, with one set-based UPDATE per id range.
+    Each range is claimed by advancing the watermark in the transaction that
+    accrues it, so an interrupted run resumes at the next range, concurrent
+    runs share the ranges between them and no row is accrued twice. The
+    first run accrues just the one day. Returns the rows updated.
+    """
+    model, _, update = ACCRUALS[name]
+    updated = 0
+    while True:
+        round_ = _start_round(name, through)
+        if round_ is None:
+            return updated
+        accrued_through, target = round_
+        values = update((target - accrued_through).days)
+        last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+        low = AccrualWatermark.objects.values_list('next_id', flat=True).get(name=name)
+        while low <= last_id:
+            rows = _accrue_range(name, target, values, low, chunk_size)
+            if rows is not None:
+                updated += rows
+                low += chunk_size
+                continue
+            # Another run got here first; carry on after its ranges
+            watermark = AccrualWatermark.objects.get(name=name)
+            if watermark.target_date != target:
+                break
+            low = watermark.next_id
+        AccrualWatermark.objects.filter(name=name, target_date=target).update(
+            accrued_through=target, target_date=None, next_id=0)
+        # An unfinished earlier run was completed first; now do the one asked for
+
+
+def _by_id(amounts):
+    return Case(
+        *[When(id=pk, then=Value(amount)) for pk, amount in amounts.items()],
+        output_field=DecimalField(),
+    )
+
+
+def _capitalizable(queryset, field, after, chunk_size):
+    """Next ``chunk_size`` rows after id ``after`` with at least a cent accrued."""
+    rows = list(
+        queryset.filter(**{f'{field}__gte': CENT, 'id__gt': after})
+        .order_by('id').values_list('id', 'customer_id', field)[:chunk_size]
+    )
+    amounts = {pk: accrued.quantize(CENT, ROUND_DOWN) for pk, _, accrued in rows}
+    return rows, amounts
+
+
+def _claim(queryset, field, amounts):
+    """
+    Lock the rows of ``amounts`` that still hold at least their amount in
+    ``field`` and return only those amounts. A row another run has paid out
+    since it was read no longer qualifies, so it is not paid twice. Call
+    inside the transaction that pays them.
+    """
+    claimed = (
+        queryset.select_for_update().filter(id__in=list(amounts), **{f'{field}__gte': _by_id(amounts)})
+        .order_by('id').values_list('id', flat=True)
+    )
+    return {pk: amounts[pk] for pk in claimed}
+
+
+def capitalize_interest(chunk_size=500):
+    """
+    Pay whole cents of accrued savings interest into the balances through
+    ``post_many``, leaving the fractions accrued. Safe to run concurrently:
+    each account is paid by whichever run claims it first. Returns accounts
+    credited.
+    """
+    credited = after = 0
+    while True:
+        rows, amounts = _capitalizable(Account.objects.filter(account_type='savings'), 'accrued_interest', after, chunk_size)
+        if not rows:
+            return credited
+        after = rows[-1][0]
+        with transaction.atomic():
+            amounts = _claim(Account.objects.all(), 'accrued_interest', amounts)
+            if not amounts:
+                continue
+            Account.objects.filter(id__in=list(amounts)).update(accrued_interest=F('accrued_interest') - _by_id(amounts))
+            post_many([(pk, 'deposit', amount, 'Interest') for pk, amount in amounts.items()])
+        credited += len(amounts)
+
+
+def compound_returns(chunk_size=500):
+    """Add whole cents of accrued return to each investment's amount."""
+    compounded = after = 0
+    while True:
+        rows, amounts = _capitalizable(Investment.objects.all(), 'accrued_return', after, chunk_size)
+        if not rows:
+            return compounded
+        after = rows[-1][0]
+        with transaction.atomic():
+            amounts = _claim(Investment.objects.all(), 'accrued_return', amounts)
+            if not amounts:
+                continue
+            Investment.objects.filter(id__in=list(amounts)).update(
+                amount=F('amount') + _by_id(amounts),
+                accrued_return=F('accrued_return') - _by_id(amounts),
+            )
+            # update() sends no signals
+            dashboard_cache.invalidate_many(customer_id for _, customer_id, _ in rows)
+            portfolio.invalidate()
+        compounded += len(amounts)
+
+
+def is_month_end(date):
+    return date.day == calendar.monthrange(date.year, date.month)[1]
@@ -0,0 +1,40 @@
+"""
+Thin async query layer for the async views.
+
+Uses the ORM's native async interfaces where the installed Django has them
+and otherwise runs the query on Django's shared sync thread, which keeps
+connection handling and test transactions identical to the sync views.
+"""
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth import get_user
+
+
+def _native(queryset, name):
+    return getattr(queryset, name, None)
+
+
+async def fetch_all(queryset):
+    """Evaluate ``queryset`` and return its rows as a list."""
+    if _native(queryset, 'aiterator'):
+        return [row async for row in queryset]
+    return await sync_to_async(list)(queryset)
+
+
+async def fetch_first(queryset):
+    afirst = _native(queryset, 'afirst')
+    if afirst:
+        return await afirst()
+    return await sync_to_async(queryset.first)()
+
+
+async def fetch_user(request):
+    """
+    Resolve ``request.user`` without touching the lazy object from the
+    event loop, and replace it with the loaded user so templates and
+    context processors never trigger a query later.
+    """
+    user = await sync_to_async(get_user)(request)
+    request.user = user
+    request._cached_user = user
+    return user
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import threading
+from collections import deque
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+ACCOUNT_SEQUENCE = 'account_number'
+CARD_SEQUENCE = 'card_number'
+ACCOUNT_NUMBER_DIGITS = 12
+CARD_NUMBER_DIGITS = 16
+
+
+def luhn_check_digit(payload):
+    """Return the Luhn check digit for the string of digits ``payload``."""
+    total = 0
+    for position, digit in enumerate(reversed(payload)):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+
+def is_luhn_valid(number):
+    return luhn_check_digit(number[:-1]) == number[-1]
+
+
+class FeistelPermutation:
+    """
+    Keyed bijection on ``range(10 ** digits)``.
+
+    Sequential counters go in and unique, non-sequential numbers come out,
+    so no existence check is needed to guarantee uniqueness. Odd digit
+    counts are handled by cycle-walking in the next even-sized domain.
+    """
+
+    rounds = 6
+
+    def __init__(self, digits, key):
+        self.size = 10 ** digits
+        self.half = 10 ** ((digits + 1) // 2)
+        self.key = hashlib.sha256(key.encode()).digest()
+
+    def _round(self, index, value):
+        digest = hashlib.blake2b(f'{index}:{value}'.encode(), key=self.key, digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.half
+
+    def _encrypt(self, value):
+        left, right = divmod(value, self.half)
+        for index in range(self.rounds):
+            left, right = right, (left + self._round(index, right)) % self.half
+        return left * self.half + right
+
+    def __call__(self, value):
+        if not 0 <= value < self.size:
+            raise ValueError(f'{value} is outside the permutation domain.')
+        value = self._encrypt(value)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+
+def reserve_block(sequence, count):
+    """
+    Atomically reserve ``count`` values from ``sequence`` and return the
+    half-open range they occupy. One UPDATE per block, however many
+    workers are allocating concurrently.
+    """
+    NumberSequence = apps.get_model('bank', 'NumberSequence')
+    with transaction.atomic():
+        updated = NumberSequence.objects.filter(name=sequence).update(next_value=F('next_value') + count)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    NumberSequence.objects.create(name=sequence, next_value=count)
+            except IntegrityError:
+                NumberSequence.objects.filter(name=sequence).update(next_value=F('next_value') + count)
+        end = NumberSequence.objects.filter(name=sequence).values_list('next_value', flat=True).get()
+    return range(end - count, end)
+
+
+class NumberAllocator:
+    """
+    Hands out unique numbers from blocks reserved in ``NumberSequence``.
+
+    Each process keeps its current block in memory, so most allocations
+    touch the database not at all. Numbers that clash with legacy rows
+    created before the allocator existed are filtered out with one query
+    per block.
+    """
+
+    def __init__(self, sequence, digits, model, field):
+        self.sequence = sequence
+        self.digits = digits
+        self.model = model
+        self.field = field
+        self.permute = FeistelPermutation(digits, f'{settings.SECRET_KEY}:{sequence}')
+        self.lock = threading.Lock()
+        self.pool = deque()
+        self.pid = os.getpid()
+
+    def format(self, value):
+        return str(self.permute(value)).zfill(self.digits)
+
+    def _generate(self, count):
+        numbers = [self.format(value) for value in reserve_block(self.sequence, count)]
+        Model = apps.get_model('bank', self.model)
+        taken = set()
+        for start in range(0, len(numbers), 500):
+            chunk = numbers[start:start + 500]
+            taken.update(Model.objects.filter(**{f'{self.field}__in': chunk}).values_list(self.field, flat=True))
+        return [number for number in numbers if number not in taken]
+
+    def _release(self, numbers):
+        with self.lock:
+            self.pool.extend(numbers)
+
+    def allocate(self, count):
+        """Return ``count`` unique numbers, reserving a fresh block if needed."""
+        with self.lock:
+            if self.pid != os.getpid():
+                # Forked worker: the parent's block may be handed out there too
+                self.pool.clear()
+                self.pid = os.getpid()
+            numbers = [self.pool.popleft() for _ in range(min(count, len(self.pool)))]
+            if len(numbers) == count:
+                return numbers
+            block_size = getattr(settings, 'NUMBER_BLOCK_SIZE', 100)
+            fresh = []
+            while len(numbers) + len(fresh) < count:
+                fresh.extend(self._generate(max(block_size, count - len(numbers) - len(fresh))))
+            needed = count - len(numbers)
+            numbers.extend(fresh[:needed])
+        # If the caller's transaction rolls back, so does the reservation, and
+        # the block may be handed out again; only pool the rest once committed.
+        transaction.on_commit(lambda: self._release(fresh[needed:]))
+        return numbers
+
+
+class CardNumberAllocator(NumberAllocator):
+    """Card numbers are the issuer prefix, a permuted counter and a Luhn digit."""
+
+    def __init__(self, sequence, model, field):
+        self.prefix = getattr(settings, 'CARD_NUMBER_PREFIX', '400000')
+        super().__init__(sequence, CARD_NUMBER_DIGITS - len(self.prefix) - 1, model, field)
+
+    def format(self, value):
+        payload = self.prefix + super().format(value)
+        return payload + luhn_check_digit(payload)
+
+
+_account_numbers = None
+_card_numbers = None
+
+
+def _account_allocator():
+    global _account_numbers
+    if _account_numbers is None:
+        _account_numbers = NumberAllocator(ACCOUNT_SEQUENCE, ACCOUNT_NUMBER_DIGITS, 'Account', 'account_number')
+    return _account_numbers
+
+
+def _card_allocator():
+    global _card_numbers
+    if _card_numbers is None:
+        _card_numbers = CardNumberAllocator(CARD_SEQUENCE, 'CreditCard', 'card_number')
+    return _card_numbers
+
+
+def allocate_account_numbers(count):
+    return _account_allocator().allocate(count)
+
+
+def allocate_card_numbers(count):
+    return _card_allocator().allocate(count)
+
+
+def next_account_number():
+    return allocate_account_numbers(1)[0]
+
+
+def next_card_number():
+    return allocate_card_numbers(1)[0]
@@ -0,0 +1,136 @@
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
+
+from .models import Loan, LoanSchedule
+
+CENT = Decimal('0.01')
+# interest_rate is an annual percentage with two decimals, so in hundredths
+# of a percent the monthly rate is rate_hundredths / 120000.
+MONTHLY_RATE_DENOMINATOR = 120000
+
+
+def to_cents(value):
+    return int((Decimal(value) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def from_cents(value):
+    return (Decimal(int(value)) / 100).quantize(CENT)
+
+
+def level_payment(principal, annual_rate, term_months):
+    """Level monthly payment in cents for each loan, rounded half up."""
+    principal = np.asarray(principal, dtype=np.float64)
+    monthly = np.asarray(annual_rate, dtype=np.float64) / MONTHLY_RATE_DENOMINATOR
+    terms = np.asarray(term_months, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = np.where(
+            monthly > 0,
+            principal * monthly / (1 - (1 + monthly) ** -terms),
+            principal / terms,
+        )
+    return np.floor(payment + 0.5).astype(np.int64)
+
+
+def _monthly_interest(balance, rate_hundredths):
+    # Exact half-up rounding of balance * rate / 120000 in integer cents
+    return (balance * rate_hundredths * 2 + MONTHLY_RATE_DENOMINATOR) // (2 * MONTHLY_RATE_DENOMINATOR)
+
+
+def amortize(principal_cents, rate_hundredths, term_months):
+    """
+    Amortize many loans at once.
+
+    Takes integer arrays of principal in cents, annual rate in hundredths of
+    a percent and term in months, and returns ``(payment, final_payment,
+    total_interest)`` arrays in cents. Every period is computed for all
+    loans in one vector step. Interest is rounded per period in exact
+    integer arithmetic, so the result matches ``schedule_rows`` cent for
+    cent, and the final payment absorbs the rounding residue so that
+    principal repaid always equals the amount borrowed.
+    """
+    principal = np.asarray(principal_cents, dtype=np.int64)
+    rate = np.asarray(rate_hundredths, dtype=np.int64)
+    terms = np.asarray(term_months, dtype=np.int64)
+    payment = level_payment(principal, rate, terms)
+
+    balance = principal.copy()
+    total_interest = np.zeros_like(principal)
+    final_payment = np.zeros_like(principal)
+    for period in range(1, int(terms.max(initial=0)) + 1):
+        active = period <= terms
+        interest = np.where(active, _monthly_interest(balance, rate), 0)
+        last = period == terms
+        repaid = np.where(last, balance, np.minimum(np.maximum(payment - interest, 0), balance))
+        repaid = np.where(active, repaid, 0)
+        final_payment = np.where(last, balance + interest, final_payment)
+        total_interest += interest
+        balance -= repaid
+    return payment, final_payment, total_interest
+
+
+def schedule_rows(loan, schedule=None):
+    """
+    Yield ``(period, payment, interest, principal, balance)`` Decimals for
+    ``loan``, derived on demand from its stored level payment. Arithmetic
+    is done in integer cents so no Decimal division rounding creeps in.
+    """
+    schedule = schedule or loan.schedule
+    payment = to_cents(schedule.monthly_payment)
+    rate = to_cents(loan.interest_rate)
+    balance = to_cents(loan.amount)
+    for period in range(1, loan.term_months + 1):
+        interest = _monthly_interest(balance, rate)
+        if period == loan.term_months:
+            principal = balance
+        else:
+            principal = min(max(payment - interest, 0), balance)
+        balance -= principal
+        yield (period, from_cents(principal + interest), from_cents(interest),
+               from_cents(principal), from_cents(balance))
+
+
+def _schedules_for(chunk):
+    ids, amounts, rates, terms = zip(*chunk)
+    payment, final_payment, total_interest = amortize(
+        [to_cents(amount) for amount in amounts],
+        [to_cents(rate) for rate in rates],
+        terms,
+    )
+    return ids, [
+        LoanSchedule(
+            loan_id=loan_id,
+            monthly_payment=from_cents(payment[index]),
+            final_payment=from_cents(final_payment[index]),
+            total_interest=from_cents(total_interest[index]),
+        )
+        for index, loan_id in enumerate(ids)
+    ]
+
+
+def regenerate_schedules(loans=None, chunk_size=50000):
+    """
+    Recompute and store the schedule of every loan in ``loans`` (default:
+    all loans), streaming them in chunks. Each chunk is replaced in one
+    transaction. Returns the number of schedules written.
+    """
+    loans = Loan.objects.all() if loans is None else loans
+    rows = (
+        loans.filter(term_months__gt=0)
+        .order_by('id')
+        .values_list('id', 'amount', 'interest_rate', 'term_months')
+        .iterator(chunk_size=chunk_size)
+    )
+    written = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return written
+        ids, schedules = _schedules_for(chunk)
+        with transaction.atomic():
+            # A range keeps the DELETE within SQLite's bound-parameter limit
+            LoanSchedule.objects.filter(loan_id__gte=ids[0], loan_id__lte=ids[-1], loan__in=loans).delete()
+            LoanSchedule.objects.bulk_create(schedules, batch_size=2000)
+        written += len(schedules)
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class BankConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bank'
+
+    def ready(self):
+        from django.core import checks
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .database import configure_sqlite
+        from .throttle import check_shared_cache
+        connection_created.connect(configure_sqlite, dispatch_uid='bank_sqlite_pragmas')
+        checks.register(check_shared_cache, checks.Tags.caches)
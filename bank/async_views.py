@@ -0,0 +1,153 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import render
+
+from . import aio, dashboard_cache, portfolio, views
+from .models import CreditCard, Loan
+from .decisions import QUEUE_ORDERING, queue
+from .pagination import InvalidCursor, finish_page, keyset_slice
+from .database import reads_from_replica
+from .querycount import query_budget
+from .views import (
+    CUSTOMER_SORTS, TRANSACTION_FIELDS, TRANSACTION_ORDERING, check_role, customer_transactions,
+    page_size_param, queue_status, teller_querysets, transaction_row,
+)
+
+# Async counterparts of the read-heavy views in views.py. They render the
+# same templates and share the same query builders; only the I/O differs.
+
+
+def async_role_required(role):
+    """Async equivalent of ``@login_required`` + ``@user_passes_test(check_role(role))``."""
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            user = await aio.fetch_user(request)
+            if not user.is_authenticated or not check_role(role)(user):
+                return redirect_to_login(request.get_full_path())
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def _render(request, template_name, context):
+    # Context processors read the session and messages, which are sync-only
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def _page(queryset, ordering, cursor, size):
+    rows = await aio.fetch_all(keyset_slice(queryset, ordering, cursor, size))
+    return finish_page(rows, ordering, size)
+
+
+async def _customer_id(request):
+    customer_id = await sync_to_async(lambda: request.identity.customer_id)()
+    if customer_id is None:
+        raise Http404('No Customer matches the given query.')
+    return customer_id
+
+
+@async_role_required('customer')
+@reads_from_replica
+@query_budget(9)
+async def customer_dashboard(request):
+    customer_id = await _customer_id(request)
+    context = await sync_to_async(dashboard_cache.get_dashboard_context)(customer_id)
+    return await _render(request, 'customer_dashboard.html', context)
+
+
+@async_role_required('customer')
+@reads_from_replica
+@query_budget(4)
+async def transaction_list(request):
+    transactions = customer_transactions(await _customer_id(request)).select_related('account')
+    try:
+        transactions, next_cursor = await _page(
+            transactions, TRANSACTION_ORDERING, request.GET.get('cursor'), page_size_param(request))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return await _render(request, 'transaction_list.html', {'transactions': transactions, 'next_cursor': next_cursor})
+
+
+@async_role_required('customer')
+@reads_from_replica
+@query_budget(4)
+async def transaction_api(request):
+    transactions = customer_transactions(await _customer_id(request)).values(*TRANSACTION_FIELDS)
+    try:
+        rows, next_cursor = await _page(
+            transactions, TRANSACTION_ORDERING, request.GET.get('cursor'), page_size_param(request))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    return JsonResponse({'results': [transaction_row(row) for row in rows], 'next_cursor': next_cursor})
+
+
+@async_role_required('teller')
+@reads_from_replica
+@query_budget(4)
+async def teller_dashboard(request):
+    query = request.GET.get('q', '').strip()
+    sort = request.GET.get('sort', 'name')
+    if sort not in CUSTOMER_SORTS:
+        sort = 'name'
+    # Building the search may introspect the FTS table on first use
+    customers, accounts = await sync_to_async(teller_querysets)(query)
+    page_size = page_size_param(request, default=25, maximum=200)
+    try:
+        customers, next_customer_cursor = await _page(
+            customers, CUSTOMER_SORTS[sort], request.GET.get('cursor'), page_size)
+        accounts, next_account_cursor = await _page(
+            accounts, ('account_number',), request.GET.get('account_cursor'), page_size)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return await _render(request, 'teller_dashboard.html', {
+        'accounts': accounts,
+        'customers': customers,
+        'query': query,
+        'sort': sort,
+        'next_customer_cursor': next_customer_cursor,
+        'next_account_cursor': next_account_cursor,
+    })
+
+
+async def _render_queue(request, model, template_name, name):
+    status, statuses = queue_status(request, model)
+    try:
+        rows, next_cursor = await _page(
+            queue(model, status), QUEUE_ORDERING, request.GET.get('cursor'), page_size_param(request))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return await _render(request, template_name, {name: rows, 'status': status, 'statuses': statuses, 'next_cursor': next_cursor})
+
+
+@async_role_required('loan_officer')
+@reads_from_replica
+@query_budget(4)
+async def loan_officer_dashboard(request):
+    if request.method == 'POST':
+        return await sync_to_async(views.loan_officer_dashboard)(request)
+    return await _render_queue(request, Loan, 'loan_officer_dashboard.html', 'loans')
+
+
+@async_role_required('credit_card_manager')
+@reads_from_replica
+@query_budget(4)
+async def credit_card_manager_dashboard(request):
+    if request.method == 'POST':
+        return await sync_to_async(views.credit_card_manager_dashboard)(request)
+    return await _render_queue(request, CreditCard, 'credit_card_manager_dashboard.html', 'credit_cards')
+
+
+@async_role_required('financial_advisor')
+@reads_from_replica
+@query_budget(7)
+async def financial_advisor_dashboard(request):
+    try:
+        page = await sync_to_async(portfolio.customer_page)(request.GET.get('cursor'), page_size_param(request))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    summary = await sync_to_async(portfolio.book_summary)()
+    return await _render(request, 'financial_advisor_dashboard.html', views.advisor_context(summary, page))
@@ -0,0 +1,464 @@
+import atexit
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.db.models import Case, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Subquery, Value, When
+from django.utils import timezone
+
+from . import ledger, metrics
+from .models import CardEscrow, CardHold, CreditCard, CreditCardTransaction, LedgerBalance
+
+logger = logging.getLogger('bank.authorization')
+
+# Card purchases are approved against a slice of the card's open-to-buy
+# (credit limit minus posted balance minus holds not yet posted) that this
+# process has set aside in the database, so the common case needs no
+# database round trip. Slices are granted by a conditional UPDATE that adds
+# them to the card book's LedgerBalance.held, and recorded as CardEscrow
+# rows, so concurrent processes cannot approve more than the limit between
+# them. A background thread writes the approved purchases as CardHold rows
+# in micro-batches, moving them from escrow to holds, hands back unused
+# escrow, and posts the holds to the journal.
+#
+# Approvals are written within moments, but one approved and not yet
+# written when its process dies is lost; its escrow is returned to the
+# open-to-buy once it expires. A slice is used for CARD_AUTH_CACHE_TTL
+# seconds at most, so a card deactivated or reduced elsewhere stops being
+# approved here within that time; writes made through this process drop
+# the slice at once (see signals.py).
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+CENT = Decimal('0.01')
+# A slice is at most this fraction of the open-to-buy left, so processes
+# sharing a card near its limit do not starve each other
+ESCROW_SHARE = 4
+# Escrow is reclaimed this long (seconds) after its owner should have
+# handed it back
+ESCROW_GRACE = 60
+GRANT_ATTEMPTS = 3
+
+
+class Authorization:
+    def __init__(self, card_id, amount, approved, available, code=None, reason=None):
+        self.card_id = card_id
+        self.amount = amount
+        self.approved = approved
+        self.available = available
+        self.code = code
+        self.reason = reason
+
+    def as_dict(self):
+        return {
+            'card_id': self.card_id,
+            'amount': str(self.amount),
+            'approved': self.approved,
+            'authorization_code': self.code,
+            'available': None if self.available is None else str(self.available),
+            'reason': self.reason,
+        }
+
+
+def _card(card_id, customer_id=None):
+    cards = CreditCard.objects.filter(id=card_id, status='active')
+    if customer_id is not None:
+        cards = cards.filter(customer_id=customer_id)
+    return cards
+
+
+def _reserve(card_id, amount, customer_id=None):
+    """
+    Add ``amount`` to the held total of ``card_id`` if the card is active
+    and the amount fits within its open-to-buy. Returns the number of rows
+    updated.
+    """
+    within_limit = _card(card_id, customer_id).filter(
+        credit_limit__gte=ExpressionWrapper(OuterRef('balance') + OuterRef('held') + Value(amount), output_field=MONEY))
+    return LedgerBalance.objects.filter(book=ledger.card_book(card_id)).filter(Exists(within_limit)).update(
+        held=F('held') + amount)
+
+
+def _add_to_held(deltas):
+    """Add ``{card_id: delta}`` to the held totals of the cards' LedgerBalance rows."""
+    deltas = {card_id: delta for card_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    books = sorted(ledger.card_book(card_id) for card_id in deltas)
+    LedgerBalance.objects.filter(book__in=books).update(held=F('held') + Case(
+        *[When(book=ledger.card_book(card_id), then=Value(delta)) for card_id, delta in deltas.items()],
+        output_field=MONEY,
+    ))
+
+
+def grant(card_id, owner, needed, size, lease, customer_id=None):
+    """
+    Set aside part of the open-to-buy of ``card_id`` for ``owner`` until
+    ``lease`` seconds from now: at least ``needed``, at most ``size`` and
+    no more than ``1 / ESCROW_SHARE`` of what is left. Pass ``customer_id``
+    to refuse cards that belong to someone else.
+
+    Returns ``(card_customer_id, granted, available)``, where ``available``
+    is the open-to-buy left outside ``owner``'s escrow and ``granted`` is 0
+    if ``needed`` does not fit. None if the card is not active.
+    """
+    row = LedgerBalance.objects.filter(book=ledger.card_book(card_id))
+    cards = _card(card_id, customer_id).annotate(
+        balance=Subquery(row.values('balance')), held=Subquery(row.values('held')),
+    )
+    with transaction.atomic():
+        for _ in range(GRANT_ATTEMPTS):
+            card = cards.values_list('customer_id', 'credit_limit', 'balance', 'held').first()
+            if card is None:
+                return None
+            card_customer_id, credit_limit, balance, held = card
+            available = credit_limit - (balance or 0) - (held or 0)
+            share = (available / ESCROW_SHARE).quantize(CENT, rounding=ROUND_DOWN)
+            granted = max(needed, min(size, share))
+            if granted > available:
+                return card_customer_id, Decimal(0), available
+            if balance is None:
+                # Nothing has been posted to the card yet
+                LedgerBalance.objects.bulk_create([LedgerBalance(book=ledger.card_book(card_id))], ignore_conflicts=True)
+            if _reserve(card_id, granted, customer_id):
+                break
+        else:
+            # Other processes kept taking the open-to-buy first
+            return card_customer_id, Decimal(0), available
+
+        expires_at = timezone.now() + timedelta(seconds=lease)
+        escrow = CardEscrow.objects.filter(credit_card_id=card_id, owner=owner)
+        if not escrow.update(amount=F('amount') + granted, expires_at=expires_at):
+            try:
+                with transaction.atomic():
+                    CardEscrow.objects.create(credit_card_id=card_id, owner=owner, amount=granted, expires_at=expires_at)
+            except IntegrityError:
+                # Another thread of the same process created it first
+                escrow.update(amount=F('amount') + granted, expires_at=expires_at)
+    return card_customer_id, granted, available - granted
+
+
+def write_escrowed(owner, items):
+    """
+    Write purchases approved against ``owner``'s escrow as CardHold rows
+    and hand released escrow back to the open-to-buy, in one transaction.
+    ``items`` are ``(card_id, amount, description)`` tuples; a description
+    of None releases ``amount``.
+    """
+    spent, released = defaultdict(Decimal), defaultdict(Decimal)
+    for card_id, amount, description in items:
+        (released if description is None else spent)[card_id] += amount
+    cards = sorted(set(spent) | set(released))
+    with transaction.atomic():
+        # Locked so that reclaim_escrows cannot return the same amounts
+        escrowed = set(
+            CardEscrow.objects.select_for_update().filter(owner=owner, credit_card_id__in=cards)
+            .values_list('credit_card_id', flat=True)
+        )
+        CardHold.objects.bulk_create([
+            CardHold(credit_card_id=card_id, amount=amount, description=description)
+            for card_id, amount, description in items
+            if description is not None
+        ], batch_size=1000)
+        if escrowed:
+            CardEscrow.objects.filter(owner=owner, credit_card_id__in=escrowed).update(amount=F('amount') - Case(
+                *[When(credit_card_id=card_id, then=Value(spent[card_id] + released[card_id])) for card_id in sorted(escrowed)],
+                output_field=MONEY,
+            ))
+            CardEscrow.objects.filter(owner=owner, amount__lte=0).delete()
+        # Spending from escrow that expired and was reclaimed is held again
+        _add_to_held({
+            card_id: -released[card_id] if card_id in escrowed else spent[card_id]
+            for card_id in cards
+        })
+
+
+def reclaim_escrows():
+    """
+    Return escrow that its owner let expire, normally that of a stopped
+    worker, to the open-to-buy. Returns the number of escrows reclaimed.
+    """
+    with transaction.atomic():
+        expired = list(
+            CardEscrow.objects.select_for_update(skip_locked=True).filter(expires_at__lt=timezone.now())
+            .values_list('id', 'credit_card_id', 'amount')
+        )
+        if not expired:
+            return 0
+        totals = defaultdict(Decimal)
+        for _, card_id, amount in expired:
+            totals[card_id] -= amount
+        _add_to_held(totals)
+        CardEscrow.objects.filter(id__in=[escrow[0] for escrow in expired]).delete()
+    return len(expired)
+
+
+def post_holds(batch_size=200):
+    """
+    Post up to ``batch_size`` holds as one journal entry with a leg per
+    card, and their CreditCardTransaction rows in bulk, moving their amounts
+    from held to posted. Holds locked by another worker are skipped.
+    Returns the number posted.
+    """
+    with transaction.atomic():
+        holds = list(
+            CardHold.objects.select_for_update(skip_locked=True).order_by('id')
+            .values_list('id', 'credit_card_id', 'amount', 'description')[:batch_size]
+        )
+        if not holds:
+            return 0
+        totals = defaultdict(Decimal)
+        for _, card_id, amount, _ in holds:
+            totals[card_id] += amount
+        legs = {ledger.card_book(card_id): total for card_id, total in totals.items()}
+        legs[ledger.CARD_SETTLEMENT_BOOK] = -sum(totals.values(), Decimal(0))
+        entry = ledger.record_entry(f'Batch of {len(holds)} card authorizations', legs)
+        CreditCardTransaction.objects.bulk_create([
+            CreditCardTransaction(
+                credit_card_id=card_id,
+                transaction_type='purchase',
+                amount=amount,
+                description=description,
+                journal_entry=entry,
+            )
+            for _, card_id, amount, description in holds
+        ], batch_size=1000)
+        _add_to_held({card_id: -total for card_id, total in totals.items()})
+        CardHold.objects.filter(id__in=[hold[0] for hold in holds]).delete()
+    return len(holds)
+
+
+class _Escrow:
+    __slots__ = ('customer_id', 'remaining', 'outside', 'expires_at')
+
+    def __init__(self, customer_id, outside, expires_at):
+        self.customer_id = customer_id
+        # Escrow not yet spent on approvals
+        self.remaining = Decimal(0)
+        # Open-to-buy left outside this escrow when it was last granted
+        self.outside = outside
+        self.expires_at = expires_at
+
+
+class Authorizer:
+    """
+    Bounded LRU of the escrow this process holds per card, plus the queue
+    of approvals and releases waiting to be written.
+    """
+
+    def __init__(self, maxsize=None, ttl=None, escrow=None, batch_size=None, flush_interval=None):
+        self.maxsize = maxsize or getattr(settings, 'CARD_AUTH_CACHE_SIZE', 10000)
+        self.ttl = ttl or getattr(settings, 'CARD_AUTH_CACHE_TTL', 5)
+        self.escrow = Decimal(escrow or getattr(settings, 'CARD_AUTH_ESCROW', 2000))
+        self.batch_size = batch_size or getattr(settings, 'CARD_AUTH_BATCH_SIZE', 200)
+        # With no interval there is no background poster: a full batch is
+        # written by the request that fills it, the rest by flush()
+        self.flush_interval = flush_interval if flush_interval is not None else getattr(settings, 'CARD_AUTH_FLUSH_INTERVAL', 1)
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        # Escrow rows belong to an owner, so a forked worker cannot spend its parent's
+        self.owner = secrets.token_hex(16)
+        self.entries = OrderedDict()
+        self.queue = queue.Queue()
+        # Items taken off the queue whose write failed, retried first
+        self.unwritten = []
+        self.worker = None
+
+    def _check_fork(self):
+        if self.pid != os.getpid():
+            # Forked worker: the parent's escrow and queue are the parent's
+            self._reset()
+
+    def _drop(self, card_id):
+        entry = self.entries.pop(card_id, None)
+        if entry is not None and entry.remaining:
+            self.queue.put((card_id, entry.remaining, None))
+
+    def _entry(self, card_id):
+        """Return this process's unexpired escrow for ``card_id``, if any. Call with the lock held."""
+        entry = self.entries.get(card_id)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._drop(card_id)
+            return None
+        self.entries.move_to_end(card_id)
+        return entry
+
+    def _approve(self, card_id, entry, amount, description):
+        entry.remaining -= amount
+        code = secrets.token_hex(3).upper()
+        self.queue.put((card_id, amount, f'{description} (auth {code})'))
+        return Authorization(card_id, amount, True, entry.outside + entry.remaining, code=code)
+
+    def forget(self, card_id):
+        """Hand back this process's escrow for ``card_id``."""
+        with self.lock:
+            self._check_fork()
+            self._drop(card_id)
+
+    def authorize(self, card_id, amount, description, customer_id=None):
+        """
+        Approve or decline a purchase of ``amount`` on ``card_id``. Pass
+        ``customer_id`` to decline cards that belong to someone else.
+        Declines, failing closed, when escrow is needed and cannot be
+        granted.
+        """
+        amount = Decimal(amount)
+        if amount <= 0:
+            raise ValueError('Authorization amount must be positive.')
+        result = None
+        with self.lock:
+            self._check_fork()
+            entry = self._entry(card_id)
+            if entry is not None:
+                if customer_id is not None and entry.customer_id != customer_id:
+                    return Authorization(card_id, amount, False, None, reason='card_not_active')
+                if entry.remaining >= amount:
+                    result = self._approve(card_id, entry, amount, description)
+            remaining = entry.remaining if entry is not None else Decimal(0)
+        if result is not None:
+            return self._approved(result)
+
+        try:
+            granted = grant(card_id, self.owner, amount - remaining, self.escrow, self.ttl + ESCROW_GRACE, customer_id)
+        except DatabaseError:
+            logger.exception('Granting escrow of %s on card %s failed', amount, card_id)
+            metrics.incr('card_auth.unavailable')
+            return Authorization(card_id, amount, False, None, reason='unavailable')
+        if granted is None:
+            self.forget(card_id)
+            return Authorization(card_id, amount, False, None, reason='card_not_active')
+        card_customer_id, size, outside = granted
+
+        with self.lock:
+            entry = self._entry(card_id)
+            if entry is None:
+                entry = self.entries[card_id] = _Escrow(card_customer_id, outside, time.monotonic() + self.ttl)
+                while len(self.entries) > self.maxsize:
+                    self._drop(next(iter(self.entries)))
+            entry.remaining += size
+            entry.outside = outside
+            if entry.remaining < amount:
+                return Authorization(card_id, amount, False, outside + entry.remaining, reason='insufficient_credit')
+            result = self._approve(card_id, entry, amount, description)
+        return self._approved(result)
+
+    def _approved(self, result):
+        if self.flush_interval:
+            self._ensure_worker()
+        elif self.queue.qsize() >= self.batch_size:
+            self.flush()
+        return result
+
+    def _take(self, first=None):
+        items = self.unwritten + ([first] if first is not None else [])
+        self.unwritten = []
+        while len(items) < self.batch_size:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def flush(self, first=None):
+        """
+        Write every approval and release queued by this process, then post
+        every waiting hold, whichever process approved it. Returns the
+        number of holds posted.
+        """
+        with self.flush_lock:
+            while True:
+                items = self._take(first)
+                first = None
+                if not items:
+                    break
+                try:
+                    write_escrowed(self.owner, items)
+                except Exception:
+                    self.unwritten = items
+                    raise
+            total = 0
+            while True:
+                posted = post_holds(self.batch_size)
+                if not posted:
+                    break
+                total += posted
+            return total
+
+    def release(self):
+        """Hand back all of this process's escrow and write what is queued."""
+        with self.lock:
+            self._check_fork()
+            for card_id in list(self.entries):
+                self._drop(card_id)
+        return self.flush()
+
+    def _expire(self):
+        with self.lock:
+            now = time.monotonic()
+            for card_id in [card_id for card_id, entry in self.entries.items() if entry.expires_at <= now]:
+                self._drop(card_id)
+
+    def _ensure_worker(self):
+        if self.worker is not None and self.worker.is_alive():
+            return
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name='card-auth-poster', daemon=True)
+                self.worker.start()
+                atexit.register(self._quietly, self.release)
+
+    def _quietly(self, task, *args):
+        try:
+            task(*args)
+        except Exception:
+            logger.exception('Writing card authorizations failed; will retry')
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # Idle: hand back expired escrow, reclaim that of stopped
+                # workers, and let go of a stale connection
+                self._expire()
+                self._quietly(self.flush)
+                self._quietly(reclaim_escrows)
+                close_old_connections()
+                continue
+            self._quietly(self.flush, item)
+
+
+_authorizer = None
+
+
+def authorizer():
+    global _authorizer
+    if _authorizer is None:
+        _authorizer = Authorizer()
+    return _authorizer
+
+
+def authorize(card_id, amount, description, customer_id=None):
+    return authorizer().authorize(card_id, amount, description, customer_id)
+
+
+def flush():
+    return authorizer().flush()
+
+
+def forget(card_id):
+    if _authorizer is not None:
+        _authorizer.forget(card_id)
@@ -0,0 +1,118 @@
+import http.cookiejar
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, round(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[rank]
+
+
+class LoadResult:
+    def __init__(self, label, latencies, errors, elapsed):
+        self.label = label
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'label': self.label,
+            'requests': self.requests,
+            'errors': self.errors,
+            'rps': round(self.throughput, 1),
+            'p50_ms': round(percentile(self.latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(self.latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(self.latencies, 99) * 1000, 2),
+            'max_ms': round((self.latencies[-1] if self.latencies else 0) * 1000, 2),
+        }
+
+    def __str__(self):
+        row = self.as_dict()
+        return (f"{row['label']:<40} {row['requests']:>7} req {row['errors']:>5} err "
+                f"{row['rps']:>9} req/s  p50 {row['p50_ms']:>8}ms  p95 {row['p95_ms']:>8}ms  "
+                f"p99 {row['p99_ms']:>8}ms")
+
+
+def run_load(label, request, total, concurrency):
+    """
+    Call ``request(i)`` ``total`` times from ``concurrency`` threads and time
+    each call. ``request`` returns True on success.
+    """
+    def timed(index):
+        started = time.perf_counter()
+        try:
+            ok = request(index)
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, range(total)))
+    elapsed = time.perf_counter() - started
+    return LoadResult(label, [latency for latency, _ in outcomes], sum(1 for _, ok in outcomes if not ok), elapsed)
+
+
+class HttpSession:
+    """Minimal cookie-aware HTTP client for driving a running server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def _cookie(self, name):
+        return next((cookie.value for cookie in self.cookies if cookie.name == name), None)
+
+    def get(self, path):
+        try:
+            with self.opener.open(self.base_url + path, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            return exc.code
+
+    def post(self, path, data=None, json_body=None):
+        """POST form ``data`` or a JSON body, passing the CSRF token the way the app's forms do."""
+        headers = {'Referer': self.base_url + path, 'X-CSRFToken': self._cookie('csrftoken') or ''}
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        else:
+            body = urllib.parse.urlencode(data or {}).encode()
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, data=body, headers=headers), timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            return exc.code
+
+    def login(self, username, password, path='/'):
+        """Log in through the app's login form, including the CSRF handshake."""
+        self.get(path)
+        data = urllib.parse.urlencode({
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': self._cookie('csrftoken') or '',
+        }).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, headers={'Referer': self.base_url + path})
+        with self.opener.open(request, timeout=30) as response:
+            response.read()
+        if self._cookie('sessionid') is None:
+            raise ValueError(f'Login as {username} failed.')
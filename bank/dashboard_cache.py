@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from . import metrics
+from .models import Account, Customer, CreditCard, Investment, Loan, RetirementPlan
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _version_key(customer_id):
+    return f'dashboard:version:{customer_id}'
+
+
+def _bump(customer_id):
+    # A fresh, never-reused version orphans every cached context at once
+    _cache().set(_version_key(customer_id), time.time_ns(), timeout=None)
+
+
+def invalidate(customer_id):
+    """
+    Drop the cached dashboard of ``customer_id``. The version is bumped now
+    and again on commit, so a reader that re-caches data from before the
+    commit cannot leave a stale entry behind.
+    """
+    _bump(customer_id)
+    transaction.on_commit(lambda: _bump(customer_id))
+
+
+def invalidate_many(customer_ids):
+    for customer_id in set(customer_ids):
+        invalidate(customer_id)
+
+
+def _build(customer_id):
+    return {
+        'customer': Customer.objects.get(id=customer_id),
+        'accounts': list(Account.objects.filter(customer_id=customer_id)),
+        'loans': list(Loan.objects.filter(customer_id=customer_id)),
+        'credit_cards': list(CreditCard.objects.filter(customer_id=customer_id)),
+        'investments': list(Investment.objects.filter(customer_id=customer_id)),
+        'retirement_plans': list(RetirementPlan.objects.filter(customer_id=customer_id)),
+    }
+
+
+def get_dashboard_context(customer_id):
+    """Return the customer dashboard context, from the cache when it is current."""
+    cache = _cache()
+    version = cache.get(_version_key(customer_id))
+    if version is None:
+        version = time.time_ns()
+        cache.add(_version_key(customer_id), version, timeout=None)
+        version = cache.get(_version_key(customer_id), version)
+    key = f'dashboard:context:{customer_id}:{version}'
+    context = cache.get(key)
+    if context is not None:
+        metrics.incr('dashboard_cache.hit')
+        return context
+    metrics.incr('dashboard_cache.miss')
+    context = _build(customer_id)
+    cache.set(key, context, timeout=getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300))
+    return context
@@ -0,0 +1,114 @@
+import asyncio
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+# Applied to every SQLite connection; SQLITE_PRAGMAS in settings overrides
+# individual entries. WAL lets readers run alongside the single writer.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative sizes are in KiB
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+# Persistent or write-side settings a read-only connection must not change
+WRITE_PRAGMAS = ('journal_mode', 'synchronous')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def pragmas(read_only=False):
+    """``(name, value)`` pragmas for a new connection."""
+    merged = dict(DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if read_only:
+        merged = {name: value for name, value in merged.items() if name not in WRITE_PRAGMAS}
+        merged['query_only'] = 1
+    return list(merged.items())
+
+
+def is_read_only(connection):
+    return 'mode=ro' in str(connection.settings_dict['NAME'])
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """``connection_created`` receiver applying ``pragmas()`` to SQLite connections."""
+    if connection.vendor != 'sqlite' or getattr(connection, 'pool_reused', False):
+        # A connection reused from a pool keeps the pragmas it was set up with
+        return
+    # The raw connection, so the pragmas are not counted as the request's queries
+    for name, value in pragmas(is_read_only(connection)):
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def read_alias():
+    """The alias bulk reads such as exports should use."""
+    return REPLICA if replica_configured() else PRIMARY
+
+
+def reads_from_replica(view_func):
+    """
+    Route the view's reads to the replica. Reads inside a transaction still
+    go to the primary (see ``ReplicaRouter``), and writes always do.
+    """
+    if asyncio.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(*args, **kwargs):
+            token = _replica_reads.set(True)
+            try:
+                return await view_func(*args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    else:
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            token = _replica_reads.set(True)
+            try:
+                return view_func(*args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    return wrapper
+
+
+def pin_reads(queryset):
+    """
+    Bind ``queryset`` to the alias its reads are routed to now. A queryset
+    evaluated after the view returns, such as a streamed response's, is no
+    longer under ``reads_from_replica`` and would be read from the primary.
+    """
+    return queryset.using(queryset.db)
+
+
+class ReplicaRouter:
+    """
+    Send reads made under ``reads_from_replica`` to the ``replica`` alias and
+    everything else to the primary. A read made while the primary is in a
+    transaction stays on the primary so it sees that transaction's writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or not replica_configured():
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
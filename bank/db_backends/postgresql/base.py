@@ -0,0 +1,7 @@
+from django.db.backends.postgresql import base
+
+from bank.pooling import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """PostgreSQL backend drawing its connections from a ``bank.pooling`` pool."""
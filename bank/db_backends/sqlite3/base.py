@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from bank.pooling import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """SQLite backend drawing its connections from a ``bank.pooling`` pool."""
@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+
+from . import dashboard_cache
+from .models import CreditCard, Loan
+
+# Decision verb -> status it moves a pending application to
+LOAN_DECISIONS = {'approve': 'approved', 'reject': 'rejected'}
+CARD_DECISIONS = {'approve': 'active', 'reject': 'rejected'}
+
+QUEUE_ORDERING = ('id',)
+
+
+class DecisionResult:
+    def __init__(self):
+        self.changed = {}
+        self.skipped = []
+        self.invalid = []
+
+    def as_dict(self):
+        return {
+            'changed': self.changed,
+            'updated': sum(len(ids) for ids in self.changed.values()),
+            'skipped': self.skipped,
+            'invalid': self.invalid,
+        }
+
+
+def queue(model, status='pending'):
+    """Applications of ``model`` in ``status``, for keyset pagination by id."""
+    return model.objects.filter(status=status).select_related('customer')
+
+
+def parse_decisions(items, verbs):
+    """
+    Split ``[{'id': ..., 'action': ...}, ...]`` into ``{id: status}`` and a
+    list of the entries that could not be understood. When an id appears
+    more than once the last decision wins.
+    """
+    decisions, invalid = {}, []
+    for item in items:
+        try:
+            decisions[int(item['id'])] = verbs[item['action']]
+        except (KeyError, TypeError, ValueError):
+            invalid.append(item)
+    return decisions, invalid
+
+
+def _apply_batch(model, batch, result):
+    # A failed batch is never retried piecemeal, so no savepoint is needed
+    with transaction.atomic(savepoint=False):
+        # Locking the rows first makes the report exact: the UPDATE below
+        # can then change precisely the rows that were read as pending.
+        pending = dict(
+            model.objects.select_for_update()
+            .filter(id__in=batch, status='pending')
+            .values_list('id', 'customer_id')
+        )
+        by_status = {}
+        for pk in pending:
+            by_status.setdefault(batch[pk], []).append(pk)
+        if pending:
+            model.objects.filter(id__in=pending, status='pending').update(status=Case(
+                *[When(id__in=ids, then=Value(status)) for status, ids in by_status.items()],
+                output_field=CharField(),
+            ))
+            # update() sends no signals, so drop the dashboards ourselves
+            dashboard_cache.invalidate_many(pending.values())
+    for pk in batch:
+        if pk in pending:
+            result.changed.setdefault(batch[pk], []).append(pk)
+        else:
+            result.skipped.append(pk)
+
+
+def apply_decisions(model, decisions, batch_size=500):
+    """
+    Move pending applications of ``model`` to the statuses in ``decisions``
+    (``{id: new_status}``) with one conditional UPDATE per batch. Rows that
+    are missing or no longer pending are left alone and reported as skipped.
+    """
+    result = DecisionResult()
+    ids = sorted(decisions)
+    for start in range(0, len(ids), batch_size):
+        batch = {pk: decisions[pk] for pk in ids[start:start + batch_size]}
+        _apply_batch(model, batch, result)
+    return result
+
+
+def decide_loans(items, batch_size=500):
+    decisions, invalid = parse_decisions(items, LOAN_DECISIONS)
+    result = apply_decisions(Loan, decisions, batch_size)
+    result.invalid = invalid
+    return result
+
+
+def decide_credit_cards(items, batch_size=500):
+    decisions, invalid = parse_decisions(items, CARD_DECISIONS)
+    result = apply_decisions(CreditCard, decisions, batch_size)
+    result.invalid = invalid
+    return result
@@ -30,12 +30,27 @@ class CustomerForm(forms.ModelForm):
         widget=forms.DateInput(attrs={'type': 'date'}),  # Use 'date' input type for date selection
         label='Date of Birth'
     )
-        
+
+# Validates one row of a bulk import. Email uniqueness is checked once per
+# chunk by the importer instead of once per row.
+class CustomerImportForm(CustomerForm):
+    class Meta(CustomerForm.Meta):
+        fields = ['name', 'email', 'dob', 'address', 'phone_number']
+
+    def validate_unique(self):
+        pass
+
 class AccountForm(forms.ModelForm):
     class Meta:
         model = Account
         fields = ['account_type', 'balance']
 
+    def clean_balance(self):
+        balance = self.cleaned_data['balance']
+        if balance < 0:
+            raise forms.ValidationError('The opening balance cannot be negative.')
+        return balance
+
 class LoanForm(forms.ModelForm):
     class Meta:
         model = Loan
@@ -0,0 +1,129 @@
+import base64
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, BasePasswordHasher, PBKDF2PasswordHasher, mask_hash
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_noop as _
+
+from . import metrics
+
+_timing = threading.local()
+
+
+class TimedHasherMixin:
+    """
+    Count each encode and verify per algorithm, with the total time spent
+    in microseconds, so the cost of a work factor shows up in the metrics.
+    """
+
+    def _timed(self, operation, method, *args):
+        # verify() usually calls encode(); only the outer call is counted
+        if getattr(_timing, 'active', False):
+            return method(*args)
+        _timing.active = True
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            _timing.active = False
+            metrics.incr(f'password_hash.{self.algorithm}.{operation}')
+            metrics.incr(f'password_hash.{self.algorithm}.us', int((time.perf_counter() - started) * 1e6))
+
+    def encode(self, password, salt, *args):
+        return self._timed('encode', super().encode, password, salt, *args)
+
+    def verify(self, password, encoded):
+        return self._timed('verify', super().verify, password, encoded)
+
+
+class ScryptPasswordHasher(BasePasswordHasher):
+    """
+    scrypt from the standard library, for installs without argon2-cffi.
+    The work factor is read from ``PASSWORD_SCRYPT_WORK_FACTOR``; hashes
+    made with another one are updated at the next login.
+    """
+    algorithm = 'scrypt'
+    block_size = 8
+    parallelism = 1
+    # 128 * n * r bytes are needed; leave room above OpenSSL's 32MB default
+    maxmem = 64 * 1024 * 1024
+
+    @property
+    def work_factor(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14)
+
+    def encode(self, password, salt, work_factor=None, block_size=None, parallelism=None):
+        assert password is not None
+        assert salt and '$' not in salt
+        work_factor = work_factor or self.work_factor
+        block_size = block_size or self.block_size
+        parallelism = parallelism or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=work_factor, r=block_size, p=parallelism,
+            maxmem=self.maxmem, dklen=64)
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, work_factor, salt, block_size, parallelism, hash_)
+
+    def decode(self, encoded):
+        algorithm, work_factor, salt, block_size, parallelism, hash_ = encoded.split('$', 5)
+        assert algorithm == self.algorithm
+        return {
+            'algorithm': algorithm,
+            'work_factor': int(work_factor),
+            'salt': salt,
+            'block_size': int(block_size),
+            'parallelism': int(parallelism),
+            'hash': hash_,
+        }
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        encoded_2 = self.encode(password, decoded['salt'], decoded['work_factor'], decoded['block_size'], decoded['parallelism'])
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            _('algorithm'): decoded['algorithm'],
+            _('work factor'): decoded['work_factor'],
+            _('block size'): decoded['block_size'],
+            _('parallelism'): decoded['parallelism'],
+            _('salt'): mask_hash(decoded['salt']),
+            _('hash'): mask_hash(decoded['hash']),
+        }
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return (decoded['work_factor'], decoded['block_size'], decoded['parallelism']) != (
+            self.work_factor, self.block_size, self.parallelism)
+
+    def harden_runtime(self, password, encoded):
+        # The runtime of scrypt cannot be topped up like an iteration count
+        pass
+
+
+class TimedScryptPasswordHasher(TimedHasherMixin, ScryptPasswordHasher):
+    pass
+
+
+class TimedArgon2PasswordHasher(TimedHasherMixin, Argon2PasswordHasher):
+    """Argon2 with its costs read from settings; needs argon2-cffi."""
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
+
+class TimedPBKDF2PasswordHasher(TimedHasherMixin, PBKDF2PasswordHasher):
+    """Django's default hasher, still needed to check passwords set before the switch."""
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.utils.functional import SimpleLazyObject
+
+from . import metrics, throttle
+from .models import User
+
+
+class Identity:
+    """Who is making a request: the user, their role and their Customer id, if any."""
+
+    def __init__(self, user=None, customer_id=None):
+        self.user = user
+        self.user_id = user.pk if user is not None else None
+        self.role = user.role if user is not None else None
+        self.customer_id = customer_id
+
+    @property
+    def is_authenticated(self):
+        return self.user_id is not None
+
+
+ANONYMOUS = Identity()
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _key(user_id):
+    return f'identity:{user_id}'
+
+
+def load(user_id):
+    """
+    Return the ``Identity`` of ``user_id``, or None if there is no such user.
+    A miss loads the user and their Customer id in one query.
+    """
+    cache = _cache()
+    key = _key(user_id)
+    identity = cache.get(key)
+    if identity is not None:
+        metrics.incr('identity_cache.hit')
+        return identity
+    metrics.incr('identity_cache.miss')
+    user = User.objects.annotate(linked_customer_id=F('customer__id')).filter(pk=user_id).first()
+    if user is None:
+        return None
+    customer_id = user.linked_customer_id
+    del user.linked_customer_id
+    identity = Identity(user, customer_id)
+    cache.set(key, identity, timeout=getattr(settings, 'IDENTITY_CACHE_TIMEOUT', 300))
+    return identity
+
+
+def invalidate(user_id):
+    """Drop the cached identity of ``user_id`` now and again on commit, like ``dashboard_cache.invalidate``."""
+    _cache().delete(_key(user_id))
+    transaction.on_commit(lambda: _cache().delete(_key(user_id)))
+
+
+def identity_for(user):
+    if not user.is_authenticated:
+        return ANONYMOUS
+    # Set by CachedModelBackend, which has just loaded it
+    identity = getattr(user, 'identity', None)
+    return identity if identity is not None else load(user.pk) or ANONYMOUS
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ``ModelBackend`` that loads the session's user from the identity cache
+    and refuses throttled logins before checking the password.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if throttle.is_throttled(username, throttle.client_ip(request)):
+            metrics.incr('login.throttled')
+            if request is not None:
+                request.login_throttled = True
+            return None
+        return super().authenticate(request, username, password, **kwargs)
+
+    def get_user(self, user_id):
+        identity = load(user_id)
+        if identity is None or not self.user_can_authenticate(identity.user):
+            return None
+        user = identity.user
+        user.identity = identity
+        return user
+
+
+class IdentityMiddleware:
+    """Set ``request.identity``, loaded the first time a view reads it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.identity = SimpleLazyObject(lambda: identity_for(request.user))
+        return self.get_response(request)
@@ -0,0 +1,277 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from . import dashboard_cache, metrics
+from .models import Customer
+
+logger = logging.getLogger('bank.images')
+
+# Profile pictures are stored once per distinct content, as
+# profile_pictures/<sha256><ext>, however many customers upload them.
+# Square thumbnails of every size in THUMBNAIL_SIZES are made from each in
+# a background worker pool and stored as WebP and JPEG under
+# thumbnails/<sha256>-<size>.<format>. Their names change whenever the
+# content does, so the thumbnail view serves them with a year-long
+# immutable Cache-Control.
+
+UPLOAD_DIR = 'profile_pictures'
+THUMBNAIL_DIR = 'thumbnails'
+# Format -> (extension, Pillow save options)
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+CONTENT_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+THUMBNAIL_NAME = re.compile(r'^(?P<digest>[0-9a-f]{64})-(?P<size>\d+)\.(?P<ext>webp|jpg)$')
+DIGEST_NAME = re.compile(r'^' + UPLOAD_DIR + r'/(?P<digest>[0-9a-f]{64})\.\w+$')
+
+_executor = None
+_executor_pid = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def sizes():
+    return tuple(getattr(settings, 'THUMBNAIL_SIZES', (64, 150, 300)))
+
+
+def content_digest(file):
+    """sha256 of ``file``'s content, leaving it rewound."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(1 << 16), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def digest_of(name):
+    """The content digest in a stored picture's name, or None for older, unhashed names."""
+    match = DIGEST_NAME.match(name or '')
+    return match.group('digest') if match else None
+
+
+def save_once(storage, name, content):
+    """
+    Store ``content`` as ``name`` unless it already exists, returning
+    ``name``. Storage gives a concurrent writer of the same name a
+    suffixed one instead; content-addressed files are equal, so that copy
+    is deleted rather than left behind.
+    """
+    if storage.exists(name):
+        return name
+    saved = storage.save(name, content)
+    if saved != name:
+        storage.delete(saved)
+        metrics.incr('images.duplicate_writes')
+    return name
+
+
+def store_upload(field_file):
+    """
+    Save a new upload under its content digest before the model is saved.
+    When the same content is already stored, the field points at that file
+    and nothing is written.
+    """
+    if not field_file or getattr(field_file, '_committed', True):
+        return
+    upload = field_file.file
+    digest = content_digest(upload)
+    extension = os.path.splitext(upload.name or '')[1].lower() or '.jpg'
+    name = f'{UPLOAD_DIR}/{digest}{extension}'
+    if field_file.storage.exists(name):
+        metrics.incr('profile_pictures.deduplicated')
+    else:
+        save_once(field_file.storage, name, upload)
+    field_file.name = name
+    # FileField.pre_save saves uncommitted files; this one is stored already
+    field_file._committed = True
+
+
+def thumbnail_name(digest, size, ext):
+    return f'{THUMBNAIL_DIR}/{digest}-{size}.{ext}'
+
+
+def _ready_key(digest):
+    return f'thumbnails:{digest}:{",".join(map(str, sizes()))}'
+
+
+def thumbnails_ready(digest):
+    """Whether every thumbnail of ``digest`` is stored; remembered once true."""
+    cache = _cache()
+    if cache.get(_ready_key(digest)):
+        return True
+    ready = all(
+        default_storage.exists(thumbnail_name(digest, size, ext))
+        for size in sizes() for ext, _ in FORMATS.values()
+    )
+    if ready:
+        cache.set(_ready_key(digest), True, timeout=None)
+    return ready
+
+
+def make_thumbnails(name):
+    """Write the missing thumbnails of the stored picture ``name``; returns how many."""
+    digest = digest_of(name)
+    if digest is None:
+        raise ValueError(f'{name} is not stored under its content digest.')
+    missing = [
+        (size, ext, options) for size in sizes() for ext, options in FORMATS.values()
+        if not default_storage.exists(thumbnail_name(digest, size, ext))
+    ]
+    if missing:
+        with default_storage.open(name, 'rb') as original:
+            image = Image.open(original)
+            # Let the JPEG decoder downscale while reading
+            image.draft('RGB', (max(sizes()) * 2, max(sizes()) * 2))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+        for size, ext, options in missing:
+            thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            out = io.BytesIO()
+            thumbnail.save(out, **options)
+            save_once(default_storage, thumbnail_name(digest, size, ext), ContentFile(out.getvalue()))
+        metrics.incr('thumbnails.created', len(missing))
+    _cache().set(_ready_key(digest), True, timeout=None)
+    return len(missing)
+
+
+def _run(name):
+    try:
+        make_thumbnails(name)
+    except Exception:
+        metrics.incr('thumbnails.failed')
+        logger.exception('Making thumbnails of %s failed', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+
+
+def _pool():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2), thread_name_prefix='thumbnails')
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def schedule(name):
+    """
+    Make the thumbnails of ``name`` on the worker pool, or inline when
+    ``THUMBNAIL_WORKERS`` is 0. A picture already queued is not queued again.
+    """
+    if digest_of(name) is None or thumbnails_ready(digest_of(name)):
+        return
+    if not getattr(settings, 'THUMBNAIL_WORKERS', 2):
+        _run(name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+        _pool().submit(_run, name)
+
+
+def may_view(identity, digest):
+    """Whether ``identity`` may see the thumbnails of ``digest``: its owner's, or any for staff."""
+    if identity.role is None:
+        return False
+    if identity.role != 'customer':
+        return True
+    return identity.customer_id is not None and Customer.objects.filter(
+        id=identity.customer_id, profile_picture__startswith=f'{UPLOAD_DIR}/{digest}.',
+    ).exists()
+
+
+def thumbnail_urls(name, size):
+    """
+    ``{'webp': url, 'jpg': url, 'webp_2x': url}`` for a picture shown at
+    ``size`` pixels, or None until its thumbnails are made.
+    """
+    digest = digest_of(name)
+    if digest is None or size not in sizes() or not thumbnails_ready(digest):
+        return None
+    urls = {ext: reverse('thumbnail', args=[f'{digest}-{size}.{ext}']) for ext, _ in FORMATS.values()}
+    if size * 2 in sizes():
+        urls['webp_2x'] = reverse('thumbnail', args=[f'{digest}-{size * 2}.webp'])
+    return urls
+
+
+def store_existing(name):
+    """Copy an older, unhashed upload to its content-addressed name; None if it is missing."""
+    try:
+        original = default_storage.open(name, 'rb')
+    except FileNotFoundError:
+        return None
+    with original:
+        digest = content_digest(original)
+        stored = f'{UPLOAD_DIR}/{digest}{os.path.splitext(name)[1].lower() or ".jpg"}'
+        save_once(default_storage, stored, original)
+    return stored
+
+
+def _thumbnails_or_failure(name):
+    try:
+        return make_thumbnails(name), False
+    except Exception:
+        logger.exception('Making thumbnails of %s failed', name)
+        return 0, True
+
+
+def backfill(chunk_size=1000, workers=2):
+    """
+    Move every customer's picture to its content-addressed name and make
+    any missing thumbnails, ``workers`` pictures at a time. Pictures are
+    read ``chunk_size`` customers at a time. Older files are left in place.
+    Returns counts of what was done.
+    """
+    stats = Counter()
+    names = set()
+    stored = {}
+    after = 0
+    while True:
+        rows = list(
+            Customer.objects.filter(id__gt=after).exclude(profile_picture='')
+            .order_by('id').values_list('id', 'profile_picture')[:chunk_size]
+        )
+        if not rows:
+            break
+        after = rows[-1][0]
+        moved = defaultdict(list)
+        for customer_id, name in rows:
+            if digest_of(name) is None:
+                if name not in stored:
+                    stored[name] = store_existing(name)
+                if stored[name] is None:
+                    stats['missing'] += 1
+                    continue
+                moved[stored[name]].append(customer_id)
+                name = stored[name]
+            names.add(name)
+        for name, customer_ids in moved.items():
+            Customer.objects.filter(id__in=customer_ids).update(profile_picture=name)
+            stats['moved'] += len(customer_ids)
+            # update() sends no signals
+            dashboard_cache.invalidate_many(customer_ids)
+    stats['pictures'] = len(names)
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='thumbnails') as executor:
+        for created, failed in executor.map(_thumbnails_or_failure, sorted(names)):
+            stats['thumbnails'] += created
+            stats['failed'] += failed
+    return stats
@@ -0,0 +1,207 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.utils import timezone
+
+from .models import BalanceSnapshot, JournalEntry, JournalLeg, LedgerBalance
+
+# General ledger books that balance the customer-facing legs
+CASH_BOOK = 'gl:cash'
+CARD_SETTLEMENT_BOOK = 'gl:card_settlement'
+GL_PREFIX = 'gl:'
+
+# Entries with more legs than this update their running balances in one
+# statement instead of one per book
+BATCH_BUMP_THRESHOLD = 8
+
+
+class UnbalancedEntry(ValueError):
+    """Raised when the legs of a journal entry do not sum to zero."""
+
+
+def account_book(account_id):
+    return f'account:{account_id}'
+
+
+def card_book(credit_card_id):
+    return f'card:{credit_card_id}'
+
+
+def gl_shards():
+    return getattr(settings, 'LEDGER_GL_SHARDS', 16)
+
+
+def late_leg_window():
+    return getattr(settings, 'LEDGER_LATE_LEG_WINDOW', 600)
+
+
+def _balance_row(book):
+    """
+    The ``LedgerBalance`` row a leg of ``book`` is added to. Every posting
+    has a general ledger leg, so each GL book keeps its running total in
+    ``gl_shards()`` rows picked at random, and concurrent postings rarely
+    wait on the same row. ``balance`` adds them back up.
+    """
+    if not book.startswith(GL_PREFIX) or gl_shards() <= 1:
+        return book
+    return f'{book}#{random.randrange(gl_shards())}'
+
+
+def _bump_balance(book, delta):
+    """Add ``delta`` to the running balance of ``book``, creating it if needed."""
+    if LedgerBalance.objects.filter(book=book).update(balance=F('balance') + delta):
+        return
+    try:
+        with transaction.atomic():
+            LedgerBalance.objects.create(book=book, balance=delta)
+    except IntegrityError:
+        # Another worker created the row first
+        LedgerBalance.objects.filter(book=book).update(balance=F('balance') + delta)
+
+
+def _bump_balances(legs):
+    """
+    Apply many ``{book: delta}`` legs with one locking read and one UPDATE.
+    Rows are locked in book order, the same order ``_bump_balance`` uses,
+    so batched and single postings cannot deadlock each other.
+    """
+    existing = set(
+        LedgerBalance.objects.select_for_update().filter(book__in=list(legs)).order_by('book').values_list('book', flat=True)
+    )
+    if existing:
+        LedgerBalance.objects.filter(book__in=existing).update(balance=F('balance') + Case(
+            *[When(book=book, then=Value(legs[book])) for book in sorted(existing)],
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ))
+    for book in sorted(set(legs) - existing):
+        _bump_balance(book, legs[book])
+
+
+def record_entry(description, legs):
+    """
+    Write a journal entry with one leg per ``{book: amount}`` item and apply
+    the legs to the running balances, all in one database transaction.
+    Zero legs are dropped. Raises ``UnbalancedEntry`` if the amounts do not
+    sum to zero.
+    """
+    legs = {book: Decimal(amount) for book, amount in legs.items() if amount}
+    if sum(legs.values(), Decimal(0)) != 0:
+        raise UnbalancedEntry(f'Journal entry does not balance: {legs}')
+
+    with transaction.atomic():
+        entry = JournalEntry.objects.create(description=description)
+        JournalLeg.objects.bulk_create(
+            JournalLeg(entry=entry, book=book, amount=amount) for book, amount in legs.items()
+        )
+        rows = {_balance_row(book): amount for book, amount in legs.items()}
+        if len(rows) > BATCH_BUMP_THRESHOLD:
+            _bump_balances(rows)
+        else:
+            for row in sorted(rows):
+                _bump_balance(row, rows[row])
+    return entry
+
+
+def balance(book):
+    """Return the current balance of ``book`` from its running total."""
+    if book.startswith(GL_PREFIX):
+        # Also counts the unsharded row and shards beyond the current count
+        rows = LedgerBalance.objects.filter(Q(book=book) | Q(book__startswith=f'{book}#'))
+        return rows.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')
+    value = LedgerBalance.objects.filter(book=book).values_list('balance', flat=True).first()
+    return value if value is not None else Decimal('0.00')
+
+
+def book_of(row):
+    """The book whose running total the ``LedgerBalance`` row ``row`` holds part of."""
+    return row.partition('#')[0]
+
+
+def rebuild_balance(book):
+    """
+    Recompute the balance of ``book`` from its latest snapshot plus the legs
+    posted after it, without scanning the book's full history.
+    """
+    snapshot = BalanceSnapshot.objects.filter(book=book).order_by('-last_leg_id').first()
+    legs = JournalLeg.objects.filter(book=book)
+    opening = Decimal('0.00')
+    if snapshot is not None:
+        legs = legs.filter(id__gt=snapshot.last_leg_id)
+        opening = snapshot.balance
+    return opening + (legs.aggregate(total=Sum('amount'))['total'] or 0)
+
+
+def reconcile(book):
+    """Return ``(running, rebuilt)`` balances of ``book``; they should match."""
+    return balance(book), rebuild_balance(book)
+
+
+def _settled_watermark(previous, watermark):
+    """
+    The highest leg id up to ``watermark`` below which no id above
+    ``previous`` is still missing. Ids are handed out at insert, so a missing
+    id may belong to an entry that has not committed yet; a snapshot past it
+    would leave that leg out of both the snapshot and ``rebuild_balance``.
+    Ids missing for longer than ``late_leg_window()`` are taken for rolled
+    back entries.
+    """
+    legs = JournalLeg.objects.filter(id__gt=previous, id__lte=watermark)
+    if legs.count() == watermark - previous:
+        return watermark
+    cutoff = timezone.now() - timedelta(seconds=late_leg_window())
+    after = previous
+    for leg_id, created_at in legs.order_by('id').values_list('id', 'entry__created_at').iterator():
+        if leg_id > after + 1 and created_at > cutoff:
+            return after
+        after = leg_id
+    return watermark
+
+
+def take_snapshots(batch_size=1000):
+    """
+    Checkpoint every book that has legs since the previous snapshot round.
+
+    All books in a round share the same ``last_leg_id`` watermark, so the
+    delta since the previous round is one grouped query over the new legs
+    only. The watermark stops short of recently missing ids, whose legs
+    may still commit. Returns the number of snapshots written.
+    """
+    with transaction.atomic():
+        watermark = JournalLeg.objects.aggregate(last=Max('id'))['last']
+        if watermark is None:
+            return 0
+        previous = BalanceSnapshot.objects.aggregate(last=Max('last_leg_id'))['last'] or 0
+        if watermark <= previous:
+            return 0
+        watermark = _settled_watermark(previous, watermark)
+        if watermark <= previous:
+            return 0
+
+        deltas = dict(
+            JournalLeg.objects.filter(id__gt=previous, id__lte=watermark)
+            .values('book')
+            .annotate(total=Sum('amount'))
+            .values_list('book', 'total')
+        )
+        opening = {}
+        books = list(deltas)
+        latest_leg = BalanceSnapshot.objects.filter(book=OuterRef('book')).order_by('-last_leg_id').values('last_leg_id')[:1]
+        for start in range(0, len(books), batch_size):
+            chunk = books[start:start + batch_size]
+            opening.update(
+                BalanceSnapshot.objects.filter(book__in=chunk, last_leg_id=Subquery(latest_leg))
+                .values_list('book', 'balance')
+            )
+
+        BalanceSnapshot.objects.bulk_create(
+            (
+                BalanceSnapshot(book=book, balance=opening.get(book, Decimal('0.00')) + total, last_leg_id=watermark)
+                for book, total in deltas.items()
+            ),
+            batch_size=batch_size,
+        )
+    return len(deltas)
@@ -0,0 +1,298 @@
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import reset_queries
+from django.db.models import Max
+from django.test import Client
+from django.urls import URLPattern, get_resolver, reverse
+
+from .benchmark import HttpSession, LoadResult
+from .models import Account, CreditCard, Customer, Loan, User
+
+
+class Step:
+    """One kind of request a role makes, with its share of that role's traffic."""
+
+    def __init__(self, name, weight=1, method='get', build=None, write=False):
+        self.name = name
+        self.weight = weight
+        self.method = method
+        # build(session, rng) -> (url args, form data or JSON payload)
+        self.build = build or (lambda session, rng: ((), None))
+        self.write = write
+        self.json = False
+
+    @property
+    def label(self):
+        return f'{self.method.upper()} {self.name}'
+
+
+def json_step(*args, **kwargs):
+    step = Step(*args, **kwargs)
+    step.json = True
+    return step
+
+
+def _deposit(session, rng):
+    return (), {'account': session.own['account_id'], 'transaction_type': 'deposit',
+                'amount': f'{rng.randint(1, 500)}.00', 'description': 'Load test deposit'}
+
+
+def _card_purchase(session, rng):
+    return (), {'card_id': session.own['card_id'], 'amount': f'{rng.randint(1, 200)}.{rng.randint(0, 99):02d}',
+                'description': 'Load test purchase'}
+
+
+def _loan_application(session, rng):
+    return (), {'loan_type': 'personal', 'amount': rng.randint(1000, 20000), 'interest_rate': '9.5', 'term_months': 36}
+
+
+def _teller_search(session, rng):
+    return (), {'q': rng.choice(session.sample['names'])}
+
+
+def _customer_arg(session, rng):
+    return (rng.choice(session.sample['customer_ids']),), None
+
+
+def _user_arg(session, rng):
+    return (rng.choice(session.sample['user_ids']),), None
+
+
+def _decision(ids_key):
+    def build(session, rng):
+        return (), {'decisions': [{'id': rng.choice(session.sample[ids_key] or [0]), 'action': rng.choice(('approve', 'reject'))}]}
+    return build
+
+
+def _import_file(session, rng):
+    email = f'loadtest-{time.time_ns()}-{rng.randrange(10 ** 6)}@example.com'
+    row = f'name,email,dob\nLoad Test,{email},1990-01-01\n'
+    return (), {'file': SimpleUploadedFile('customers.csv', row.encode())}
+
+
+# Each role's request mix, covering every URL in bank/urls.py
+WORKLOAD = {
+    'customer': [
+        Step('dashboard', 3),
+        Step('customer_dashboard', 20),
+        Step('async_customer_dashboard', 8),
+        Step('transaction_list', 15),
+        Step('async_transaction_list', 5),
+        Step('transaction_api', 10),
+        Step('async_transaction_api', 4),
+        Step('transaction_export', 1),
+        Step('create_transaction', 2),
+        Step('create_transaction', 5, 'post', _deposit, write=True),
+        json_step('authorize_card_purchase', 5, 'post', _card_purchase, write=True),
+        Step('apply_loan', 1),
+        Step('apply_loan', 1, 'post', _loan_application, write=True),
+        Step('apply_credit_card', 1),
+        Step('apply_investment', 1),
+        Step('apply_retirement_plan', 1),
+    ],
+    'teller': [
+        Step('teller_dashboard', 10),
+        Step('teller_dashboard', 10, build=_teller_search),
+        Step('async_teller_dashboard', 5),
+        Step('create_customer', 1),
+        Step('edit_customer', 2, build=_customer_arg),
+        Step('create_account', 1, build=_user_arg),
+        Step('import_customers', 1, 'post', _import_file, write=True),
+    ],
+    'loan_officer': [
+        Step('loan_officer_dashboard', 10),
+        Step('async_loan_officer_dashboard', 5),
+        Step('loan_decisions', 5),
+        json_step('loan_decisions', 2, 'post', _decision('pending_loan_ids'), write=True),
+    ],
+    'credit_card_manager': [
+        Step('credit_card_manager_dashboard', 10),
+        Step('async_credit_card_manager_dashboard', 5),
+        Step('credit_card_decisions', 5),
+        json_step('credit_card_decisions', 2, 'post', _decision('pending_card_ids'), write=True),
+    ],
+    'financial_advisor': [
+        Step('financial_advisor_dashboard', 10),
+        Step('async_financial_advisor_dashboard', 5),
+        Step('retirement_projection', 5, build=_customer_arg),
+    ],
+    'admin': [
+        Step('admin_dashboard', 5),
+        Step('add_user', 1),
+        Step('edit_user', 1, build=_user_arg),
+        Step('metrics', 2),
+    ],
+}
+# Share of sessions, and so of traffic, per role
+ROLE_MIX = {'customer': 70, 'teller': 10, 'loan_officer': 5, 'credit_card_manager': 5, 'financial_advisor': 5, 'admin': 5}
+# URLs deliberately left out of the replay
+EXCLUDED = {
+    'login': 'every session logs in before the replay',
+    'logout': 'would end the session mid-replay',
+    'delete_customer': 'deletes on GET',
+    'delete_user': 'deletes on GET',
+    'thumbnail': 'seeded customers have no profile pictures',
+}
+
+
+def url_names():
+    return {pattern.name for pattern in get_resolver().url_patterns if isinstance(pattern, URLPattern) and pattern.name}
+
+
+def uncovered():
+    """Named URLs neither replayed nor excluded; new views should be added to ``WORKLOAD``."""
+    covered = {step.name for steps in WORKLOAD.values() for step in steps}
+    return url_names() - covered - set(EXCLUDED)
+
+
+def _sample_ids(model, rng, count, **filters):
+    """Up to ``count`` ids drawn at random without scanning the table."""
+    top = model.objects.aggregate(top=Max('id'))['top'] or 0
+    candidates = [rng.randint(1, top) for _ in range(count * 4)] if top else []
+    ids = list(model.objects.filter(id__in=candidates, **filters).values_list('id', flat=True))
+    return ids[:count]
+
+
+def sample(rng, customers=20):
+    """Ids the replay draws from, plus the customers whose sessions are replayed."""
+    customer_ids = _sample_ids(Customer, rng, customers * 5)
+    rows = list(Customer.objects.filter(id__in=customer_ids).values_list('id', 'user_id', 'user__username', 'name'))
+    accounts = dict(Account.objects.filter(customer_id__in=customer_ids).order_by('-id').values_list('customer_id', 'id'))
+    cards = dict(CreditCard.objects.filter(customer_id__in=customer_ids, status='active').order_by('-id').values_list('customer_id', 'id'))
+    return {
+        'customer_ids': [row[0] for row in rows] or [0],
+        'user_ids': [row[1] for row in rows] or [0],
+        'names': [row[3].split()[0] for row in rows] or ['a'],
+        'customers': [
+            (username, {'account_id': accounts[customer_id], 'card_id': cards.get(customer_id, 0)})
+            for customer_id, _, username, _ in rows if customer_id in accounts
+        ][:customers],
+        'pending_loan_ids': _sample_ids(Loan, rng, 50, status='pending'),
+        'pending_card_ids': _sample_ids(CreditCard, rng, 50, status='pending'),
+    }
+
+
+class ClientDriver:
+    """Drives the app in-process through Django's test client, one request at a time."""
+
+    def __init__(self):
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        self.client = Client(HTTP_HOST=host)
+
+    def login(self, username, password):
+        self.client.force_login(User.objects.get(username=username))
+
+    def request(self, method, path, data, json):
+        if method == 'get':
+            response = self.client.get(path, data)
+        elif json:
+            response = self.client.post(path, data, content_type='application/json')
+        else:
+            response = self.client.post(path, data)
+        # DEBUG keeps every query in memory otherwise
+        reset_queries()
+        return response.status_code
+
+
+class HttpDriver:
+    """Drives a running server over HTTP; safe to share between threads."""
+
+    def __init__(self, base_url):
+        self.session = HttpSession(base_url)
+
+    def login(self, username, password):
+        self.session.login(username, password)
+
+    def request(self, method, path, data, json):
+        if method == 'get':
+            return self.session.get(path + ('?' + urlencode(data) if data else ''))
+        if json:
+            return self.session.post(path, json_body=data)
+        if any(hasattr(value, 'read') for value in data.values()):
+            # Multipart uploads are only replayed in-process
+            return 200
+        return self.session.post(path, data)
+
+
+class Session:
+    def __init__(self, role, username, driver, sample, own=None):
+        self.role = role
+        self.username = username
+        self.driver = driver
+        self.sample = sample
+        self.own = own or {}
+
+
+def open_sessions(make_driver, password, rng, customers=20, seed_prefix='seed0'):
+    """Log in one session per sampled customer and per staff role."""
+    ids = sample(rng, customers)
+    sessions = []
+    for role in WORKLOAD:
+        if role == 'customer':
+            users = ids['customers']
+        else:
+            username = f'{seed_prefix}_{role}'
+            if not User.objects.filter(username=username).exists():
+                username = User.objects.filter(role=role).order_by('id').values_list('username', flat=True).first()
+            users = [(username, {})] if username else []
+        for username, own in users:
+            driver = make_driver()
+            driver.login(username, password)
+            sessions.append(Session(role, username, driver, ids, own))
+    return sessions
+
+
+def plan(sessions, total, rng, read_only=False):
+    """``total`` ``(session, step)`` pairs, mixed by ``ROLE_MIX`` and step weights."""
+    by_role = defaultdict(list)
+    for session in sessions:
+        by_role[session.role].append(session)
+    roles = [role for role in ROLE_MIX if by_role[role]]
+    steps = {role: [step for step in WORKLOAD[role] if not (read_only and step.write)] for role in roles}
+    requests = []
+    for role in rng.choices(roles, weights=[ROLE_MIX[role] for role in roles], k=total):
+        step = rng.choices(steps[role], weights=[step.weight for step in steps[role]])[0]
+        requests.append((rng.choice(by_role[role]), step))
+    return requests
+
+
+def replay(sessions, total, seed=0, concurrency=1, read_only=False):
+    """
+    Replay ``total`` requests across ``sessions`` and return one
+    ``LoadResult`` per step plus an overall one. Any 4xx/5xx response or
+    exception counts as an error.
+    """
+    rng = random.Random(seed)
+    requests = [(session, step, *step.build(session, rng)) for session, step in plan(sessions, total, rng, read_only)]
+
+    def timed(request):
+        session, step, args, data = request
+        started = time.perf_counter()
+        try:
+            ok = session.driver.request(step.method, reverse(step.name, args=args), data, step.json) < 400
+        except Exception:
+            ok = False
+        return step.label, time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(timed, requests))
+    else:
+        outcomes = [timed(request) for request in requests]
+    elapsed = time.perf_counter() - started
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for label, latency, ok in outcomes:
+        latencies[label].append(latency)
+        errors[label] += not ok
+    results = [LoadResult(label, latencies[label], errors[label], elapsed) for label in sorted(latencies)]
+    results.append(LoadResult('all', [latency for _, latency, _ in outcomes], sum(errors.values()), elapsed))
+    return results
@@ -0,0 +1,44 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank.accrual import ACCRUALS, accrue, capitalize_interest, compound_returns, is_month_end
+
+
+class Command(BaseCommand):
+    help = (
+        'Accrue daily savings interest and investment returns up to a date. '
+        'Each accrual keeps a watermark, so reruns only accrue the days since '
+        'the last run and an interrupted run resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', help='Last day to accrue (YYYY-MM-DD). Defaults to yesterday.')
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Rows per UPDATE and commit.')
+        parser.add_argument(
+            '--capitalize', action='store_true',
+            help='Pay accrued interest and returns in afterwards. Always done at month end.')
+
+    def handle(self, *args, **options):
+        if options['through']:
+            try:
+                through = datetime.date.fromisoformat(options['through'])
+            except ValueError:
+                raise CommandError('--through must be YYYY-MM-DD.')
+        else:
+            through = datetime.date.today() - datetime.timedelta(days=1)
+
+        for name in ACCRUALS:
+            started = time.perf_counter()
+            updated = accrue(name, through, chunk_size=options['chunk_size'])
+            self.stdout.write(f'{name}: {updated} rows accrued in {time.perf_counter() - started:.1f}s.')
+
+        if options['capitalize'] or is_month_end(through):
+            started = time.perf_counter()
+            credited = capitalize_interest()
+            compounded = compound_returns()
+            self.stdout.write(
+                f'Capitalized {credited} accounts and {compounded} investments '
+                f'in {time.perf_counter() - started:.1f}s.')
+        self.stdout.write(self.style.SUCCESS(f'Accrued through {through}.'))
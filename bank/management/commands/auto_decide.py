@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bank.underwriting import CardUnderwriter, LoanUnderwriter
+
+
+class Command(BaseCommand):
+    help = (
+        'Score pending loan and credit card applications against the credit rules. '
+        'Approvals and rejections are applied in bulk; referred applications stay pending.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['loan', 'card', 'all'], default='all')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Score without changing any status.')
+
+    def handle(self, *args, **options):
+        underwriters = [LoanUnderwriter, CardUnderwriter]
+        if options['kind'] != 'all':
+            underwriters = [cls for cls in underwriters if cls.kind == options['kind']]
+        for underwriter in underwriters:
+            started = time.perf_counter()
+            outcomes, rules = underwriter().run(batch_size=options['batch_size'], dry_run=options['dry_run'])
+            elapsed = time.perf_counter() - started
+            scored = sum(outcomes.values())
+            rate = scored / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'{underwriter.kind}: scored {scored} in {elapsed:.2f}s ({rate:.0f}/s): '
+                + ', '.join(f'{count} {outcome}' for outcome, count in outcomes.items())
+            ))
+            for rule, count in sorted(rules.items(), key=lambda item: -item[1]):
+                self.stdout.write(f'  {rule}: {count}')
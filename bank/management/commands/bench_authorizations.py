@@ -0,0 +1,84 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bank import ledger
+from bank.allocator import allocate_card_numbers
+from bank.authorization import Authorizer
+from bank.benchmark import LoadResult
+from bank.models import CreditCard, Customer, LedgerBalance, User
+from bank.posting import post_card_transaction
+
+
+def naive_authorize(card_id, amount, description):
+    """Read-modify-write authorization: lock, read limit and balance, post."""
+    with transaction.atomic():
+        card = CreditCard.objects.select_for_update().filter(id=card_id, status='active').first()
+        if card is None:
+            return False
+        posted = LedgerBalance.objects.filter(book=ledger.card_book(card_id)).values_list('balance', flat=True).first()
+        if amount > card.credit_limit - (posted or 0):
+            return False
+        post_card_transaction(card_id, 'purchase', amount, description)
+        return True
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare escrowed, micro-batched card authorization with a naive '
+        'read-modify-write against the database. Runs in a transaction that is '
+        'rolled back, so no data is left behind.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--escrow', type=Decimal, default=None,
+                            help='Largest slice of open-to-buy set aside per card (default: CARD_AUTH_ESCROW).')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _timed(self, label, authorize, requests):
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for card_id, amount in requests:
+            begin = time.perf_counter()
+            try:
+                authorize(card_id, amount, 'Benchmark purchase')
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - begin)
+        return LoadResult(label, latencies, errors, time.perf_counter() - started)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            user = User.objects.create(username=f'bench-auth-{time.time_ns()}', role='customer')
+            customer = Customer.objects.create(
+                user=user, name='Benchmark', email=f'{user.username}@example.com', dob=datetime.date(1990, 1, 1))
+            CreditCard.objects.bulk_create(
+                CreditCard(customer=customer, card_number=number, credit_limit=Decimal('1000000'),
+                           card_type='standard', status='active')
+                for number in allocate_card_numbers(options['cards'])
+            )
+            card_ids = list(CreditCard.objects.filter(customer=customer).values_list('id', flat=True))
+            requests = [(rng.choice(card_ids), Decimal(rng.randint(100, 50000)) / 100)
+                        for _ in range(options['requests'])]
+
+            naive = self._timed('naive read-modify-write', naive_authorize, requests)
+            # No background poster: batches are posted inline on this
+            # connection so they stay inside the rolled-back transaction
+            authorizer = Authorizer(escrow=options['escrow'], batch_size=options['batch_size'], flush_interval=0)
+            cached = self._timed('escrowed open-to-buy, batched posting', authorizer.authorize, requests)
+            authorizer.release()
+            transaction.set_rollback(True)
+
+        self.stdout.write(str(naive))
+        self.stdout.write(str(cached))
+        if naive.throughput:
+            self.stdout.write(self.style.SUCCESS(f'Speed-up: {cached.throughput / naive.throughput:.1f}x'))
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank.benchmark import HttpSession, run_load
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure requests/sec and latency percentiles of views on a running server. '
+        'Compare ASGI and WSGI by running it against, for example, '
+        '"uvicorn bank_app.asgi:application --workers 4" and '
+        '"gunicorn bank_app.wsgi:application --workers 4" on the same database, '
+        'using the async/ URLs for the ASGI run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to load; repeat for several. Defaults to the customer read views.')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--json', action='store_true', help='Print results as JSON lines.')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/customer_dashboard/', '/transactions/', '/transactions/api/']
+        sessions = []
+        for _ in range(options['concurrency']):
+            session = HttpSession(options['base_url'])
+            try:
+                session.login(options['username'], options['password'])
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Could not log in at {options["base_url"]}: {exc}')
+            sessions.append(session)
+
+        for path in paths:
+            def request(index, path=path):
+                return sessions[index % len(sessions)].get(path) == 200
+
+            result = run_load(path, request, options['requests'], options['concurrency'])
+            self.stdout.write(json.dumps(result.as_dict()) if options['json'] else str(result))
@@ -0,0 +1,132 @@
+import datetime
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from bank.benchmark import LoadResult
+from bank.database import pragmas
+
+READ_SQL = (
+    ('SELECT id, balance FROM bank_account WHERE customer_id = '
+     '(SELECT customer_id FROM bank_account WHERE id = ?)'),
+    'SELECT id, transaction_type, amount, created_at FROM bank_transaction '
+    'WHERE account_id = ? ORDER BY created_at DESC, id DESC LIMIT 20',
+)
+
+
+def _read(conn, account_id):
+    for sql in READ_SQL:
+        conn.execute(sql, (account_id,)).fetchall()
+
+
+def _write(conn, account_id):
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('UPDATE bank_account SET balance = balance + 1 WHERE id = ?', (account_id,))
+    conn.execute(
+        'INSERT INTO bank_transaction (transaction_type, amount, description, created_at, account_id) '
+        "VALUES ('deposit', 1, 'Benchmark deposit', ?, ?)",
+        (datetime.datetime.utcnow().isoformat(' '), account_id))
+    conn.execute('COMMIT')
+
+
+def _worker(path, role, connection_pragmas, seconds, seed, account_ids):
+    """Run one reader or writer until the deadline; returns its latencies and errors."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    for name, value in connection_pragmas:
+        conn.execute(f'PRAGMA {name} = {value}')
+    rng = random.Random(seed)
+    operation = _write if role == 'write' else _read
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            operation(conn, rng.choice(account_ids))
+        except sqlite3.OperationalError:
+            # "database is locked" once the busy timeout runs out
+            errors += 1
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return role, latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent reads and writes on a copy of the database with '
+        "SQLite's defaults (rollback journal, synchronous=FULL) and with the "
+        'pragmas bank.database applies (WAL, synchronous=NORMAL, busy timeout, '
+        'mmap and a larger page cache). The database itself is not modified.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _copy(self, directory, label, journal_mode):
+        path = os.path.join(directory, f'{label}.sqlite3')
+        connection = connections['default']
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        connection.connection.backup(target)
+        # The journal mode persists in the file; set it before any worker connects
+        target.execute(f'PRAGMA journal_mode = {journal_mode}')
+        target.close()
+        return path
+
+    def _run(self, path, connection_pragmas, options, account_ids):
+        jobs = [('write', index) for index in range(options['writers'])]
+        jobs += [('read', index) for index in range(options['readers'])]
+        connection_pragmas = [(name, value) for name, value in connection_pragmas if name != 'journal_mode']
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(len(jobs)) as pool:
+            outcomes = pool.starmap(_worker, [
+                (path, role, connection_pragmas, options['seconds'], f"{options['seed']}:{role}:{index}", account_ids)
+                for role, index in jobs
+            ])
+        results = {}
+        for label in ('read', 'write'):
+            latencies = [latency for role, values, _ in outcomes if role == label for latency in values]
+            errors = sum(count for role, _, count in outcomes if role == label)
+            results[label] = LoadResult(label, latencies, errors, options['seconds'])
+        return results
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('bench_sqlite only runs against a SQLite database.')
+        if options['readers'] + options['writers'] < 1:
+            raise CommandError('Run at least one reader or writer.')
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT id FROM bank_account ORDER BY id LIMIT 10000')
+            account_ids = [row[0] for row in cursor.fetchall()]
+        if not account_ids:
+            raise CommandError('The database has no accounts; seed it first with seed_bank.')
+
+        modes = (
+            # Python's sqlite3 default of a 5 second busy timeout, as Django uses
+            ('before', [('journal_mode', 'DELETE'), ('synchronous', 'FULL'), ('busy_timeout', 5000)]),
+            ('after', pragmas()),
+        )
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for label, connection_pragmas in modes:
+                path = self._copy(directory, label, dict(connection_pragmas)['journal_mode'])
+                results[label] = self._run(path, connection_pragmas, options, account_ids)
+                for result in results[label].values():
+                    result.label = f'{label}: {result.label}'
+                    self.stdout.write(str(result))
+
+        for kind in ('read', 'write'):
+            before, after = results['before'][kind], results['after'][kind]
+            if before.throughput:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{kind.capitalize()} speed-up: {after.throughput / before.throughput:.1f}x'))
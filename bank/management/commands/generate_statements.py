@@ -0,0 +1,38 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank.statements import PreviousRunIncomplete, run_statements
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate credit card statements for a cycle. Rerunning the same cycle '
+        'resumes it: finished partitions are not recomputed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period-end', help='Last day of the cycle (YYYY-MM-DD). Defaults to the end of last month.')
+        parser.add_argument('--workers', type=int, default=0, help='Processes to spread partitions over.')
+        parser.add_argument('--partition-size', type=int, default=10000, help='Cards per partition.')
+
+    def handle(self, *args, **options):
+        if options['period_end']:
+            try:
+                period_end = datetime.date.fromisoformat(options['period_end'])
+            except ValueError:
+                raise CommandError('--period-end must be YYYY-MM-DD.')
+        else:
+            period_end = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+        started = time.perf_counter()
+        try:
+            run = run_statements(period_end, workers=options['workers'], partition_size=options['partition_size'])
+        except PreviousRunIncomplete as exc:
+            raise CommandError(str(exc))
+        partitions = run.partitions.filter(status='done')
+        statements = sum(partitions.values_list('statements', flat=True))
+        self.stdout.write(self.style.SUCCESS(
+            f'{run}: {run.status}, {partitions.count()}/{run.partitions.count()} partitions, '
+            f'{statements} statements in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,41 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank.onboarding import ACCOUNT_TYPES, guess_format, import_customers, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk onboard customers from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or NDJSON file of customers.')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes used to hash passwords; 0 hashes in-process.')
+        parser.add_argument('--account-type', choices=ACCOUNT_TYPES, default='checking',
+                            help='Account type for rows without an account_type column.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist.')
+        fmt = options['format'] or guess_format(path)
+
+        started = time.perf_counter()
+        with open(path, newline='', encoding='utf-8') as stream:
+            result = import_customers(
+                read_rows(stream, fmt),
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                account_type=options['account_type'],
+            )
+        elapsed = time.perf_counter() - started
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} customers in {elapsed:.1f}s ({len(result.errors)} rows rejected).'
+        ))
@@ -0,0 +1,46 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank.loadtest import ClientDriver, HttpDriver, open_sessions, replay, uncovered
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a mixed workload of every role against every URL and report '
+        'throughput and latency percentiles per request type. Runs in-process '
+        'through the test client, or against a running server with --base-url. '
+        'Meant for a database filled by seed_bank; writes are real unless '
+        '--read-only is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--base-url', help='Server to drive over HTTP instead of in-process.')
+        parser.add_argument('--concurrency', type=int, default=1, help='Threads; only with --base-url.')
+        parser.add_argument('--customers', type=int, default=20, help='Customer sessions to replay.')
+        parser.add_argument('--seed', type=int, default=0, help='The seed_bank seed, which also seeds the replay.')
+        parser.add_argument('--password', default='seed-password-1')
+        parser.add_argument('--read-only', action='store_true', help='Skip requests that write.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON lines.')
+
+    def handle(self, *args, **options):
+        missing = uncovered()
+        if missing:
+            raise CommandError(f'URLs missing from the load test workload: {", ".join(sorted(missing))}')
+        if options['concurrency'] > 1 and not options['base_url']:
+            raise CommandError('--concurrency needs --base-url; the in-process client runs one request at a time.')
+        if options['base_url']:
+            def make_driver():
+                return HttpDriver(options['base_url'])
+        else:
+            make_driver = ClientDriver
+
+        sessions = open_sessions(make_driver, options['password'], random.Random(options['seed']),
+                                 options['customers'], f'seed{options["seed"]}')
+        if not sessions:
+            raise CommandError('No users to log in as; run seed_bank first.')
+        results = replay(sessions, options['requests'], options['seed'], options['concurrency'], options['read_only'])
+        for result in results:
+            self.stdout.write(json.dumps(result.as_dict()) if options['json'] else str(result))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from bank import authorization
+
+
+class Command(BaseCommand):
+    help = (
+        'Post approved card authorization holds to the ledger, including any '
+        'left by stopped workers, and reclaim the escrow those workers held.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        reclaimed = authorization.reclaim_escrows()
+        total = 0
+        while True:
+            posted = authorization.post_holds(options['batch_size'])
+            if not posted:
+                break
+            total += posted
+        self.stdout.write(self.style.SUCCESS(f'Posted {total} holds, reclaimed {reclaimed} expired escrows.'))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bank.amortization import regenerate_schedules
+from bank.models import Loan
+
+
+class Command(BaseCommand):
+    help = 'Recompute the amortization schedule of every loan in the portfolio.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', choices=['pending', 'approved', 'rejected'],
+                            help='Only regenerate loans with this status.')
+        parser.add_argument('--chunk-size', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        loans = Loan.objects.all()
+        if options['status']:
+            loans = loans.filter(status=options['status'])
+        started = time.perf_counter()
+        written = regenerate_schedules(loans, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Regenerated {written} schedules in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bank.seeding import STAFF_ROLES, seed_bank
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a realistic bank: customers with accounts, a year of '
+        'transactions, loans, cards, investments and retirement plans, plus '
+        'one user per staff role. The same seed always produces the same data, '
+        'and rerunning resumes an interrupted seed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Customers written per transaction.')
+        parser.add_argument('--transactions', type=int, default=20, help='Average transactions per account.')
+        parser.add_argument('--password', default='seed-password-1', help='Password of every seeded user.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(done):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{done}/{options["customers"]} customers ({time.perf_counter() - started:.0f}s)')
+
+        created = seed_bank(options['customers'], options['seed'], options['chunk_size'],
+                            options['transactions'], options['password'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {created} customers in {time.perf_counter() - started:.1f}s. Staff users: '
+            + ', '.join(f'seed{options["seed"]}_{role}' for role in STAFF_ROLES)))
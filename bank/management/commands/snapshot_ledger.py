@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from bank import ledger
+from bank.models import LedgerBalance
+
+
+class Command(BaseCommand):
+    help = 'Checkpoint ledger balances and optionally reconcile them against the journal.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reconcile', action='store_true',
+                            help='Compare every running balance with its rebuilt value.')
+
+    def handle(self, *args, **options):
+        written = ledger.take_snapshots()
+        self.stdout.write(f'Wrote {written} balance snapshots.')
+
+        if not options['reconcile']:
+            return
+        mismatches = 0
+        # GL books keep their running total in several rows
+        books = sorted({ledger.book_of(row) for row in LedgerBalance.objects.values_list('book', flat=True).iterator()})
+        for book in books:
+            running, rebuilt = ledger.reconcile(book)
+            if running != rebuilt:
+                mismatches += 1
+                self.stderr.write(f'{book}: running {running} != rebuilt {rebuilt}')
+        if mismatches:
+            self.stderr.write(self.style.ERROR(f'{mismatches} books out of balance.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All books reconcile.'))
@@ -0,0 +1,35 @@
+from django.core.cache import caches
+from django.conf import settings
+
+# Counters live in the cache so every worker process shares them
+PREFIX = 'metrics:'
+_counters = set()
+
+
+def _cache():
+    return caches[getattr(settings, 'METRICS_CACHE_ALIAS', 'default')]
+
+
+def incr(name, delta=1):
+    """Add ``delta`` to counter ``name``."""
+    _counters.add(name)
+    cache = _cache()
+    key = PREFIX + name
+    if cache.add(key, delta, timeout=None):
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, delta, timeout=None)
+
+
+def get(name):
+    return _cache().get(PREFIX + name, 0)
+
+
+def snapshot(names=None):
+    """Return ``{name: value}`` for ``names`` (default: every counter touched by this process)."""
+    names = sorted(names or _counters)
+    values = _cache().get_many([PREFIX + name for name in names])
+    return {name: values.get(PREFIX + name, 0) for name in names}
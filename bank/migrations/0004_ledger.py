@@ -0,0 +1,66 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0003_delete_insuranceproduct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book', models.CharField(max_length=40)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('last_leg_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerBalance',
+            fields=[
+                ('book', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JournalLeg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book', models.CharField(max_length=40)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='legs', to='bank.journalentry')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='balancesnapshot',
+            index=models.Index(fields=['book', '-last_leg_id'], name='bank_snapshot_book_idx'),
+        ),
+        migrations.AddField(
+            model_name='creditcardtransaction',
+            name='journal_entry',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='bank.journalentry'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='journal_entry',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='bank.journalentry'),
+        ),
+        migrations.AddIndex(
+            model_name='journalleg',
+            index=models.Index(fields=['book', 'id'], name='bank_leg_book_id_idx'),
+        ),
+    ]
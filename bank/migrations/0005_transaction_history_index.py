@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0004_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', '-created_at', '-id'], name='bank_txn_history_idx'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:45
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE bank_customer_fts USING fts5(
+        name, email, content='bank_customer', content_rowid='id'
+    )""",
+    """CREATE TRIGGER bank_customer_fts_ai AFTER INSERT ON bank_customer BEGIN
+        INSERT INTO bank_customer_fts(rowid, name, email) VALUES (new.id, new.name, new.email);
+    END""",
+    """CREATE TRIGGER bank_customer_fts_ad AFTER DELETE ON bank_customer BEGIN
+        INSERT INTO bank_customer_fts(bank_customer_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+    END""",
+    """CREATE TRIGGER bank_customer_fts_au AFTER UPDATE OF name, email ON bank_customer BEGIN
+        INSERT INTO bank_customer_fts(bank_customer_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+        INSERT INTO bank_customer_fts(rowid, name, email) VALUES (new.id, new.name, new.email);
+    END""",
+    "INSERT INTO bank_customer_fts(bank_customer_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP = [
+    'DROP TRIGGER IF EXISTS bank_customer_fts_ai',
+    'DROP TRIGGER IF EXISTS bank_customer_fts_ad',
+    'DROP TRIGGER IF EXISTS bank_customer_fts_au',
+    'DROP TABLE IF EXISTS bank_customer_fts',
+]
+
+POSTGRES_TRIGRAM = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS bank_customer_name_trgm ON bank_customer USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS bank_customer_email_trgm ON bank_customer USING gin (email gin_trgm_ops)',
+]
+
+POSTGRES_TRIGRAM_DROP = [
+    'DROP INDEX IF EXISTS bank_customer_name_trgm',
+    'DROP INDEX IF EXISTS bank_customer_email_trgm',
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            for statement in SQLITE_FTS:
+                schema_editor.execute(statement)
+        except OperationalError:
+            # SQLite built without FTS5; search falls back to prefix matching
+            for statement in SQLITE_FTS_DROP:
+                schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_TRIGRAM:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_FTS_DROP:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_TRIGRAM_DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0005_transaction_history_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='phone_number',
+            field=models.CharField(blank=True, db_index=True, max_length=15),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0009_outbox_delivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanSchedule',
+            fields=[
+                ('loan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='schedule', serialize=False, to='bank.loan')),
+                ('monthly_payment', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('final_payment', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('total_interest', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0010_loan_schedule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='creditcard',
+            index=models.Index(fields=['status', 'id'], name='bank_card_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['status', 'id'], name='bank_loan_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0011_application_queue_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Statement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('opening_balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('purchases', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('payments', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('interest', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('closing_balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('minimum_due', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('due_date', models.DateField()),
+                ('artifact', models.FileField(blank=True, upload_to='statements/')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatementPartition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_card_id', models.BigIntegerField()),
+                ('last_card_id', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done')], default='pending', max_length=10)),
+                ('statements', models.PositiveIntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatementRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField(unique=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done')], default='running', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='creditcardtransaction',
+            index=models.Index(fields=['credit_card', 'created_at'], name='bank_card_txn_cycle_idx'),
+        ),
+        migrations.AddField(
+            model_name='statementpartition',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='partitions', to='bank.statementrun'),
+        ),
+        migrations.AddField(
+            model_name='statement',
+            name='credit_card',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bank.creditcard'),
+        ),
+        migrations.AddField(
+            model_name='statement',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statements', to='bank.statementrun'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='statementpartition',
+            unique_together={('run', 'first_card_id')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='statement',
+            unique_together={('run', 'credit_card')},
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0012_statements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccrualWatermark',
+            fields=[
+                ('name', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('accrued_through', models.DateField(blank=True, null=True)),
+                ('target_date', models.DateField(blank=True, null=True)),
+                ('next_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='accrued_interest',
+            field=models.DecimalField(decimal_places=6, default=0, editable=False, max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='investment',
+            name='accrued_return',
+            field=models.DecimalField(decimal_places=6, default=0, editable=False, max_digits=18),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import F, Sum
+
+CASH_BOOK = 'gl:cash'
+BATCH_SIZE = 1000
+
+
+def journal_opening_balances(apps, schema_editor):
+    """
+    Journal the part of each account's balance that no journal entry
+    explains, such as balances entered when the account was opened, so the
+    ledger books agree with ``Account.balance``.
+    """
+    Account = apps.get_model('bank', 'Account')
+    JournalEntry = apps.get_model('bank', 'JournalEntry')
+    JournalLeg = apps.get_model('bank', 'JournalLeg')
+    LedgerBalance = apps.get_model('bank', 'LedgerBalance')
+    alias = schema_editor.connection.alias
+
+    journaled = defaultdict(Decimal, JournalLeg.objects.using(alias).filter(book__startswith='account:')
+                            .values('book').annotate(total=Sum('amount')).values_list('book', 'total'))
+    legs = {}
+    for account_id, balance in Account.objects.using(alias).values_list('id', 'balance').iterator():
+        book = f'account:{account_id}'
+        missing = balance - journaled[book]
+        if missing:
+            legs[book] = missing
+    if not legs:
+        return
+    legs[CASH_BOOK] = -sum(legs.values(), Decimal(0))
+
+    entry = JournalEntry.objects.using(alias).create(description='Opening balances')
+    JournalLeg.objects.using(alias).bulk_create(
+        (JournalLeg(entry=entry, book=book, amount=amount) for book, amount in legs.items()),
+        batch_size=BATCH_SIZE,
+    )
+    for book, amount in legs.items():
+        if not LedgerBalance.objects.using(alias).filter(book=book).update(balance=F('balance') + amount):
+            LedgerBalance.objects.using(alias).create(book=book, balance=amount)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0014_export_watermark'),
+    ]
+
+    operations = [
+        migrations.RunPython(journal_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def blank_delivered_bodies(apps, schema_editor):
+    """Drop the bodies, which may hold generated passwords, of email no longer waiting to be sent."""
+    OutboundEmail = apps.get_model('bank', 'OutboundEmail')
+    OutboundEmail.objects.using(schema_editor.connection.alias).filter(status__in=['sent', 'failed']).exclude(body='').update(body='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0015_journal_opening_balances'),
+    ]
+
+    operations = [
+        migrations.RunPython(blank_delivered_bodies, migrations.RunPython.noop),
+    ]
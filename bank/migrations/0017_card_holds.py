@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0016_blank_delivered_email_bodies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ledgerbalance',
+            name='held',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.CreateModel(
+            name='CardHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('description', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('credit_card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bank.creditcard')),
+            ],
+        ),
+    ]
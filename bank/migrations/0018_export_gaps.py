@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0017_card_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportwatermark',
+            name='gaps',
+            field=models.JSONField(default=list, editable=False),
+        ),
+    ]
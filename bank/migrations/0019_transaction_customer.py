@@ -0,0 +1,37 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_account_customers(apps, schema_editor):
+    Account = apps.get_model('bank', 'Account')
+    Transaction = apps.get_model('bank', 'Transaction')
+    alias = schema_editor.connection.alias
+    Transaction.objects.using(alias).update(customer_id=Subquery(
+        Account.objects.using(alias).filter(id=OuterRef('account_id')).values('customer_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0018_export_gaps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='customer',
+            field=models.ForeignKey(null=True, editable=False, on_delete=django.db.models.deletion.CASCADE, to='bank.customer'),
+        ),
+        migrations.RunPython(copy_account_customers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='transaction',
+            name='customer',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='bank.customer'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['customer', '-created_at', '-id'], name='bank_txn_customer_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0019_transaction_customer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardEscrow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=32)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('credit_card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bank.creditcard')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cardescrow',
+            constraint=models.UniqueConstraint(fields=('credit_card', 'owner'), name='bank_escrow_card_owner'),
+        ),
+    ]
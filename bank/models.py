@@ -1,6 +1,6 @@
 import random
-import uuid
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
 # Custom User model
@@ -24,29 +24,25 @@ class User(AbstractUser):
 # Customer model
 class Customer(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     email = models.EmailField(unique=True)
     dob = models.DateField()
     address = models.TextField(blank=True)
-    phone_number = models.CharField(max_length=15, blank=True)
+    phone_number = models.CharField(max_length=15, blank=True, db_index=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True)
 
     def __str__(self):
         return self.name
 
 def generate_account_number():
-    """Generate a unique 12-digit account number."""
-    while True:
-        account_number = str(uuid.uuid4().int)[:12]
-        if not Account.objects.filter(account_number=account_number).exists():
-            return account_number 
+    """Allocate a unique 12-digit account number."""
+    from .allocator import next_account_number
+    return next_account_number()
 
 def generate_card_number():
-    """Generate a unique 16-digit card number."""
-    while True:
-        card_number = ''.join([str(random.randint(0, 9)) for _ in range(16)])
-        if not CreditCard.objects.filter(card_number=card_number).exists():
-            return card_number
+    """Allocate a unique, Luhn-valid 16-digit card number."""
+    from .allocator import next_card_number
+    return next_card_number()
 
 def generate_cvv():
     """Generate a 3-digit CVV number."""
@@ -58,6 +54,8 @@ class Account(models.Model):
     account_number = models.CharField(max_length=20, unique=True, editable=False, default=generate_account_number)
     account_type = models.CharField(max_length=30, choices=[('checking', 'Checking'), ('savings', 'Savings')])
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    # Interest accrued daily but not yet paid into the balance
+    accrued_interest = models.DecimalField(max_digits=18, decimal_places=6, default=0, editable=False)
     created_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -66,10 +64,20 @@ class Account(models.Model):
 # Transaction model
 class Transaction(models.Model):
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    # Copied from the account so a customer's history across all their
+    # accounts is one range of bank_txn_customer_idx
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, editable=False)
     transaction_type = models.CharField(max_length=10, choices=[('deposit', 'Deposit'), ('withdrawal', 'Withdrawal')])
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     description = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now=True)
+    journal_entry = models.ForeignKey('JournalEntry', on_delete=models.PROTECT, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-created_at', '-id'], name='bank_txn_history_idx'),
+            models.Index(fields=['customer', '-created_at', '-id'], name='bank_txn_customer_idx'),
+        ]
 
     def __str__(self):
         return f'{self.transaction_type} of {self.amount} on {self.created_at}'
@@ -84,9 +92,24 @@ class Loan(models.Model):
     status = models.CharField(max_length=20, choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected')], default='pending')
     created_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Serves the officer's pending queue, paginated by id
+        indexes = [models.Index(fields=['status', 'id'], name='bank_loan_queue_idx')]
+
     def __str__(self):
         return f'{self.loan_type} loan of {self.amount}'
 
+# Amortization summary of a loan; the per-period rows are derived on demand
+class LoanSchedule(models.Model):
+    loan = models.OneToOneField(Loan, on_delete=models.CASCADE, primary_key=True, related_name='schedule')
+    monthly_payment = models.DecimalField(max_digits=12, decimal_places=2)
+    final_payment = models.DecimalField(max_digits=12, decimal_places=2)
+    total_interest = models.DecimalField(max_digits=14, decimal_places=2)
+    generated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Schedule for loan {self.loan_id}: {self.monthly_payment}/month'
+
 # Repayment model
 class Repayment(models.Model):
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE)
@@ -105,6 +128,9 @@ class CreditCard(models.Model):
     status = models.CharField(max_length=20, choices=[('pending', 'Pending'), ('active', 'Active'), ('rejected', 'Rejected')], default='pending')
     cvv = models.CharField(max_length=3, editable=False, default=generate_cvv)
 
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'], name='bank_card_queue_idx')]
+
     def __str__(self):
         return f'{self.card_type} card - {self.card_number}'
 
@@ -115,16 +141,65 @@ class CreditCardTransaction(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     description = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now=True)
+    journal_entry = models.ForeignKey('JournalEntry', on_delete=models.PROTECT, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['credit_card', 'created_at'], name='bank_card_txn_cycle_idx')]
 
     def __str__(self):
         return f'{self.transaction_type} of {self.amount} on {self.created_at}'
 
+# One statement cycle, split into card id ranges processed independently
+class StatementRun(models.Model):
+    period_start = models.DateField()
+    period_end = models.DateField(unique=True)
+    status = models.CharField(max_length=10, choices=[('running', 'Running'), ('done', 'Done')], default='running')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Statements {self.period_start} to {self.period_end}'
+
+class StatementPartition(models.Model):
+    run = models.ForeignKey(StatementRun, on_delete=models.CASCADE, related_name='partitions')
+    first_card_id = models.BigIntegerField()
+    last_card_id = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=[('pending', 'Pending'), ('done', 'Done')], default='pending')
+    statements = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = [('run', 'first_card_id')]
+
+    def __str__(self):
+        return f'Cards {self.first_card_id}-{self.last_card_id} of {self.run}'
+
+# Credit card statement for one cycle
+class Statement(models.Model):
+    run = models.ForeignKey(StatementRun, on_delete=models.CASCADE, related_name='statements')
+    credit_card = models.ForeignKey(CreditCard, on_delete=models.CASCADE)
+    opening_balance = models.DecimalField(max_digits=12, decimal_places=2)
+    purchases = models.DecimalField(max_digits=12, decimal_places=2)
+    payments = models.DecimalField(max_digits=12, decimal_places=2)
+    interest = models.DecimalField(max_digits=12, decimal_places=2)
+    closing_balance = models.DecimalField(max_digits=12, decimal_places=2)
+    minimum_due = models.DecimalField(max_digits=12, decimal_places=2)
+    due_date = models.DateField()
+    artifact = models.FileField(upload_to='statements/', blank=True)
+
+    class Meta:
+        unique_together = [('run', 'credit_card')]
+
+    def __str__(self):
+        return f'Statement for card {self.credit_card_id}: {self.closing_balance}'
+
 # Investment model
 class Investment(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     investment_type = models.CharField(max_length=30, choices=[('stocks', 'Stocks'), ('bonds', 'Bonds'), ('mutual_funds', 'Mutual Funds')])
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     return_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    accrued_return = models.DecimalField(max_digits=18, decimal_places=6, default=0, editable=False)
     created_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -139,3 +214,127 @@ class RetirementPlan(models.Model):
 
     def __str__(self):
         return f'{self.plan_type} plan with contribution {self.contribution}'
+
+# Double-entry journal. Every entry has two or more legs whose amounts sum
+# to zero; a leg's amount is the signed change it makes to its book.
+class JournalEntry(models.Model):
+    description = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Journal entry {self.id}: {self.description}'
+
+class JournalLeg(models.Model):
+    entry = models.ForeignKey(JournalEntry, on_delete=models.PROTECT, related_name='legs')
+    book = models.CharField(max_length=40)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        indexes = [models.Index(fields=['book', 'id'], name='bank_leg_book_id_idx')]
+
+    def __str__(self):
+        return f'{self.book} {self.amount}'
+
+# Running balance per book, updated in the same transaction as each entry
+class LedgerBalance(models.Model):
+    book = models.CharField(max_length=40, primary_key=True)
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Card books only: approved authorizations not yet posted as legs
+    held = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+
+    def __str__(self):
+        return f'{self.book}: {self.balance}'
+
+# Approved card authorization waiting to be posted to the ledger
+class CardHold(models.Model):
+    credit_card = models.ForeignKey(CreditCard, on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    description = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Hold of {self.amount} on card {self.credit_card_id}'
+
+# Open-to-buy set aside in LedgerBalance.held for one process to approve
+# card purchases against without a database round trip each
+class CardEscrow(models.Model):
+    credit_card = models.ForeignKey(CreditCard, on_delete=models.CASCADE)
+    owner = models.CharField(max_length=32)
+    # Not yet approved, or approved but not yet written as a CardHold
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    # Returned to the open-to-buy after this if the owner has not done so
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['credit_card', 'owner'], name='bank_escrow_card_owner')]
+
+    def __str__(self):
+        return f'Escrow of {self.amount} on card {self.credit_card_id} for {self.owner}'
+
+# Periodic checkpoint of a book's balance up to and including last_leg_id
+class BalanceSnapshot(models.Model):
+    book = models.CharField(max_length=40)
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+    last_leg_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['book', '-last_leg_id'], name='bank_snapshot_book_idx')]
+
+    def __str__(self):
+        return f'{self.book}: {self.balance} at leg {self.last_leg_id}'
+
+# Counter behind the account and card number allocator
+class NumberSequence(models.Model):
+    name = models.CharField(max_length=30, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.next_value}'
+
+# Outbound email waiting to be delivered by a worker
+class OutboundEmail(models.Model):
+    to_email = models.EmailField()
+    from_email = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True, editable=False)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='bank_outbox_due_idx')]
+
+    def __str__(self):
+        return f'{self.subject} to {self.to_email}'
+
+# Progress of a daily accrual job; next_id lets an interrupted run resume
+class AccrualWatermark(models.Model):
+    name = models.CharField(max_length=30, primary_key=True)
+    accrued_through = models.DateField(null=True, blank=True)
+    target_date = models.DateField(null=True, blank=True)
+    next_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} accrued through {self.accrued_through}'
+
+# Export progress of one table to the reporting warehouse
+class ExportWatermark(models.Model):
+    table = models.CharField(max_length=50, primary_key=True)
+    # Highest id exported; for snapshot tables, of the latest snapshot
+    last_id = models.BigIntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
+    snapshot_date = models.DateField(null=True, blank=True)
+    snapshot_complete = models.BooleanField(default=False)
+    # [first_id, last_id, first seen] ranges skipped below last_id, whose
+    # rows may still commit; rechecked until WAREHOUSE_LATE_ROW_WINDOW passes
+    gaps = models.JSONField(default=list, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.table} exported through id {self.last_id}'
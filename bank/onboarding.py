@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.utils.crypto import get_random_string
+
+from . import outbox
+from .allocator import allocate_account_numbers
+from .forms import CustomerImportForm
+from .models import Account, Customer, User
+
+PASSWORD_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%^&*()'
+ACCOUNT_TYPES = ('checking', 'savings')
+
+
+def generate_password():
+    return get_random_string(length=12, allowed_chars=PASSWORD_CHARS)
+
+
+def credentials_email(email, username, password, from_email=None):
+    """Build the (unsaved) email that tells a new customer their login."""
+    return outbox.build(
+        email,
+        'Your Bank Account Credentials',
+        f'Your account has been created successfully. Your username is {username} and your password is {password}.',
+        from_email,
+    )
+
+
+class InvalidRow:
+    """Stands in for a line that could not be read as a row; reported as that line's error."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def _ndjson_row(line):
+    try:
+        row = json.loads(line)
+    except ValueError:
+        return InvalidRow('Invalid JSON.')
+    if not isinstance(row, dict):
+        return InvalidRow('Expected a JSON object.')
+    return row
+
+
+def read_rows(stream, fmt):
+    """
+    Yield ``(line_number, row)`` from a CSV or NDJSON file without reading it
+    all into memory. ``stream`` may be text or binary. An NDJSON line that is
+    not a JSON object is yielded as an ``InvalidRow``.
+    """
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                yield line_number, _ndjson_row(line)
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def guess_format(filename):
+    return 'ndjson' if filename.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def as_dict(self):
+        return {'created': self.created, 'errors': self.errors}
+
+
+@contextmanager
+def _password_hasher(workers):
+    """Yield a ``map``-like callable that hashes passwords, in a process pool if asked."""
+    if not workers:
+        yield lambda passwords: list(map(make_password, passwords))
+        return
+    # Forked children must not share the parent's database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield lambda passwords: list(executor.map(make_password, passwords, chunksize=64))
+
+
+def _unique_usernames(emails):
+    """Derive usernames from email local parts, suffixing any that are taken."""
+    bases = [email.split('@')[0][:140] for email in emails]
+    taken = set(User.objects.filter(username__in=set(bases)).values_list('username', flat=True))
+    usernames = []
+    for base in bases:
+        username, suffix = base, 1
+        while username in taken:
+            suffix += 1
+            username = f'{base}{suffix}'
+            if suffix == 2 or suffix % 50 == 0:
+                taken.update(User.objects.filter(username__startswith=base).values_list('username', flat=True))
+        taken.add(username)
+        usernames.append(username)
+    return usernames
+
+
+def _import_chunk(rows, hash_passwords, default_account_type, result):
+    valid = []
+    seen_emails = set()
+    for line_number, row in rows:
+        if isinstance(row, InvalidRow):
+            result.errors.append({'line': line_number, 'errors': {'__all__': [{'message': row.message}]}})
+            continue
+        form = CustomerImportForm(row)
+        if not form.is_valid():
+            result.errors.append({'line': line_number, 'errors': form.errors.get_json_data()})
+            continue
+        email = form.cleaned_data['email']
+        if email in seen_emails:
+            result.errors.append({'line': line_number, 'errors': {'email': [{'message': 'Duplicate email in file.'}]}})
+            continue
+        seen_emails.add(email)
+        account_type = row.get('account_type') or default_account_type
+        if account_type not in ACCOUNT_TYPES:
+            result.errors.append({'line': line_number, 'errors': {'account_type': [{'message': 'Unknown account type.'}]}})
+            continue
+        valid.append((line_number, form.cleaned_data, account_type))
+
+    existing = set(Customer.objects.filter(email__in=seen_emails).values_list('email', flat=True))
+    for line_number, data, _ in valid:
+        if data['email'] in existing:
+            result.errors.append({'line': line_number, 'errors': {'email': [{'message': 'Customer with this Email already exists.'}]}})
+    valid = [item for item in valid if item[1]['email'] not in existing]
+    if not valid:
+        return
+
+    emails = [data['email'] for _, data, _ in valid]
+    passwords = [generate_password() for _ in valid]
+    hashes = hash_passwords(passwords)
+
+    with transaction.atomic():
+        usernames = _unique_usernames(emails)
+        User.objects.bulk_create([
+            User(username=username, email=email, password=password_hash, role='customer')
+            for username, email, password_hash in zip(usernames, emails, hashes)
+        ])
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        Customer.objects.bulk_create([
+            Customer(user_id=user_ids[username], **data)
+            for username, (_, data, _) in zip(usernames, valid)
+        ])
+        customer_ids = dict(Customer.objects.filter(email__in=emails).values_list('email', 'id'))
+        Account.objects.bulk_create([
+            Account(customer_id=customer_ids[email], account_number=number, account_type=account_type)
+            for email, number, (_, _, account_type) in zip(emails, allocate_account_numbers(len(valid)), valid)
+        ])
+        outbox.enqueue_many([
+            credentials_email(email, username, password)
+            for email, username, password in zip(emails, usernames, passwords)
+        ])
+    result.created += len(valid)
+
+
+def import_customers(rows, chunk_size=1000, workers=0, account_type='checking'):
+    """
+    Onboard customers from ``(line_number, row)`` pairs.
+
+    Each chunk is validated with ``CustomerForm`` rules, then its users,
+    customers and initial accounts are written with ``bulk_create`` in one
+    transaction and the credential emails are queued in the outbox. Rows
+    that fail validation are reported and skipped. ``workers`` > 0 hashes
+    passwords in that many processes.
+    """
+    result = ImportResult()
+    rows = iter(rows)
+    with _password_hasher(workers) as hash_passwords:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            _import_chunk(chunk, hash_passwords, account_type, result)
+    result.errors.sort(key=lambda error: error['line'])
+    return result
@@ -0,0 +1,111 @@
+import datetime
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger('bank.outbox')
+
+
+def build(to_email, subject, body, from_email=None):
+    return OutboundEmail(
+        to_email=to_email,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        subject=subject,
+        body=body,
+    )
+
+
+def enqueue(to_email, subject, body, from_email=None):
+    """Queue one email. Call inside the transaction that produced it."""
+    message = build(to_email, subject, body, from_email)
+    message.save()
+    return message
+
+
+def enqueue_many(messages, batch_size=1000):
+    """Queue unsaved ``OutboundEmail`` instances with one bulk insert."""
+    return OutboundEmail.objects.bulk_create(messages, batch_size=batch_size)
+
+
+def backoff(attempts):
+    """Delay before retry number ``attempts``: 30s, 1m, 2m, ... capped at 1h."""
+    return datetime.timedelta(seconds=min(30 * 2 ** (attempts - 1), 3600))
+
+
+def _claim(batch_size, lease):
+    """
+    Lease up to ``batch_size`` due messages to this worker. Leased rows are
+    pushed ``lease`` into the future, so a crashed worker's batch is retried
+    and concurrent workers never pick up the same row.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = OutboundEmail.objects.filter(status='pending', next_attempt_at__lte=now)
+    ids = list(due.order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    due.filter(id__in=ids).update(claim_token=token, next_attempt_at=now + lease)
+    return list(OutboundEmail.objects.filter(claim_token=token).order_by('id'))
+
+
+def drain(batch_size=100, max_attempts=5, lease=datetime.timedelta(minutes=5)):
+    """
+    Deliver one batch of queued email over a single backend connection.
+
+    Each message is sent individually on that connection so one bad
+    address does not fail the batch. Failures are retried with exponential
+    backoff and marked ``failed`` after ``max_attempts``. The body of a
+    message is blanked once it is sent or given up on, since it may carry
+    credentials. Returns ``(sent, failed)`` counts for the batch.
+    """
+    messages = _claim(batch_size, lease)
+    if not messages:
+        return 0, 0
+
+    sent, failed = [], []
+    connection = get_connection()
+    try:
+        connection.open()
+        for message in messages:
+            email = EmailMessage(message.subject, message.body, message.from_email, [message.to_email],
+                                 connection=connection)
+            try:
+                email.send()
+            except Exception as exc:
+                logger.warning('Sending email %s failed: %s', message.id, exc)
+                message.last_error = str(exc)
+                failed.append(message)
+            else:
+                sent.append(message)
+    except Exception as exc:
+        # Could not reach the mail server at all; retry the whole batch
+        logger.warning('Opening mail connection failed: %s', exc)
+        for message in messages:
+            message.last_error = str(exc)
+        failed = [message for message in messages if message not in sent]
+    finally:
+        connection.close()
+
+    now = timezone.now()
+    for message in sent:
+        message.status = 'sent'
+        message.sent_at = now
+        message.attempts += 1
+        message.body = ''
+    for message in failed:
+        message.attempts += 1
+        if message.attempts >= max_attempts:
+            message.status = 'failed'
+            message.body = ''
+        else:
+            message.next_attempt_at = now + backoff(message.attempts)
+    with transaction.atomic():
+        OutboundEmail.objects.bulk_update(
+            sent + failed, ['status', 'sent_at', 'attempts', 'next_attempt_at', 'last_error', 'body'], batch_size=500)
+    return len(sent), len(failed)
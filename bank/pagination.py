@@ -0,0 +1,91 @@
+import base64
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder truncates datetimes to milliseconds, which would make
+    # the cursor skip rows created within the same millisecond.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    payload = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    """Decode ``cursor`` back into typed values for the ``ordering`` fields."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Malformed cursor.')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor('Cursor does not match ordering.')
+    try:
+        return [
+            model._meta.get_field(name.lstrip('-')).to_python(value)
+            for name, value in zip(ordering, values)
+        ]
+    except Exception:
+        raise InvalidCursor('Cursor does not match ordering.')
+
+
+def _after(ordering, values):
+    """Build the lexicographic "strictly after this row" filter."""
+    condition = Q()
+    for position, name in enumerate(ordering):
+        field = name.lstrip('-')
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        clause = Q(**{f'{field}__{lookup}': values[position]})
+        for earlier, value in zip(ordering[:position], values):
+            clause &= Q(**{earlier.lstrip('-'): value})
+        condition |= clause
+    return condition
+
+
+def keyset_slice(queryset, ordering, cursor=None, size=50):
+    """Return the unevaluated queryset for one page plus a look-ahead row."""
+    ordering = tuple(ordering)
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(_after(ordering, decode_cursor(cursor, queryset.model, ordering)))
+    return queryset[:size + 1]
+
+
+def finish_page(rows, ordering, size):
+    """Trim the look-ahead row from ``rows`` and return ``(rows, next_cursor)``."""
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    last = rows[-1]
+    keys = [name.lstrip('-') for name in ordering]
+    if isinstance(last, dict):
+        values = [last[key] for key in keys]
+    else:
+        values = [getattr(last, key) for key in keys]
+    return rows, encode_cursor(values)
+
+
+def keyset_page(queryset, ordering, cursor=None, size=50):
+    """
+    Return ``(rows, next_cursor)`` for one page of ``queryset``.
+
+    ``ordering`` must end in a unique field (normally ``id``) so that the
+    cursor identifies exactly one row. Each page costs one indexed range
+    query however deep into the history it is, unlike OFFSET pagination.
+    ``next_cursor`` is ``None`` on the last page.
+    """
+    rows = list(keyset_slice(queryset, ordering, cursor, size))
+    return finish_page(rows, ordering, size)
@@ -0,0 +1,260 @@
+"""
+Connection pooling for the backends under ``bank/db_backends``.
+
+Django opens a connection per thread and closes it when ``CONN_MAX_AGE``
+runs out or the thread goes away, so threaded and async servers still pay
+for a fresh connection on most requests. The pooled backends hand a closed
+connection back to a per-process pool instead, and take the next one from
+it. Leave ``CONN_MAX_AGE`` at 0 with them unless every worker thread is
+long-lived, so connections go back to the pool at the end of each request.
+Configure a pool with a ``POOL`` dict in the database settings::
+
+    'POOL': {'MIN_SIZE': 0, 'MAX_SIZE': 10, 'IDLE_TIMEOUT': 300,
+             'TIMEOUT': 10, 'HEALTH_CHECK_INTERVAL': 30}
+"""
+import gc
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+from django.db import OperationalError
+
+from . import metrics
+
+DEFAULTS = {
+    'MIN_SIZE': 0,
+    'MAX_SIZE': 10,
+    # Seconds an idle connection is kept before it is closed
+    'IDLE_TIMEOUT': 300,
+    # Seconds to wait for a connection when MAX_SIZE are in use
+    'TIMEOUT': 10,
+    # Connections idle for longer are pinged before they are handed out
+    'HEALTH_CHECK_INTERVAL': 30,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolExhausted(OperationalError):
+    """Raised when no connection frees up within the pool's ``TIMEOUT``."""
+
+
+def _quietly_close(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def ping(conn):
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+    except Exception:
+        return False
+    return True
+
+
+class ConnectionPool:
+    def __init__(self, name, min_size=0, max_size=10, idle_timeout=300, timeout=10, health_check_interval=30):
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # (connection, time it was returned); most recently returned on the right
+        self._idle = deque()
+        # Open connections, idle or in use
+        self._size = 0
+        self._condition = threading.Condition()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Inherited connections share their socket with the parent, so
+            # they are dropped, not closed
+            self._idle.clear()
+            self._size = 0
+            self._pid = os.getpid()
+
+    def _evict(self, now):
+        # The oldest idle connections are on the left
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            _quietly_close(conn)
+            metrics.incr('db_pool.evicted')
+
+    def acquire(self, connect):
+        """
+        Return ``(connection, reused)``: the most recently returned idle
+        connection, or a new one from ``connect()`` while the pool is below
+        ``max_size``. Waits up to ``timeout`` seconds otherwise.
+        """
+        deadline = time.monotonic() + self.timeout
+        collected = False
+        while True:
+            with self._condition:
+                self._check_fork()
+                now = time.monotonic()
+                self._evict(now)
+                while not self._idle and self._size >= self.max_size:
+                    if not collected:
+                        # Wrappers of finished threads hold their connection
+                        # until the cycle collector frees them
+                        collected = True
+                        self._condition.release()
+                        try:
+                            gc.collect()
+                        finally:
+                            self._condition.acquire()
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.incr('db_pool.timeout')
+                        raise PoolExhausted(f'No connection in pool {self.name!r} became free within {self.timeout}s.')
+                    metrics.incr('db_pool.wait')
+                    self._condition.wait(remaining)
+                if self._idle:
+                    conn, returned = self._idle.pop()
+                else:
+                    conn = None
+                    self._size += 1
+            if conn is None:
+                try:
+                    conn = connect()
+                except BaseException:
+                    self._forget()
+                    raise
+                metrics.incr('db_pool.created')
+                return conn, False
+            if now - returned > self.health_check_interval and not ping(conn):
+                self.discard(conn)
+                metrics.incr('db_pool.broken')
+                continue
+            metrics.incr('db_pool.reused')
+            return conn, True
+
+    def release(self, conn):
+        """Return ``conn`` to the pool, rolling back anything left uncommitted."""
+        if self._pid != os.getpid():
+            return
+        try:
+            conn.rollback()
+        except Exception:
+            self.discard(conn)
+            return
+        with self._condition:
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    def _forget(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def discard(self, conn):
+        """Close ``conn`` and free its slot."""
+        _quietly_close(conn)
+        self._forget()
+
+    def close_idle(self):
+        with self._condition:
+            while self._idle:
+                _quietly_close(self._idle.pop()[0])
+                self._size -= 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+            }
+
+
+def get_pool(alias, key, options):
+    """The process's pool for ``alias`` and connection parameters ``key``."""
+    with _pools_lock:
+        pool = _pools.get((alias, key))
+        if pool is None:
+            options = dict(DEFAULTS, **options)
+            pool = _pools[alias, key] = ConnectionPool(
+                alias,
+                min_size=options['MIN_SIZE'],
+                max_size=options['MAX_SIZE'],
+                idle_timeout=options['IDLE_TIMEOUT'],
+                timeout=options['TIMEOUT'],
+                health_check_interval=options['HEALTH_CHECK_INTERVAL'],
+            )
+        return pool
+
+
+def stats():
+    """``{alias: usage}`` for every pool in this process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    usage = {}
+    for pool in pools:
+        for name, value in pool.stats().items():
+            usage.setdefault(pool.name, {}).setdefault(name, 0)
+            usage[pool.name][name] += value
+    return usage
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mixed into a backend's ``DatabaseWrapper`` so connections come from and
+    go back to a ``ConnectionPool``. Persistent connections kept by
+    ``CONN_MAX_AGE`` are also pinged at the start of a request once they
+    have been idle for ``HEALTH_CHECK_INTERVAL`` seconds.
+    """
+
+    # Whether the current connection came out of the pool already set up
+    pool_reused = False
+
+    def _pool(self, conn_params):
+        key = repr(sorted(conn_params.items()))
+        return get_pool(self.alias, key, self.settings_dict.get('POOL', {}))
+
+    def get_new_connection(self, conn_params):
+        pool = self._pool(conn_params)
+        conn, self.pool_reused = pool.acquire(lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params))
+        self._connection_pool = pool
+        # A wrapper dropped with its thread still gives its connection back
+        self._pool_finalizer = weakref.finalize(self, pool.release, conn)
+        self._pool_finalizer.atexit = False
+        self._pool_checked_at = time.monotonic()
+        return conn
+
+    def _close(self):
+        finalizer = getattr(self, '_pool_finalizer', None)
+        if self.connection is None or finalizer is None:
+            return super()._close()
+        if self.in_atomic_block:
+            # Django keeps the closed connection until the atomic block
+            # exits, so it must not be handed to anyone else meanwhile
+            finalizer.detach()
+            self._connection_pool.discard(self.connection)
+            return
+        finalizer()
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        if self.connection is None or self.in_atomic_block:
+            return
+        interval = self.settings_dict.get('POOL', {}).get('HEALTH_CHECK_INTERVAL', DEFAULTS['HEALTH_CHECK_INTERVAL'])
+        now = time.monotonic()
+        if now - self._pool_checked_at > interval:
+            self._pool_checked_at = now
+            if not ping(self.connection):
+                metrics.incr('db_pool.broken')
+                self.close()
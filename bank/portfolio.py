@@ -0,0 +1,166 @@
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Sum
+
+from . import metrics
+from .models import Customer, Investment, RetirementPlan
+from .pagination import keyset_page
+
+# Years ahead at which holdings are projected, compounding annually
+HORIZONS = (1, 5, 10, 20, 30)
+CENT = Decimal('0.01')
+VERSION_KEY = 'portfolio:version'
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _bump():
+    _cache().set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate():
+    """
+    Drop every cached analytic. Like the customer dashboards, the version is
+    bumped now and again on commit so a concurrent reader cannot re-cache
+    figures from before the write.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def _cached(name, build):
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    key = f'portfolio:{name}:{version}'
+    result = cache.get(key)
+    if result is not None:
+        metrics.incr('portfolio_cache.hit')
+        return result
+    metrics.incr('portfolio_cache.miss')
+    result = build()
+    cache.set(key, result, timeout=getattr(settings, 'PORTFOLIO_CACHE_TIMEOUT', 300))
+    return result
+
+
+def _money(value):
+    return Decimal(f'{value:.2f}')
+
+
+def growth_factors(rates, horizons=HORIZONS):
+    """Matrix of ``(1 + rate/100) ** years``, one row per rate and one column per horizon."""
+    return np.power.outer(1 + np.asarray(rates, dtype=float) / 100, np.asarray(horizons, dtype=float))
+
+
+def project(amounts, rates, horizons=HORIZONS):
+    """Total value of ``amounts`` growing at their ``rates`` after each horizon."""
+    return np.asarray(amounts, dtype=float) @ growth_factors(rates, horizons)
+
+
+def _allocation(groups):
+    """
+    Summarize ``(investment_type, return_rate, amount, count)`` groups into
+    the allocation per type, with each type's amount-weighted return rate.
+    """
+    labels = dict(Investment._meta.get_field('investment_type').choices)
+    amounts = defaultdict(Decimal)
+    weighted = defaultdict(Decimal)
+    counts = defaultdict(int)
+    for investment_type, rate, amount, count in groups:
+        amounts[investment_type] += amount
+        weighted[investment_type] += amount * rate
+        counts[investment_type] += count
+    total = sum(amounts.values(), Decimal(0))
+    rows = [
+        {
+            'type': investment_type,
+            'label': labels.get(investment_type, investment_type),
+            'amount': amount,
+            'count': counts[investment_type],
+            'share': (amount * 100 / total).quantize(CENT) if total else Decimal(0),
+            'return_rate': (weighted[investment_type] / amount).quantize(CENT) if amount else Decimal(0),
+        }
+        for investment_type, amount in sorted(amounts.items(), key=lambda item: -item[1])
+    ]
+    return {
+        'total': total,
+        'count': sum(counts.values()),
+        'return_rate': (sum(weighted.values(), Decimal(0)) / total).quantize(CENT) if total else Decimal(0),
+        'allocation': rows,
+    }
+
+
+def _groups(queryset, *keys):
+    # One row per distinct return rate, so projections stay exact without
+    # reading individual holdings
+    return (
+        queryset.values_list(*keys, 'investment_type', 'return_rate')
+        .annotate(total=Sum('amount'), count=Count('id')).order_by()
+    )
+
+
+def _book_summary():
+    groups = list(_groups(Investment.objects.all()))
+    summary = _allocation(groups)
+    values = project([group[2] for group in groups], [group[1] for group in groups])
+    summary['projection'] = [{'years': years, 'value': _money(value)} for years, value in zip(HORIZONS, values)]
+    labels = dict(RetirementPlan._meta.get_field('plan_type').choices)
+    plans = RetirementPlan.objects.values_list('plan_type').annotate(total=Sum('contribution'), count=Count('id')).order_by()
+    summary['retirement'] = [
+        {'label': labels.get(plan_type, plan_type), 'total': total, 'count': count}
+        for plan_type, total, count in sorted(plans)
+    ]
+    summary['retirement_total'] = sum((plan['total'] for plan in summary['retirement']), Decimal(0))
+    return summary
+
+
+def book_summary():
+    """Book-wide allocation, weighted return, projected value and retirement contributions."""
+    return _cached('book', _book_summary)
+
+
+def _customer_page(cursor, size):
+    customers = Customer.objects.filter(Exists(Investment.objects.filter(customer=OuterRef('pk')))).values('id', 'name')
+    rows, next_cursor = keyset_page(customers, ('id',), cursor, size)
+    ids = [row['id'] for row in rows]
+    groups = list(_groups(Investment.objects.filter(customer_id__in=ids), 'customer_id'))
+    contributions = dict(
+        RetirementPlan.objects.filter(customer_id__in=ids)
+        .values_list('customer_id').annotate(total=Sum('contribution')).order_by()
+    )
+
+    # Project every group on the page at once, then sum per customer
+    position = {customer_id: index for index, customer_id in enumerate(ids)}
+    values = np.zeros((len(ids), len(HORIZONS)))
+    if groups:
+        owners = np.array([position[group[0]] for group in groups])
+        amounts = np.array([float(group[3]) for group in groups])
+        np.add.at(values, owners, amounts[:, None] * growth_factors([group[2] for group in groups]))
+
+    by_customer = defaultdict(list)
+    for customer_id, *group in groups:
+        by_customer[customer_id].append(group)
+    for row, projected in zip(rows, values):
+        row.update(_allocation(by_customer[row['id']]))
+        row['projection'] = [_money(value) for value in projected]
+        row['retirement_total'] = contributions.get(row['id'], Decimal(0))
+    return {'customers': rows, 'next_cursor': next_cursor}
+
+
+def customer_page(cursor=None, size=50):
+    """
+    One keyset page of customers holding investments, each with its own
+    allocation, weighted return, projection and retirement contributions.
+    Raises ``InvalidCursor`` for a bad cursor.
+    """
+    return _cached(f'customers:{cursor or ""}:{size}', lambda: _customer_page(cursor, size))
@@ -0,0 +1,158 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from . import dashboard_cache, ledger
+from .models import Account, CreditCardTransaction, Transaction
+
+CENT = Decimal('0.01')
+
+
+class InsufficientFunds(Exception):
+    """Raised when a withdrawal would take an account below zero."""
+
+    def __init__(self, account_id, balance=None):
+        self.account_id = account_id
+        self.balance = balance
+        super().__init__(f'Insufficient funds in account {account_id}')
+
+
+def _checked_amount(amount):
+    """Return ``amount`` as a Decimal, or raise ValueError unless it is a positive number of cents."""
+    amount = Decimal(amount)
+    # NaN cannot be compared and would raise InvalidOperation below
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError('Transaction amount must be positive.')
+    if amount != amount.quantize(CENT):
+        raise ValueError('Transaction amount must have at most two decimal places.')
+    return amount
+
+
+def _signed_amount(transaction_type, amount):
+    """Return the balance delta a transaction applies to its account."""
+    amount = _checked_amount(amount)
+    if transaction_type == 'deposit':
+        return amount
+    if transaction_type == 'withdrawal':
+        return -amount
+    raise ValueError(f'Unknown transaction type: {transaction_type}')
+
+
+def _apply_delta(account_filter, delta):
+    """
+    Apply ``delta`` to the balance of the account matched by ``account_filter``
+    with a single conditional UPDATE. The ``balance >= -delta`` guard is
+    evaluated by the database, so concurrent withdrawals can never overdraw.
+    Returns the number of rows updated.
+    """
+    accounts = Account.objects.filter(**account_filter)
+    if delta < 0:
+        accounts = accounts.filter(balance__gte=-delta)
+    return accounts.update(balance=F('balance') + delta)
+
+
+def _raise_for_failed_update(account_filter):
+    account = Account.objects.filter(**account_filter).only('id', 'balance').first()
+    if account is None:
+        raise Account.DoesNotExist(f'No account matches {account_filter}')
+    raise InsufficientFunds(account.id, account.balance)
+
+
+def post_transaction(account_id, transaction_type, amount, description, customer=None):
+    """
+    Post a single deposit or withdrawal.
+
+    The balance update and the ``Transaction`` insert commit together or not
+    at all. Pass ``customer`` to restrict the posting to that customer's
+    accounts. Raises ``InsufficientFunds`` or ``Account.DoesNotExist``.
+    """
+    delta = _signed_amount(transaction_type, amount)
+    account_filter = {'id': account_id}
+    if customer is not None:
+        account_filter['customer'] = customer
+
+    with transaction.atomic():
+        if not _apply_delta(account_filter, delta):
+            _raise_for_failed_update(account_filter)
+        entry = ledger.record_entry(description, {
+            ledger.account_book(account_id): delta,
+            ledger.CASH_BOOK: -delta,
+        })
+        return Transaction.objects.create(
+            account_id=account_id,
+            # Otherwise looked up from the account when saved
+            customer_id=getattr(customer, 'pk', customer),
+            transaction_type=transaction_type,
+            amount=abs(delta),
+            description=description,
+            journal_entry=entry,
+        )
+
+
+def post_many(postings):
+    """
+    Post a batch of ``(account_id, transaction_type, amount, description)``
+    tuples in one database transaction.
+
+    Postings are netted per account so each account receives exactly one
+    conditional UPDATE, applied in ascending id order to keep lock order
+    stable across workers. Overdraft is checked against the net effect of
+    the batch on each account. The ledger rows are written with a single
+    ``bulk_create`` and share one journal entry carrying a net leg per
+    account. If any account would go negative the whole batch is
+    rolled back and ``InsufficientFunds`` is raised.
+    """
+    deltas = defaultdict(Decimal)
+    rows = []
+    for account_id, transaction_type, amount, description in postings:
+        delta = _signed_amount(transaction_type, amount)
+        deltas[account_id] += delta
+        rows.append(Transaction(
+            account_id=account_id,
+            transaction_type=transaction_type,
+            amount=abs(delta),
+            description=description,
+        ))
+
+    with transaction.atomic():
+        for account_id in sorted(deltas):
+            account_filter = {'id': account_id}
+            if not _apply_delta(account_filter, deltas[account_id]):
+                _raise_for_failed_update(account_filter)
+        owners = dict(Account.objects.filter(id__in=list(deltas)).values_list('id', 'customer_id'))
+        legs = {ledger.account_book(account_id): delta for account_id, delta in deltas.items()}
+        legs[ledger.CASH_BOOK] = -sum(deltas.values(), Decimal(0))
+        entry = ledger.record_entry(f'Batch of {len(rows)} postings', legs)
+        for row in rows:
+            row.journal_entry = entry
+            row.customer_id = owners[row.account_id]
+        Transaction.objects.bulk_create(rows, batch_size=1000)
+        # bulk_create and update() send no signals
+        dashboard_cache.invalidate_many(owners.values())
+    return rows
+
+
+def post_card_transaction(credit_card_id, transaction_type, amount, description):
+    """
+    Record a credit card purchase or payment and its journal entry together.
+    Purchases raise the card's outstanding balance, payments lower it.
+    """
+    amount = _checked_amount(amount)
+    if transaction_type == 'purchase':
+        legs = {ledger.card_book(credit_card_id): amount, ledger.CARD_SETTLEMENT_BOOK: -amount}
+    elif transaction_type == 'payment':
+        legs = {ledger.card_book(credit_card_id): -amount, ledger.CASH_BOOK: amount}
+    else:
+        raise ValueError(f'Unknown transaction type: {transaction_type}')
+
+    with transaction.atomic():
+        entry = ledger.record_entry(description, legs)
+        return CreditCardTransaction.objects.create(
+            credit_card_id=credit_card_id,
+            transaction_type=transaction_type,
+            amount=amount,
+            description=description,
+            journal_entry=entry,
+        )
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('bank.queries')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a view runs more queries than it declared."""
+
+
+class QueryRecorder:
+    """``execute_wrapper`` hook that records each query's SQL and duration."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated_shapes(self, threshold):
+        """
+        Return ``{sql: count}`` for statements run at least ``threshold`` times.
+        The SQL is recorded before parameter interpolation, so a query issued
+        once per row with different ids shows up as one repeated shape.
+        """
+        counts = Counter(sql for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+
+@contextmanager
+def record_queries(using=None):
+    """Record the queries run inside the block on ``using`` (default: all connections)."""
+    recorder = QueryRecorder()
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+def query_budget(max_queries):
+    """
+    Declare the maximum number of queries a view may run. Apply it as the
+    innermost decorator so ``login_required`` and friends copy the budget
+    onto their wrappers.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def check_budget(recorder, budget, label):
+    """Log N+1 shapes and budget overruns; raise in strict mode."""
+    threshold = getattr(settings, 'QUERY_N_PLUS_ONE_THRESHOLD', 5)
+    for sql, count in recorder.repeated_shapes(threshold).items():
+        logger.warning('Possible N+1 in %s: %d x %s', label, count, sql)
+    if budget is not None and recorder.count > budget:
+        message = f'{label} ran {recorder.count} queries, budget is {budget}'
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class QueryCountMiddleware:
+    """
+    Count SQL per request, report it in ``X-Query-Count``/``X-Query-Time``
+    headers and enforce budgets declared with ``@query_budget``. Place it
+    first in ``MIDDLEWARE`` so session and auth queries are included.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Lets Django keep the middleware chain async for async views
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        request.query_budget = None
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        return self._finish(request, recorder, response)
+
+    async def __acall__(self, request):
+        request.query_budget = None
+        with record_queries() as recorder:
+            response = await self.get_response(request)
+        return self._finish(request, recorder, response)
+
+    def _finish(self, request, recorder, response):
+        check_budget(recorder, request.query_budget, request.path)
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time'] = f'{recorder.total_time * 1000:.2f}ms'
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
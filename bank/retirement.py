@@ -0,0 +1,134 @@
+import datetime
+import hashlib
+import json
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, Sum
+
+from . import metrics
+from .models import Customer, Investment, RetirementPlan
+from .underwriting import age_on
+
+PERCENTILES = (10, 25, 50, 75, 90)
+# Annual volatility (percent) assumed for each investment type
+VOLATILITY = {'stocks': 15, 'bonds': 5, 'mutual_funds': 10}
+# Assumed for customers who hold no investments
+DEFAULT_RETURN = 5
+DEFAULT_VOLATILITY = 10
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def return_assumptions(customer_id):
+    """
+    Mean annual return and volatility (percent) of the customer's investment
+    mix, weighting each type's return rate and volatility by amount held.
+    """
+    groups = (
+        Investment.objects.filter(customer_id=customer_id, amount__gt=0)
+        .values_list('investment_type')
+        .annotate(total=Sum('amount'), weighted=Sum(F('amount') * F('return_rate'))).order_by()
+    )
+    total = mean = volatility = 0.0
+    for investment_type, amount, weighted in groups:
+        total += float(amount)
+        mean += float(weighted)
+        volatility += float(amount) * VOLATILITY.get(investment_type, DEFAULT_VOLATILITY)
+    if not total:
+        return DEFAULT_RETURN, DEFAULT_VOLATILITY
+    return round(mean / total, 4), round(volatility / total, 4)
+
+
+def contribution_schedule(contribution, years, growth=0):
+    """Annual contributions for ``years`` years, rising by ``growth`` percent a year."""
+    return float(contribution) * (1 + growth / 100) ** np.arange(years)
+
+
+def simulate(contributions, mean, volatility, paths, rng):
+    """
+    Balances at the end of each year along ``paths`` random return paths,
+    as a ``(paths, years)`` array. Contributions are paid at the start of
+    each year and annual returns are drawn from a normal distribution.
+    """
+    contributions = np.asarray(contributions, dtype=float)
+    # A return can lose at most everything; the floor keeps the division below defined
+    growth = np.maximum(1 + rng.normal(mean / 100, volatility / 100, size=(paths, len(contributions))), 1e-9)
+    # B_t = sum over s <= t of c_s * g_s * ... * g_t, from cumulative products
+    wealth = np.cumprod(growth, axis=1)
+    return wealth * np.cumsum(contributions / (wealth / growth), axis=1)
+
+
+def _digest(inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def project(contributions, mean, volatility, start_age, paths=None):
+    """
+    Percentile outcomes of a contribution schedule, memoized on a hash of
+    every input. The RNG is seeded from the same hash, so a projection is
+    reproducible and a cache miss recomputes the identical result.
+    """
+    paths = paths or getattr(settings, 'RETIREMENT_PATHS', 5000)
+    inputs = {
+        'contributions': [round(float(value), 2) for value in contributions],
+        'mean': mean,
+        'volatility': volatility,
+        'start_age': start_age,
+        'paths': paths,
+        'seed': getattr(settings, 'RETIREMENT_SEED', 0),
+    }
+    digest = _digest(inputs)
+    cache = _cache()
+    key = f'retirement:{digest}'
+    result = cache.get(key)
+    if result is not None:
+        metrics.incr('retirement_cache.hit')
+        return result
+    metrics.incr('retirement_cache.miss')
+
+    rng = np.random.default_rng([inputs['seed'], int(digest[:16], 16)])
+    balances = simulate(inputs['contributions'], mean, volatility, paths, rng)
+    curve = np.percentile(balances, PERCENTILES, axis=0) if len(inputs['contributions']) else np.zeros((len(PERCENTILES), 0))
+    result = {
+        'assumptions': {'mean_return': mean, 'volatility': volatility, 'paths': paths},
+        'contributed': round(sum(inputs['contributions']), 2),
+        'percentiles': {str(p): round(float(values[-1]), 2) if len(values) else 0.0 for p, values in zip(PERCENTILES, curve)},
+        'curve': [
+            {'age': start_age + year + 1, **{str(p): round(float(value), 2) for p, value in zip(PERCENTILES, column)}}
+            for year, column in enumerate(curve.T)
+        ],
+        'hash': digest,
+    }
+    cache.set(key, result, timeout=getattr(settings, 'RETIREMENT_CACHE_TIMEOUT', 3600))
+    return result
+
+
+def customer_projection(customer_id, retirement_age=65, growth=0, paths=None, today=None):
+    """
+    Project every retirement plan of ``customer_id`` from the customer's age
+    to ``retirement_age``, treating each plan's contribution as annual and
+    rising by ``growth`` percent a year. Raises ``Customer.DoesNotExist``.
+    """
+    dob = Customer.objects.values_list('dob', flat=True).get(id=customer_id)
+    age = age_on(dob, today or datetime.date.today())
+    years = max(retirement_age - age, 0)
+    mean, volatility = return_assumptions(customer_id)
+    plans = RetirementPlan.objects.filter(customer_id=customer_id).order_by('id').values_list('id', 'plan_type', 'contribution')
+    return {
+        'customer_id': customer_id,
+        'age': age,
+        'retirement_age': retirement_age,
+        'plans': [
+            {
+                'plan_id': plan_id,
+                'plan_type': plan_type,
+                'contribution': str(contribution),
+                **project(contribution_schedule(contribution, years, growth), mean, volatility, age, paths),
+            }
+            for plan_id, plan_type, contribution in plans
+        ],
+    }
@@ -0,0 +1,57 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# Created by migration 0006 on SQLite builds that ship FTS5
+CUSTOMER_FTS_TABLE = 'bank_customer_fts'
+
+_fts_available = {}
+
+
+def has_customer_fts(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    if using not in _fts_available:
+        with connection.cursor() as cursor:
+            _fts_available[using] = CUSTOMER_FTS_TABLE in connection.introspection.table_names(cursor)
+    return _fts_available[using]
+
+
+def prefix_range(field, prefix):
+    """
+    Match ``field`` values starting with ``prefix`` using a range instead of
+    LIKE, so a plain B-tree index on the column is used on every backend.
+    """
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
+
+
+def _fts_query(term):
+    tokens = re.findall(r'\w+', term)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_customers(queryset, term):
+    """
+    Filter a ``Customer`` queryset to names or emails containing a word that
+    starts with each word of ``term``.
+
+    Uses the FTS5 index on SQLite and trigram-indexed ``ILIKE`` on
+    PostgreSQL; other backends fall back to prefix matching.
+    """
+    term = term.strip()
+    if not term:
+        return queryset
+    if has_customer_fts(queryset.db):
+        match = _fts_query(term)
+        if not match:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {CUSTOMER_FTS_TABLE} WHERE {CUSTOMER_FTS_TABLE} MATCH %s', [match]
+        ))
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.filter(Q(name__icontains=term) | Q(email__icontains=term))
+    return queryset.filter(Q(name__istartswith=term) | prefix_range('email', term.lower()))
@@ -0,0 +1,207 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from . import ledger, portfolio
+from .allocator import allocate_account_numbers, allocate_card_numbers
+from .models import Account, CreditCard, Customer, Investment, Loan, RetirementPlan, Transaction, User
+
+STAFF_ROLES = ('teller', 'loan_officer', 'credit_card_manager', 'financial_advisor', 'admin')
+FIRST_NAMES = (
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Priya', 'Wei',
+    'Ahmed', 'Fatima', 'Carlos', 'Sofia', 'Yuki', 'Olga', 'Kwame', 'Amara', 'Ravi', 'Ana',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee',
+    'Patel', 'Chen', 'Khan', 'Nguyen', 'Kim', 'Sato', 'Ivanova', 'Mensah', 'Okafor', 'Silva',
+)
+DEPOSITS = ('Salary', 'Transfer in', 'Refund', 'Cash deposit')
+WITHDRAWALS = ('Groceries', 'Rent', 'Utilities', 'Restaurant', 'Fuel', 'Online shopping', 'ATM withdrawal', 'Insurance')
+# Loan type -> (median amount, spread, rate range, terms in months)
+LOAN_PROFILES = {
+    'personal': (8000, 0.7, (7, 18), (12, 24, 36, 60)),
+    'auto': (25000, 0.4, (4, 9), (36, 48, 60, 72)),
+    'mortgage': (300000, 0.5, (3, 7), (180, 240, 360)),
+}
+INVESTMENT_RATES = {'stocks': (6, 12), 'bonds': (2, 5), 'mutual_funds': (4, 9)}
+CENT = Decimal('0.01')
+
+
+def _backdate(queryset, timestamps, field='created_at'):
+    """
+    Set ``field`` of the rows of ``queryset``, in id order, to
+    ``timestamps``. ``bulk_create`` stamps an ``auto_now`` field with the
+    current time, so the history's own times are applied after the insert.
+    """
+    ids = list(queryset.order_by('id').values_list('id', flat=True))
+    if len(ids) != len(timestamps):
+        raise ValueError(f'Expected {len(timestamps)} rows to backdate, found {len(ids)}.')
+    for start in range(0, len(ids), 500):
+        chunk = zip(ids[start:start + 500], timestamps[start:start + 500])
+        queryset.model.objects.filter(id__in=ids[start:start + 500]).update(**{field: Case(
+            *[When(id=pk, then=Value(at)) for pk, at in chunk],
+            output_field=DateTimeField(),
+        )})
+
+
+def _money(value):
+    return Decimal(value).quantize(CENT)
+
+
+def username(seed, index):
+    # Zero-padded so a chunk's rows form one contiguous range
+    return f'seed{seed}_{index:09d}'
+
+
+def _pick(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _history(rng, now, transactions_per_account):
+    """A year of chronological ``(type, amount, description, at)`` that never overdraws."""
+    count = rng.randint(0, 2 * transactions_per_account)
+    times = sorted(now - datetime.timedelta(seconds=rng.randrange(365 * 86400)) for _ in range(count + 1))
+    events = [('deposit', _money(rng.lognormvariate(7.5, 0.8)), 'Opening deposit', times[0])]
+    balance = events[0][1]
+    for at in times[1:]:
+        if rng.random() < 0.35:
+            amount = _money(rng.lognormvariate(7, 0.6))
+            events.append(('deposit', amount, rng.choice(DEPOSITS), at))
+            balance += amount
+        else:
+            amount = min(_money(rng.lognormvariate(3.8, 1.1)), balance)
+            if amount > 0:
+                events.append(('withdrawal', amount, rng.choice(WITHDRAWALS), at))
+                balance -= amount
+    return events, balance
+
+
+def staff_users(seed, password_hash):
+    """One user per staff role, created once and shared by every chunk."""
+    users = {}
+    for role in STAFF_ROLES:
+        users[role], _ = User.objects.get_or_create(
+            username=f'seed{seed}_{role}', defaults={'role': role, 'password': password_hash, 'email': f'{role}@example.com'})
+    return users
+
+
+def _seed_chunk(seed, first, last, password_hash, transactions_per_account):
+    rng = random.Random(f'{seed}:{first}')
+    now = timezone.now()
+    today = now.date()
+    names = [username(seed, index) for index in range(first, last)]
+
+    User.objects.bulk_create([
+        User(username=name, email=f'{name}@example.com', password=password_hash, role='customer') for name in names
+    ])
+    user_ids = list(User.objects.filter(username__gte=names[0], username__lte=names[-1]).order_by('username').values_list('id', flat=True))
+    Customer.objects.bulk_create([
+        Customer(
+            user_id=user_id,
+            name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            email=f'{name}@example.com',
+            dob=today - datetime.timedelta(days=int(365.25 * min(max(rng.gauss(44, 15), 18), 90))),
+            phone_number=f'555{rng.randrange(10 ** 7):07d}',
+        )
+        for name, user_id in zip(names, user_ids)
+    ])
+    customer_ids = list(
+        Customer.objects.filter(user__username__gte=names[0], user__username__lte=names[-1])
+        .order_by('user__username').values_list('id', flat=True))
+
+    # Accounts, with their histories generated first so each is created
+    # holding the balance its transactions add up to
+    accounts = []
+    for customer_id in customer_ids:
+        types = ['checking'] if rng.random() < 0.9 else []
+        if not types or rng.random() < 0.55:
+            types.append('savings')
+        accounts.extend((customer_id, account_type, *_history(rng, now, transactions_per_account)) for account_type in types)
+    numbers = allocate_account_numbers(len(accounts))
+    Account.objects.bulk_create([
+        Account(customer_id=customer_id, account_number=number, account_type=account_type, balance=balance)
+        for number, (customer_id, account_type, _, balance) in zip(numbers, accounts)
+    ], batch_size=1000)
+    account_ids = dict(Account.objects.filter(account_number__in=numbers).values_list('account_number', 'id'))
+
+    # One journal entry carries the net leg of every account, as post_many does
+    legs = {ledger.account_book(account_ids[number]): balance for number, (_, _, _, balance) in zip(numbers, accounts)}
+    legs[ledger.CASH_BOOK] = -sum(legs.values(), Decimal(0))
+    entry = ledger.record_entry(f'Seed {seed} customers {first}-{last - 1}', legs)
+    rows = [
+        Transaction(account_id=account_ids[number], customer_id=customer_id, transaction_type=kind,
+                    amount=amount, description=description, journal_entry=entry)
+        for number, (customer_id, _, events, _) in zip(numbers, accounts)
+        for kind, amount, description, _ in events
+    ]
+    # Inserted in this order, so the entry's rows in id order match it
+    Transaction.objects.bulk_create(rows, batch_size=1000)
+    _backdate(Transaction.objects.filter(journal_entry=entry), [at for _, _, events, _ in accounts for *_, at in events])
+
+    loans, cards, investments, plans = [], [], [], []
+    for customer_id in customer_ids:
+        if rng.random() < 0.3:
+            loan_type = _pick(rng, {'personal': 5, 'auto': 3, 'mortgage': 2})
+            median, spread, rates, terms = LOAN_PROFILES[loan_type]
+            loans.append(Loan(
+                customer_id=customer_id, loan_type=loan_type,
+                amount=_money(rng.lognormvariate(0, spread) * median),
+                interest_rate=_money(rng.uniform(*rates)), term_months=rng.choice(terms),
+                status=_pick(rng, {'approved': 65, 'pending': 20, 'rejected': 15}),
+            ))
+        if rng.random() < 0.5:
+            cards.append((customer_id, _pick(rng, {'standard': 7, 'reward': 3}),
+                          _money(rng.choice((1000, 2500, 5000, 10000, 20000))),
+                          _pick(rng, {'active': 80, 'pending': 12, 'rejected': 8})))
+        if rng.random() < 0.25:
+            for investment_type in rng.sample(list(INVESTMENT_RATES), rng.randint(1, 3)):
+                investments.append(Investment(
+                    customer_id=customer_id, investment_type=investment_type,
+                    amount=_money(rng.lognormvariate(9, 1)), return_rate=_money(rng.uniform(*INVESTMENT_RATES[investment_type]))))
+        if rng.random() < 0.2:
+            plans.append(RetirementPlan(customer_id=customer_id, plan_type=_pick(rng, {'401k': 6, 'ira': 4}),
+                                        contribution=_money(rng.choice((1200, 3000, 6000, 12000, 22500)))))
+    Loan.objects.bulk_create(loans, batch_size=1000)
+    CreditCard.objects.bulk_create([
+        CreditCard(customer_id=customer_id, card_number=number, card_type=card_type, credit_limit=limit,
+                   status=status, cvv=f'{rng.randrange(1000):03d}')
+        for number, (customer_id, card_type, limit, status) in zip(allocate_card_numbers(len(cards)), cards)
+    ], batch_size=1000)
+    Investment.objects.bulk_create(investments, batch_size=1000)
+    RetirementPlan.objects.bulk_create(plans, batch_size=1000)
+
+
+def seed_bank(customers, seed=0, chunk_size=1000, transactions_per_account=20, password='seed-password-1', progress=None):
+    """
+    Create ``customers`` customers with accounts, a year of transactions,
+    loans, cards, investments and retirement plans, plus one user per
+    staff role, all sharing ``password``.
+
+    Each chunk draws from its own RNG seeded by ``seed`` and the chunk's
+    position, and commits on its own. The same seed always produces the
+    same bank, and rerunning skips chunks already seeded. ``progress`` is
+    called with the number of customers done after each chunk. Returns the
+    customers created.
+    """
+    # One hash for every seeded user: hashing millions would take hours
+    password_hash = make_password(password, salt=f'seed{seed}bank')
+    staff_users(seed, password_hash)
+    created = 0
+    for first in range(0, customers, chunk_size):
+        last = min(first + chunk_size, customers)
+        if not User.objects.filter(username=username(seed, last - 1)).exists():
+            with transaction.atomic():
+                _seed_chunk(seed, first, last, password_hash, transactions_per_account)
+            created += last - first
+        if progress:
+            progress(last)
+    # bulk_create sends no signals
+    portfolio.invalidate()
+    return created
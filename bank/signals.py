@@ -0,0 +1,76 @@
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import authorization, dashboard_cache, identity, images, portfolio, throttle
+from .models import Account, Customer, CreditCard, Investment, Loan, RetirementPlan, Transaction, User
+
+CUSTOMER_OWNED = (Account, Loan, CreditCard, Investment, RetirementPlan)
+
+
+def invalidate_owner_dashboard(sender, instance, **kwargs):
+    dashboard_cache.invalidate(instance.customer_id)
+
+
+for model in CUSTOMER_OWNED:
+    post_save.connect(invalidate_owner_dashboard, sender=model, dispatch_uid=f'dashboard_{model.__name__}_save')
+    post_delete.connect(invalidate_owner_dashboard, sender=model, dispatch_uid=f'dashboard_{model.__name__}_delete')
+
+
+@receiver(pre_save, sender=Transaction, dispatch_uid='transaction_customer')
+def copy_transaction_customer(sender, instance, **kwargs):
+    if instance.customer_id is None:
+        instance.customer_id = Account.objects.filter(id=instance.account_id).values_list('customer_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Transaction, dispatch_uid='dashboard_transaction')
+def invalidate_transaction_dashboard(sender, instance, **kwargs):
+    dashboard_cache.invalidate(instance.customer_id)
+
+
+@receiver([post_save, post_delete], sender=Customer, dispatch_uid='dashboard_customer')
+def invalidate_customer_dashboard(sender, instance, **kwargs):
+    dashboard_cache.invalidate(instance.id)
+    identity.invalidate(instance.user_id)
+    # Advisor drill-down pages show customer names
+    portfolio.invalidate()
+
+
+@receiver(pre_save, sender=Customer, dispatch_uid='profile_picture_store')
+def store_profile_picture(sender, instance, **kwargs):
+    images.store_upload(instance.profile_picture)
+
+
+@receiver(post_save, sender=Customer, dispatch_uid='profile_picture_thumbnails')
+def schedule_thumbnails(sender, instance, **kwargs):
+    name = instance.profile_picture.name
+    if name:
+        transaction.on_commit(lambda: images.schedule(name))
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid='identity_user')
+def invalidate_identity(sender, instance, **kwargs):
+    identity.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=CreditCard, dispatch_uid='authorization_card')
+def forget_card_escrow(sender, instance, **kwargs):
+    # A changed limit or status applies to this process's approvals at once
+    authorization.forget(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Investment, dispatch_uid='portfolio_investment')
+@receiver([post_save, post_delete], sender=RetirementPlan, dispatch_uid='portfolio_retirement_plan')
+def invalidate_portfolio(sender, instance, **kwargs):
+    portfolio.invalidate()
+
+
+@receiver(user_login_failed, dispatch_uid='throttle_login_failed')
+def count_login_failure(sender, credentials, request=None, **kwargs):
+    throttle.record_failure(credentials.get('username'), throttle.client_ip(request))
+
+
+@receiver(user_logged_in, dispatch_uid='throttle_logged_in')
+def clear_login_failures(sender, request, user, **kwargs):
+    throttle.reset(user.get_username(), throttle.client_ip(request))
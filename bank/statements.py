@@ -0,0 +1,231 @@
+import datetime
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import Sum
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import CreditCard, CreditCardTransaction, Statement, StatementPartition, StatementRun
+
+CENT = Decimal('0.01')
+# Cards whose cycle transactions are read with one query
+STREAM_SLICE = 500
+
+
+class PreviousRunIncomplete(RuntimeError):
+    """Raised when a cycle would open from the statements of a run that has not finished."""
+
+
+def _start_of_day(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+def _default_period_start(period_end):
+    previous = StatementRun.objects.filter(period_end__lt=period_end).order_by('-period_end').first()
+    if previous is not None:
+        return previous.period_end + datetime.timedelta(days=1)
+    return period_end.replace(day=1)
+
+
+def start_run(period_end, partition_size=10000):
+    """
+    Return the run for the cycle ending on ``period_end``, creating it and
+    splitting the active cards into id ranges of ``partition_size`` on
+    first use. Cycles follow on from the previous run.
+    """
+    with transaction.atomic():
+        run, created = StatementRun.objects.get_or_create(
+            period_end=period_end, defaults={'period_start': _default_period_start(period_end)})
+        if not created:
+            return run
+        ids = (
+            CreditCard.objects.filter(status='active').order_by('id')
+            .values_list('id', flat=True).iterator(chunk_size=partition_size)
+        )
+        partitions = []
+        while True:
+            chunk = list(islice(ids, partition_size))
+            if not chunk:
+                break
+            partitions.append(StatementPartition(run=run, first_card_id=chunk[0], last_card_id=chunk[-1]))
+        StatementPartition.objects.bulk_create(partitions, batch_size=1000)
+    return run
+
+
+def interest_for(opening_balance, payments):
+    """Interest on the part of the opening balance left unpaid during the cycle."""
+    revolving = max(opening_balance - payments, Decimal(0))
+    apr = Decimal(str(getattr(settings, 'CARD_APR', 24)))
+    return (revolving * apr / 1200).quantize(CENT, ROUND_HALF_UP)
+
+
+def minimum_due(closing_balance, interest):
+    if closing_balance <= 0:
+        return Decimal('0.00')
+    floor = Decimal(str(getattr(settings, 'CARD_MINIMUM_PAYMENT', 25)))
+    due = max(floor, (closing_balance / 100).quantize(CENT, ROUND_HALF_UP) + interest)
+    return min(closing_balance, due)
+
+
+def _previous_run(before):
+    """
+    The latest run ending before ``before``, if any. Raises
+    ``PreviousRunIncomplete`` if it has not finished, since cards it has no
+    statement for yet would otherwise open at zero.
+    """
+    previous = StatementRun.objects.filter(period_end__lt=before).order_by('-period_end').first()
+    if previous is not None and previous.status != 'done':
+        raise PreviousRunIncomplete(f'{previous} has not finished; complete it before the next cycle.')
+    return previous
+
+
+def _opening_balances(run, first_card_id, last_card_id):
+    """Closing balances of the previous cycle, or the posted history before this one."""
+    previous = _previous_run(run.period_start)
+    if previous is not None:
+        return dict(
+            Statement.objects.filter(run=previous, credit_card_id__gte=first_card_id, credit_card_id__lte=last_card_id)
+            .values_list('credit_card_id', 'closing_balance')
+        )
+    balances = {}
+    history = (
+        CreditCardTransaction.objects
+        .filter(credit_card_id__gte=first_card_id, credit_card_id__lte=last_card_id, created_at__lt=_start_of_day(run.period_start))
+        .values('credit_card_id', 'transaction_type').annotate(total=Sum('amount')).order_by()
+    )
+    for row in history:
+        sign = 1 if row['transaction_type'] == 'purchase' else -1
+        balances[row['credit_card_id']] = balances.get(row['credit_card_id'], 0) + sign * row['total']
+    return balances
+
+
+def _cycle_transactions(run, first_card_id, last_card_id):
+    """Stream the cycle's transactions for a card range, ordered by card."""
+    return (
+        CreditCardTransaction.objects
+        .filter(
+            credit_card_id__gte=first_card_id, credit_card_id__lte=last_card_id,
+            created_at__gte=_start_of_day(run.period_start),
+            created_at__lt=_start_of_day(run.period_end + datetime.timedelta(days=1)),
+        )
+        .order_by('credit_card_id', 'created_at', 'id')
+        .values_list('credit_card_id', 'created_at', 'transaction_type', 'amount', 'description')
+        .iterator(chunk_size=2000)
+    )
+
+
+def _statement(run, card_id, opening, lines, due_date):
+    """Return the unsaved statement for one card, or None if it had no balance or activity."""
+    if not lines and not opening:
+        return None
+    purchases = sum((line[3] for line in lines if line[2] == 'purchase'), Decimal(0))
+    payments = sum((line[3] for line in lines if line[2] == 'payment'), Decimal(0))
+    interest = interest_for(opening, payments)
+    closing = opening + purchases - payments + interest
+    return Statement(
+        run=run,
+        credit_card_id=card_id,
+        opening_balance=opening,
+        purchases=purchases,
+        payments=payments,
+        interest=interest,
+        closing_balance=closing,
+        minimum_due=minimum_due(closing, interest),
+        due_date=due_date,
+    )
+
+
+def artifact_name(run, card_id):
+    return f'statements/{run.period_end:%Y-%m-%d}/{card_id}.html'
+
+
+def _write_artifact(name, html):
+    # Overwrite rather than letting the storage pick a fresh name, so a
+    # retried partition replaces its own files
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(html.encode()))
+
+
+def generate_partition(partition_id):
+    """
+    Build the statements of one partition and mark it done, replacing any
+    statements a failed attempt left behind. Finished partitions are
+    skipped. Returns the number of statements written.
+    """
+    partition = StatementPartition.objects.select_related('run').get(id=partition_id)
+    if partition.status == 'done':
+        return partition.statements
+    run = partition.run
+    card_range = (partition.first_card_id, partition.last_card_id)
+    cards = list(CreditCard.objects.filter(status='active', id__range=card_range).order_by('id').values_list(
+        'id', 'card_number', 'credit_limit', 'customer__name'))
+    openings = _opening_balances(run, *card_range)
+    template = get_template('statement.html')
+    due_date = run.period_end + datetime.timedelta(days=getattr(settings, 'CARD_PAYMENT_DAYS', 25))
+
+    statements = []
+    for start in range(0, len(cards), STREAM_SLICE):
+        card_slice = cards[start:start + STREAM_SLICE]
+        # Drain each slice's cursor before rendering, so no read is held
+        # open while other workers wait to commit
+        lines_by_card = defaultdict(list)
+        for row in _cycle_transactions(run, card_slice[0][0], card_slice[-1][0]):
+            lines_by_card[row[0]].append(row)
+        for card_id, card_number, credit_limit, customer_name in card_slice:
+            statement = _statement(run, card_id, Decimal(openings.get(card_id) or 0), lines_by_card.get(card_id, []), due_date)
+            if statement is None:
+                continue
+            statement.artifact.name = _write_artifact(artifact_name(run, card_id), template.render({
+                'run': run,
+                'statement': statement,
+                'card_number': card_number[-4:],
+                'credit_limit': credit_limit,
+                'customer_name': customer_name,
+                'lines': [
+                    (created_at.date().isoformat(), description, transaction_type.capitalize(), amount)
+                    for _, created_at, transaction_type, amount, description in lines_by_card.get(card_id, [])
+                ],
+            }))
+            statements.append(statement)
+
+    with transaction.atomic():
+        Statement.objects.filter(run=run, credit_card_id__gte=card_range[0], credit_card_id__lte=card_range[1]).delete()
+        Statement.objects.bulk_create(statements, batch_size=1000)
+        partition.status = 'done'
+        partition.statements = len(statements)
+        partition.finished_at = timezone.now()
+        partition.save(update_fields=['status', 'statements', 'finished_at'])
+    return len(statements)
+
+
+def run_statements(period_end, workers=0, partition_size=10000):
+    """
+    Generate every statement for the cycle ending ``period_end``. Only
+    unfinished partitions are processed, so a crashed run picks up where it
+    stopped. ``workers`` > 0 spreads partitions over a process pool.
+    Raises ``PreviousRunIncomplete`` unless the previous cycle's run has
+    finished. Returns the run.
+    """
+    _previous_run(period_end)
+    run = start_run(period_end, partition_size)
+    pending = list(run.partitions.exclude(status='done').order_by('first_card_id').values_list('id', flat=True))
+    if workers and pending:
+        # Forked children must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(generate_partition, pending))
+    else:
+        for partition_id in pending:
+            generate_partition(partition_id)
+    if not run.partitions.exclude(status='done').exists():
+        StatementRun.objects.filter(id=run.id).update(status='done', finished_at=timezone.now())
+        run.refresh_from_db()
+    return run
@@ -0,0 +1,26 @@
+from django import template
+from django.utils.html import format_html
+
+from bank import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def profile_picture(field_file, size=150, css_class='img-fluid rounded-circle'):
+    """
+    ``<picture>`` of the WebP thumbnail (2x where there is one) with a JPEG
+    fallback. Until the thumbnails exist the original is shown, scaled down,
+    and they are queued.
+    """
+    urls = images.thumbnail_urls(field_file.name, size)
+    if urls is None:
+        images.schedule(field_file.name)
+        return format_html(
+            '<img src="{}" alt="Profile Picture" class="{}" width="{}" height="{}">',
+            field_file.url, css_class, size, size)
+    srcset = urls['webp'] + (f", {urls['webp_2x']} 2x" if 'webp_2x' in urls else '')
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" alt="Profile Picture" class="{}" width="{}" height="{}" loading="lazy"></picture>',
+        srcset, urls['jpg'], css_class, size, size)
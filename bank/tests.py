@@ -1,3 +1,1376 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+import warnings
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+import numpy
+from PIL import Image as PILImage
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Max, Min, Q, Sum
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import User, Customer, Account, AccrualWatermark, BalanceSnapshot, CardEscrow, CardHold, ExportWatermark, JournalEntry, JournalLeg, LedgerBalance, Loan, LoanSchedule, NumberSequence, CreditCard, CreditCardTransaction, Investment, RetirementPlan, OutboundEmail, Statement, StatementPartition, Transaction
+from . import accrual, allocator, amortization, authorization, dashboard_cache, database, identity, images, ledger, loadtest, metrics, outbox, pooling, posting, portfolio, retirement, statements, throttle, views, warehouse
+from .authorization import Authorizer
+from .decisions import decide_loans
+from .onboarding import import_customers, read_rows
+from .posting import InsufficientFunds, post_card_transaction, post_many, post_transaction
+from .querycount import record_queries
+from .seeding import seed_bank
+from .statements import run_statements
+from .underwriting import CardUnderwriter, LoanUnderwriter, RuleError, RuleSet
+
+
+def make_customer(index):
+    user = User.objects.create_user(username=f'customer{index}', password='secret-pass-1', role='customer')
+    customer = Customer.objects.create(
+        user=user,
+        name=f'Customer {index}',
+        email=f'customer{index}@example.com',
+        dob=datetime.date(1990, 1, 1),
+    )
+    account = Account.objects.create(customer=customer, account_type='savings')
+    Loan.objects.create(customer=customer, loan_type='personal', amount=1000, interest_rate=10, term_months=12)
+    CreditCard.objects.create(customer=customer, credit_limit=5000, card_type='standard')
+    Investment.objects.create(customer=customer, investment_type='stocks', amount=1000, return_rate=8)
+    RetirementPlan.objects.create(customer=customer, plan_type='ira', contribution=100)
+    post_transaction(account.id, 'deposit', Decimal('100'), 'Opening deposit')
+    return customer
+
+
+class BankTestCase(TestCase):
+    def setUp(self):
+        # Cached state survives the per-test rollback, so start clean
+        cache.clear()
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class DashboardQueryCountTests(BankTestCase):
+    """Every dashboard must run the same number of queries for 1 row or many."""
+
+    staff_dashboards = [
+        ('teller', 'teller_dashboard'),
+        ('loan_officer', 'loan_officer_dashboard'),
+        ('credit_card_manager', 'credit_card_manager_dashboard'),
+        ('financial_advisor', 'financial_advisor_dashboard'),
+        ('admin', 'admin_dashboard'),
+    ]
+
+    def count_queries(self, url_name):
+        with record_queries() as recorder:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Query-Count'], str(recorder.count))
+        return recorder.count
+
+    def assert_constant(self, url_name, login):
+        make_customer(0)
+        login()
+        # The first request caches the session and the user's identity
+        self.client.get(reverse('dashboard'))
+        baseline = self.count_queries(url_name)
+        for index in range(1, 6):
+            make_customer(index)
+        self.assertEqual(self.count_queries(url_name), baseline, url_name)
+
+    def test_staff_dashboards(self):
+        for role, url_name in self.staff_dashboards:
+            with self.subTest(url_name):
+                User.objects.create_user(username=role, password='secret-pass-1', role=role)
+                self.assert_constant(url_name, lambda: self.client.login(username=role, password='secret-pass-1'))
+                Customer.objects.all().delete()
+                User.objects.exclude(role=role).delete()
+
+    def test_customer_pages(self):
+        customer = make_customer(0)
+        account = customer.account_set.get()
+        self.client.login(username='customer0', password='secret-pass-1')
+        names = ('customer_dashboard', 'transaction_list')
+        # Measure the cold (uncached) path both times
+        cache.clear()
+        baseline = {name: self.count_queries(name) for name in names}
+        for index in range(10):
+            post_transaction(account.id, 'deposit', Decimal('1'), f'Deposit {index}')
+        Account.objects.create(customer=customer, account_type='checking')
+        cache.clear()
+        for name, count in baseline.items():
+            self.assertEqual(self.count_queries(name), count, name)
+
+
+class TellerSearchTests(BankTestCase):
+    def setUp(self):
+        super().setUp()
+        User.objects.create_user(username='teller', password='secret-pass-1', role='teller')
+        self.client.login(username='teller', password='secret-pass-1')
+        self.customers = [make_customer(index) for index in range(3)]
+        Customer.objects.filter(id=self.customers[1].id).update(name='Alice Walker', phone_number='5551234')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('teller_dashboard'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_name_and_email_prefix(self):
+        self.assertEqual([c.name for c in self.search('ali')['customers']], ['Alice Walker'])
+        self.assertEqual([c.email for c in self.search('customer2')['customers']], ['customer2@example.com'])
+
+    def test_phone_and_account_number(self):
+        self.assertEqual([c.name for c in self.search('555')['customers']], ['Alice Walker'])
+        account = self.customers[2].account_set.get()
+        context = self.search(account.account_number)
+        self.assertEqual(list(context['accounts']), [account])
+
+    def test_pagination_covers_every_customer(self):
+        seen, cursor = [], ''
+        while True:
+            context = self.search('', limit=1, sort='-name', cursor=cursor)
+            seen += [c.name for c in context['customers']]
+            cursor = context['next_customer_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, sorted(Customer.objects.values_list('name', flat=True), reverse=True))
+
+
+class ImportCustomersTests(BankTestCase):
+    def test_import_creates_customers_accounts_and_queued_credentials(self):
+        make_customer(0)
+        rows = [
+            (2, {'name': 'New Customer', 'email': 'customer0@other.com', 'dob': '1985-04-01', 'account_type': 'savings'}),
+            (3, {'name': 'Bad Date', 'email': 'bad@example.com', 'dob': 'not-a-date'}),
+            (4, {'name': 'Existing', 'email': 'customer0@example.com', 'dob': '1985-04-01'}),
+        ]
+        result = import_customers(rows, chunk_size=2)
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual([error['line'] for error in result.errors], [3, 4])
+        customer = Customer.objects.get(email='customer0@other.com')
+        self.assertEqual(customer.user.username, 'customer02')
+        self.assertEqual(customer.account_set.get().account_type, 'savings')
+        self.assertEqual(OutboundEmail.objects.get().to_email, 'customer0@other.com')
+
+    def test_unreadable_ndjson_lines_are_reported_as_row_errors(self):
+        stream = io.BytesIO(b'\n'.join([
+            b'{"name": "First", "email": "first@example.com", "dob": "1985-04-01"}',
+            b'["not", "an", "object"]',
+            b'{"name": "Broken", ',
+            b'42',
+            b'{"name": "Last", "email": "last@example.com", "dob": "1985-04-01"}',
+        ]))
+        result = import_customers(read_rows(stream, 'ndjson'), chunk_size=2)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual([(error['line'], error['errors']['__all__'][0]['message']) for error in result.errors], [
+            (2, 'Expected a JSON object.'), (3, 'Invalid JSON.'), (4, 'Expected a JSON object.')])
+
+        User.objects.create_user(username='teller', password='secret-pass-1', role='teller')
+        self.client.login(username='teller', password='secret-pass-1')
+        upload = SimpleUploadedFile('customers.ndjson', b'[1]\n"text"\n')
+        response = self.client.post(reverse('import_customers'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 0)
+        self.assertEqual(len(response.json()['errors']), 2)
+
+
+class OutboxTests(BankTestCase):
+    def test_drain_delivers_batch_and_marks_sent(self):
+        for index in range(3):
+            outbox.enqueue(f'user{index}@example.com', 'Hello', 'Body')
+        self.assertEqual(outbox.drain(batch_size=10), (3, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(OutboundEmail.objects.filter(status='sent').count(), 3)
+        # Credential emails are not kept once delivered
+        self.assertFalse(OutboundEmail.objects.exclude(body='').exists())
+        self.assertEqual(outbox.drain(), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='bank.tests.FailingEmailBackend')
+    def test_failures_back_off_then_give_up(self):
+        message = outbox.enqueue('user@example.com', 'Hello', 'Body')
+        self.assertEqual(outbox.drain(max_attempts=2), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertEqual(outbox.drain(max_attempts=2), (0, 0))
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        outbox.drain(max_attempts=2)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('failed', 2))
+        self.assertEqual(message.body, '')
+        self.assertIn('SMTP unavailable', message.last_error)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise OSError('SMTP unavailable')
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class BulkDecisionTests(BankTestCase):
+    def setUp(self):
+        super().setUp()
+        for index in range(3):
+            make_customer(index)
+        User.objects.create_user(username='officer', password='secret-pass-1', role='loan_officer')
+        self.client.login(username='officer', password='secret-pass-1')
+
+    def post_decisions(self, decisions):
+        return self.client.post(reverse('loan_decisions'), json.dumps({'decisions': decisions}),
+                                content_type='application/json')
+
+    def test_bulk_decisions_only_touch_pending_loans(self):
+        first, second, third = Loan.objects.order_by('id').values_list('id', flat=True)
+        response = self.post_decisions([
+            {'id': first, 'action': 'approve'},
+            {'id': second, 'action': 'reject'},
+            {'id': 999999, 'action': 'approve'},
+            {'id': third, 'action': 'escalate'},
+        ])
+        self.assertEqual(response.json(), {
+            'changed': {'approved': [first], 'rejected': [second]},
+            'updated': 2,
+            'skipped': [999999],
+            'invalid': [{'id': third, 'action': 'escalate'}],
+        })
+        # A decided loan is never flipped by a later, conflicting decision
+        response = self.post_decisions([{'id': first, 'action': 'reject'}, {'id': third, 'action': 'approve'}])
+        self.assertEqual(response.json()['changed'], {'approved': [third]})
+        self.assertEqual(response.json()['skipped'], [first])
+        self.assertEqual(Loan.objects.get(id=first).status, 'approved')
+
+        response = self.client.get(reverse('loan_decisions'), {'status': 'approved'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [first, third])
+
+    def test_dashboard_queue_is_paginated_and_accepts_bulk_posts(self):
+        ids = list(Loan.objects.order_by('id').values_list('id', flat=True))
+        response = self.client.get(reverse('loan_officer_dashboard'), {'limit': 2})
+        self.assertEqual([loan.id for loan in response.context['loans']], ids[:2])
+        response = self.client.get(reverse('loan_officer_dashboard'), {'limit': 2, 'cursor': response.context['next_cursor']})
+        self.assertEqual([loan.id for loan in response.context['loans']], ids[2:])
+
+        self.client.post(reverse('loan_officer_dashboard'), {'loan_id': ids[:2], 'action': 'reject'})
+        self.assertEqual(list(Loan.objects.filter(status='rejected').order_by('id').values_list('id', flat=True)), ids[:2])
+
+    def test_decisions_invalidate_the_customer_dashboard(self):
+        loan = Loan.objects.select_related('customer__user').first()
+        self.client.login(username=loan.customer.user.username, password='secret-pass-1')
+        self.client.get(reverse('customer_dashboard'))
+        decide_loans([{'id': loan.id, 'action': 'approve'}])
+        response = self.client.get(reverse('customer_dashboard'))
+        self.assertEqual(response.context['loans'][0].status, 'approved')
+
+
+class UnderwritingTests(BankTestCase):
+    def test_rules_approve_refer_and_reject_in_one_run(self):
+        rich, poor, minor = make_customer(0), make_customer(1), make_customer(2)
+        Account.objects.filter(customer=rich).update(balance=100000)
+        Account.objects.filter(customer=poor).update(balance=10)
+        Customer.objects.filter(id=minor.id).update(dob=datetime.date.today() - datetime.timedelta(days=365 * 10))
+        Loan.objects.create(customer=rich, loan_type='personal', amount=60000, interest_rate=10, term_months=12)
+        CreditCard.objects.create(customer=rich, credit_limit=20000, card_type='standard')
+
+        with record_queries() as recorder:
+            outcomes, rules = LoanUnderwriter().run()
+        # Applications, ages, loan and card exposure, balances, lock, update,
+        # then the empty read that ends the run
+        self.assertEqual(recorder.count, 8)
+        self.assertEqual(outcomes, {'approve': 1, 'refer': 1, 'reject': 2})
+        self.assertEqual(rules, {'personal_limit': 1, 'minimum_age': 1, 'balance_cover': 1})
+        self.assertEqual(
+            dict(Loan.objects.values_list('customer__name', 'status').filter(amount=1000)),
+            {'Customer 0': 'approved', 'Customer 1': 'pending', 'Customer 2': 'rejected'},
+        )
+
+        outcomes, rules = CardUnderwriter().run(dry_run=True)
+        self.assertEqual(outcomes, {'approve': 1, 'refer': 1, 'reject': 2})
+        self.assertFalse(CreditCard.objects.exclude(status='pending').exists())
+
+    def test_invalid_rules_are_rejected_when_compiled(self):
+        with self.assertRaises(RuleError):
+            RuleSet([{'name': 'broken', 'field': 'age', 'op': '~', 'value': 1, 'outcome': 'reject'}])
+        for rule in [
+            {'name': 'typo', 'field': 'ammount', 'op': '<=', 'value': 1, 'outcome': 'reject'},
+            {'name': 'bad_when', 'when': {'loan_kind': 'auto'}, 'field': 'amount', 'op': '<=', 'value': 1, 'outcome': 'reject'},
+            {'name': 'card_field', 'field': 'credit_limit', 'op': '<=', 'value': 1, 'outcome': 'reject'},
+            {'name': 'when_list', 'when': ['loan_type'], 'field': 'amount', 'op': '<=', 'value': 1, 'outcome': 'reject'},
+        ]:
+            with self.subTest(rule=rule['name']), self.assertRaises(RuleError):
+                LoanUnderwriter([rule])
+        with override_settings(CREDIT_RULES={'card': [{'name': 'typo', 'field': 'limit', 'op': '<=', 'value': 1, 'outcome': 'reject'}]}):
+            with self.assertRaisesRegex(RuleError, 'unknown features limit'):
+                CardUnderwriter()
+        LoanUnderwriter([{'name': 'ok', 'when': {'loan_type': 'auto'}, 'field': 'exposure_to_balance', 'op': '<=', 'value': 1, 'outcome': 'refer'}])
+
+
+class CardAuthorizationTests(BankTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = make_customer(0)
+        self.card = self.customer.creditcard_set.get()
+        CreditCard.objects.filter(id=self.card.id).update(status='active', credit_limit=100)
+        self.authorizer = Authorizer(batch_size=3, flush_interval=0)
+        patcher = mock.patch.object(authorization, '_authorizer', self.authorizer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def held(self):
+        return LedgerBalance.objects.get(book=ledger.card_book(self.card.id)).held
+
+    def test_approvals_spend_escrow_locally_and_post_in_batches(self):
+        CreditCard.objects.filter(id=self.card.id).update(credit_limit=1000)
+        first = self.authorizer.authorize(self.card.id, '60', 'Groceries')
+        # A quarter of the open-to-buy was set aside for this process
+        self.assertEqual((first.approved, first.available), (True, Decimal('940')))
+        self.assertEqual(self.held(), Decimal('250'))
+        self.assertEqual(CardEscrow.objects.get().amount, Decimal('250'))
+
+        with record_queries() as recorder:
+            second = self.authorizer.authorize(self.card.id, '10', 'Coffee')
+        self.assertEqual(recorder.count, 0)
+        self.assertEqual((second.approved, second.available), (True, Decimal('930')))
+        self.assertFalse(CardHold.objects.exists())
+
+        self.authorizer.authorize(self.card.id, '20', 'Fuel')
+        # The third approval filled the batch, which was written and posted inline
+        self.assertEqual(CreditCardTransaction.objects.count(), 3)
+        self.assertFalse(CardHold.objects.exists())
+        self.assertEqual(ledger.balance(ledger.card_book(self.card.id)), Decimal('90'))
+        self.assertEqual((self.held(), CardEscrow.objects.get().amount), (Decimal('160'), Decimal('160')))
+
+        declined = self.authorizer.authorize(self.card.id, '950', 'TV')
+        self.assertEqual((declined.approved, declined.reason, declined.available), (False, 'insufficient_credit', Decimal('910')))
+        self.assertTrue(self.authorizer.authorize(self.card.id, '900', 'Laptop').approved)
+
+        self.assertEqual(self.authorizer.release(), 1)
+        self.assertEqual(self.held(), 0)
+        self.assertFalse(CardEscrow.objects.exists())
+        self.assertEqual(ledger.reconcile(ledger.card_book(self.card.id)), (Decimal('990'), Decimal('990')))
+
+    def test_limit_holds_across_workers_and_expired_escrow_is_reclaimed(self):
+        # Each worker process has its own authorizer; the database enforces the limit
+        workers = [Authorizer(batch_size=100, flush_interval=0) for _ in range(3)]
+        results = [worker.authorize(self.card.id, '40', 'Purchase') for worker in workers]
+        self.assertEqual([result.approved for result in results], [True, True, False])
+        self.assertEqual(results[2].available, Decimal('20'))
+        self.assertEqual(self.held(), Decimal('80'))
+
+        self.assertEqual(workers[0].flush(), 1)
+        self.assertEqual(ledger.reconcile(ledger.card_book(self.card.id)), (Decimal('40'), Decimal('40')))
+
+        # The second worker stopped before writing: its escrow is held until it expires
+        self.assertFalse(self.authorizer.authorize(self.card.id, '50', 'Purchase').approved)
+        self.assertEqual(authorization.reclaim_escrows(), 0)
+        later = timezone.now() + datetime.timedelta(seconds=workers[1].ttl + authorization.ESCROW_GRACE + 1)
+        with mock.patch('bank.authorization.timezone.now', return_value=later):
+            self.assertEqual(authorization.reclaim_escrows(), 1)
+        self.assertEqual(self.held(), 0)
+        self.assertTrue(self.authorizer.authorize(self.card.id, '50', 'Purchase').approved)
+
+        # Approvals whose write fails are kept and written by the next flush
+        with mock.patch.object(CardHold.objects, 'bulk_create', side_effect=DatabaseError('disk full')), \
+                self.assertRaises(DatabaseError):
+            self.authorizer.flush()
+        self.assertEqual(self.authorizer.flush(), 1)
+
+        with mock.patch.object(CardEscrow.objects, 'create', side_effect=DatabaseError('disk full')), \
+                self.assertLogs('bank.authorization', 'ERROR'):
+            result = workers[2].authorize(self.card.id, '5', 'Purchase')
+        self.assertEqual((result.approved, result.reason), (False, 'unavailable'))
+        self.assertEqual(self.held(), 0)
+
+    def test_api_declines_other_customers_and_inactive_cards(self):
+        make_customer(1)
+        self.client.login(username='customer1', password='secret-pass-1')
+        url = reverse('authorize_card_purchase')
+        response = self.client.post(url, {'card_id': self.card.id, 'amount': '1.00'}, content_type='application/json')
+        self.assertEqual(response.json()['reason'], 'card_not_active')
+
+        self.client.login(username='customer0', password='secret-pass-1')
+        response = self.client.post(url, {'card_id': self.card.id, 'amount': '1.005'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'card_id': self.card.id, 'amount': '1.00'}, content_type='application/json')
+        self.assertTrue(response.json()['approved'])
+        card = CreditCard.objects.get(id=self.card.id)
+        card.status = 'rejected'
+        card.save()
+        response = self.client.post(url, {'card_id': self.card.id, 'amount': '1.00'}, content_type='application/json')
+        self.assertFalse(response.json()['approved'])
+
+
+class StatementTests(BankTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.card = make_customer(0).creditcard_set.get()
+
+    def card_transaction(self, transaction_type, amount, day):
+        row = post_card_transaction(self.card.id, transaction_type, Decimal(amount), f'{transaction_type} {amount}')
+        when = timezone.make_aware(datetime.datetime(2026, 8, 1) + datetime.timedelta(days=day))
+        CreditCardTransaction.objects.filter(id=row.id).update(created_at=when)
+
+    def test_cycles_carry_balances_and_reruns_are_idempotent(self):
+        CreditCard.objects.filter(id=self.card.id).update(status='active')
+        self.card_transaction('purchase', '1000', 0)
+        self.card_transaction('payment', '400', 20)
+        self.card_transaction('purchase', '50', 40)
+
+        august = run_statements(datetime.date(2026, 8, 31))
+        statement = Statement.objects.get(run=august)
+        self.assertEqual((statement.opening_balance, statement.purchases, statement.payments, statement.interest),
+                         (Decimal('0'), Decimal('1000'), Decimal('400'), Decimal('0')))
+        self.assertEqual((statement.closing_balance, statement.minimum_due), (Decimal('600'), Decimal('25')))
+        with statement.artifact.open() as artifact:
+            self.assertIn(b'purchase 1000', artifact.read())
+
+        september = run_statements(datetime.date(2026, 9, 30))
+        self.assertEqual(september.period_start, datetime.date(2026, 9, 1))
+        statement = Statement.objects.get(run=september)
+        # 2% a month on the 600 carried over and not paid off
+        self.assertEqual((statement.opening_balance, statement.interest, statement.closing_balance),
+                         (Decimal('600'), Decimal('12'), Decimal('662')))
+
+        # A partition that did not finish is redone; finished ones are not
+        StatementPartition.objects.filter(run=september).update(status='pending')
+        with mock.patch('bank.statements._write_artifact', wraps=statements._write_artifact) as write:
+            run_statements(datetime.date(2026, 9, 30))
+            run_statements(datetime.date(2026, 9, 30))
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(Statement.objects.filter(run=september).count(), 1)
+
+    def test_cycle_waits_for_the_previous_run_to_finish(self):
+        CreditCard.objects.filter(id=self.card.id).update(status='active')
+        self.card_transaction('purchase', '1000', 0)
+        # August's run was started but its partitions have not been generated
+        statements.start_run(datetime.date(2026, 8, 31))
+
+        with self.assertRaises(statements.PreviousRunIncomplete):
+            run_statements(datetime.date(2026, 9, 30))
+        with self.assertRaisesRegex(CommandError, 'has not finished'):
+            call_command('generate_statements', '--period-end', '2026-09-30', stdout=io.StringIO())
+        september = statements.start_run(datetime.date(2026, 9, 30))
+        with self.assertRaises(statements.PreviousRunIncomplete):
+            statements.generate_partition(september.partitions.get().id)
+        self.assertFalse(Statement.objects.filter(run=september).exists())
+
+        run_statements(datetime.date(2026, 8, 31))
+        run_statements(datetime.date(2026, 9, 30))
+        self.assertEqual(Statement.objects.get(run=september).opening_balance, Decimal('1000'))
+
+
+class AccrualTests(BankTestCase):
+    def setUp(self):
+        super().setUp()
+        customer = make_customer(0)
+        self.account = customer.account_set.get()
+        self.investment = customer.investment_set.get()
+        self.day = datetime.date(2026, 9, 1)
+
+    def accrued(self):
+        self.account.refresh_from_db()
+        self.investment.refresh_from_db()
+        return (self.account.accrued_interest.quantize(Decimal('0.0001')),
+                self.investment.accrued_return.quantize(Decimal('0.0001')))
+
+    def test_accrual_is_incremental_and_resumable(self):
+        self.assertEqual(accrual.accrue('savings', self.day), 1)
+        self.assertEqual(accrual.accrue('investments', self.day), 1)
+        # 2% a year on 100 and 8% a year on 1000, for one day
+        self.assertEqual(self.accrued(), (Decimal('0.0055'), Decimal('0.2192')))
+
+        self.assertEqual(accrual.accrue('savings', self.day), 0)
+        self.assertEqual(accrual.accrue('savings', self.day + datetime.timedelta(days=9)), 1)
+        self.assertEqual(self.accrued()[0], Decimal('0.0548'))
+
+        # A run interrupted after committing this account's range finishes
+        # the other ranges before starting the next one
+        AccrualWatermark.objects.filter(name='savings').update(
+            target_date=self.day + datetime.timedelta(days=19), next_id=self.account.id + 1)
+        accrual.accrue('savings', self.day + datetime.timedelta(days=20), chunk_size=1)
+        self.assertEqual(self.accrued()[0], Decimal('0.0603'))
+        watermark = AccrualWatermark.objects.get(name='savings')
+        self.assertEqual((watermark.accrued_through, watermark.target_date), (self.day + datetime.timedelta(days=20), None))
+
+    def test_concurrent_runs_accrue_each_row_once(self):
+        accounts = [self.account] + [make_customer(index).account_set.get() for index in (1, 2)]
+        Account.objects.filter(id__in=[account.id for account in accounts]).update(account_type='savings')
+        accrual.accrue('savings', self.day)
+        accrue_range = accrual._accrue_range
+        calls = []
+
+        def second_run_starts_midway(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                # Another worker runs the same job while this one is between ranges
+                accrual.accrue('savings', self.day + datetime.timedelta(days=10), chunk_size=1)
+            return accrue_range(*args)
+
+        with mock.patch.object(accrual, '_accrue_range', second_run_starts_midway):
+            accrual.accrue('savings', self.day + datetime.timedelta(days=10), chunk_size=1)
+        # Ten days at 2% on 100 once, on top of the first day
+        for account in Account.objects.filter(id__in=[account.id for account in accounts]):
+            self.assertEqual(account.accrued_interest.quantize(Decimal('0.0001')), Decimal('0.0603'))
+        watermark = AccrualWatermark.objects.get(name='savings')
+        self.assertEqual((watermark.accrued_through, watermark.target_date), (self.day + datetime.timedelta(days=10), None))
+
+    def test_capitalization_pays_whole_cents(self):
+        accrual.accrue('savings', self.day)
+        accrual.accrue('savings', self.day + datetime.timedelta(days=2))
+        accrual.accrue('investments', self.day)
+        accrual.accrue('investments', self.day + datetime.timedelta(days=30))
+
+        self.assertEqual(accrual.capitalize_interest(), 1)
+        self.assertEqual(accrual.compound_returns(), 1)
+        self.assertEqual(accrual.capitalize_interest(), 0)
+        self.account.refresh_from_db()
+        self.investment.refresh_from_db()
+        self.assertEqual((self.account.balance, self.investment.amount), (Decimal('100.01'), Decimal('1006.79')))
+        self.assertEqual(self.accrued(), (Decimal('0.0064'), Decimal('0.0045')))
+        self.assertTrue(self.account.transaction_set.filter(description='Interest', amount=Decimal('0.01')).exists())
+        self.assertEqual(ledger.balance(ledger.account_book(self.account.id)), Decimal('100.01'))
+
+    def test_concurrent_capitalization_pays_each_row_once(self):
+        accrual.accrue('savings', self.day)
+        accrual.accrue('savings', self.day + datetime.timedelta(days=2))
+        accrual.accrue('investments', self.day)
+        accrual.accrue('investments', self.day + datetime.timedelta(days=30))
+        capitalizable = accrual._capitalizable
+        runs = {'accrued_interest': accrual.capitalize_interest, 'accrued_return': accrual.compound_returns}
+        nested = []
+
+        def second_run_after_read(queryset, field, after, chunk_size):
+            rows = capitalizable(queryset, field, after, chunk_size)
+            if field in runs:
+                # Another worker pays the same rows between this run's read and its write
+                nested.append(runs.pop(field)())
+            return rows
+
+        with mock.patch.object(accrual, '_capitalizable', second_run_after_read):
+            self.assertEqual(accrual.capitalize_interest(), 0)
+            self.assertEqual(accrual.compound_returns(), 0)
+        self.assertEqual(nested, [1, 1])
+        self.account.refresh_from_db()
+        self.investment.refresh_from_db()
+        self.assertEqual((self.account.balance, self.investment.amount), (Decimal('100.01'), Decimal('1006.79')))
+        self.assertEqual(self.accrued(), (Decimal('0.0064'), Decimal('0.0045')))
+        self.assertEqual(self.account.transaction_set.filter(description='Interest').count(), 1)
+        self.assertEqual(ledger.reconcile(ledger.account_book(self.account.id)), (Decimal('100.01'), Decimal('100.01')))
+
+
+class PortfolioTests(BankTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = make_customer(0)
+        make_customer(1)
+        Investment.objects.create(customer=self.customer, investment_type='bonds', amount=3000, return_rate=4)
+
+    def test_book_summary_is_cached_until_an_investment_changes(self):
+        summary = portfolio.book_summary()
+        self.assertEqual((summary['total'], summary['return_rate']), (Decimal('5000'), Decimal('5.60')))
+        self.assertEqual([(row['type'], row['share']) for row in summary['allocation']],
+                         [('bonds', Decimal('60.00')), ('stocks', Decimal('40.00'))])
+        # 2000 at 8% and 3000 at 4% after a year
+        self.assertEqual(summary['projection'][0], {'years': 1, 'value': Decimal('5280.00')})
+        self.assertEqual(summary['retirement_total'], Decimal('200'))
+
+        with self.assertNumQueries(0):
+            portfolio.book_summary()
+        Investment.objects.filter(customer=self.customer, investment_type='bonds').get().delete()
+        self.assertEqual(portfolio.book_summary()['total'], Decimal('2000'))
+
+    def test_customer_drill_down_pages(self):
+        page = portfolio.customer_page(size=1)
+        [row] = page['customers']
+        self.assertEqual((row['name'], row['total'], row['retirement_total']), ('Customer 0', Decimal('4000'), Decimal('100')))
+        self.assertEqual(row['projection'][0], Decimal('4200.00'))
+        [row] = portfolio.customer_page(page['next_cursor'], size=1)['customers']
+        self.assertEqual((row['name'], row['projection'][0]), ('Customer 1', Decimal('1080.00')))
+
+        User.objects.create_user(username='advisor', password='secret-pass-1', role='financial_advisor')
+        self.client.login(username='advisor', password='secret-pass-1')
+        response = self.client.get(reverse('financial_advisor_dashboard'), {'limit': 1})
+        self.assertContains(response, 'Customer 0')
+        self.assertNotContains(response, 'Customer 1')
+        self.assertEqual(self.client.get(reverse('financial_advisor_dashboard'), {'cursor': '!'}).status_code, 400)
+
+
+class RetirementProjectionTests(BankTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = make_customer(0)
+        self.today = datetime.date(2026, 1, 1)
+
+    def test_simulation_matches_compounding_without_volatility(self):
+        contributions = retirement.contribution_schedule(100, 3, growth=10)
+        balances = retirement.simulate(contributions, 8, 0, 2, numpy.random.default_rng(0))
+        expected = ((100 * 1.08 + 110) * 1.08 + 121) * 1.08
+        self.assertAlmostEqual(balances[0, -1], expected)
+        self.assertAlmostEqual(balances[1, -1], expected)
+
+    def test_projection_is_reproducible_and_memoized(self):
+        projection = retirement.customer_projection(self.customer.id, today=self.today)
+        [plan] = projection['plans']
+        self.assertEqual((projection['age'], len(plan['curve']), plan['contributed']), (36, 29, 2900.0))
+        # All stocks: 8% expected return with stock volatility
+        self.assertEqual((plan['assumptions']['mean_return'], plan['assumptions']['volatility']), (8.0, 15.0))
+        outcomes = [plan['percentiles'][str(p)] for p in retirement.PERCENTILES]
+        self.assertEqual(outcomes, sorted(outcomes))
+
+        with mock.patch('bank.retirement.simulate') as simulate:
+            self.assertEqual(retirement.customer_projection(self.customer.id, today=self.today), projection)
+        simulate.assert_not_called()
+        cache.clear()
+        self.assertEqual(retirement.customer_projection(self.customer.id, today=self.today), projection)
+
+        Investment.objects.create(customer=self.customer, investment_type='bonds', amount=1000, return_rate=4)
+        [plan] = retirement.customer_projection(self.customer.id, today=self.today)['plans']
+        self.assertEqual((plan['assumptions']['mean_return'], plan['assumptions']['volatility']), (6.0, 10.0))
+
+    def test_advisor_endpoint(self):
+        User.objects.create_user(username='advisor', password='secret-pass-1', role='financial_advisor')
+        self.client.login(username='advisor', password='secret-pass-1')
+        url = reverse('retirement_projection', args=[self.customer.id])
+        response = self.client.get(url, {'paths': 1000, 'retirement_age': 70})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['plans'][0]['assumptions']['paths'], 1000)
+        self.assertEqual(self.client.get(url, {'paths': 10}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('retirement_projection', args=[0])).status_code, 404)
+
+
+class WarehouseExportTests(BankTestCase):
+    def setUp(self):
+        super().setUp()
+        export_root = tempfile.TemporaryDirectory()
+        self.addCleanup(export_root.cleanup)
+        self.root = export_root.name
+        root_setting = override_settings(WAREHOUSE_ROOT=self.root)
+        root_setting.enable()
+        self.addCleanup(root_setting.disable)
+        self.account = make_customer(0).account_set.get()
+        self.today = datetime.date(2026, 9, 1)
+
+    def exported_rows(self, table):
+        rows = []
+        for directory, _, files in os.walk(os.path.join(self.root, table)):
+            for name in files:
+                with gzip.open(os.path.join(directory, name), 'rt', newline='') as part:
+                    rows.extend(list(csv.DictReader(part)))
+        return rows
+
+    def test_reruns_export_only_new_rows(self):
+        exported = warehouse.export(fmt='csv', chunk_size=1, today=self.today)
+        self.assertEqual(exported, {'transactions': 1, 'card_transactions': 0, 'repayments': 0, 'loans': 1, 'accounts': 1})
+        [row] = self.exported_rows('transactions')
+        self.assertEqual((row['account_id'], row['amount']), (str(self.account.id), '100.00'))
+
+        with mock.patch('bank.warehouse._write') as write:
+            self.assertEqual(sum(warehouse.export(fmt='csv', today=self.today).values()), 0)
+        write.assert_not_called()
+
+        post_transaction(self.account.id, 'withdrawal', Decimal('30'), 'Rent')
+        exported = warehouse.export(fmt='csv', chunk_size=1, today=self.today + datetime.timedelta(days=1))
+        self.assertEqual((exported['transactions'], exported['accounts']), (1, 1))
+        self.assertEqual(sorted(row['amount'] for row in self.exported_rows('transactions')), ['100.00', '30.00'])
+        # One snapshot per day, each complete
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, 'accounts'))),
+                         ['snapshot=2026-09-01', 'snapshot=2026-09-02'])
+
+        warehouse.reset('transactions')
+        self.assertEqual(warehouse.export(['transactions'], fmt='csv')['transactions'], 2)
+        self.assertEqual(len(self.exported_rows('transactions')), 2)
+
+    def test_rows_committed_behind_the_watermark_are_exported_once(self):
+        post_transaction(self.account.id, 'deposit', Decimal('5'), 'Late')
+        post_transaction(self.account.id, 'deposit', Decimal('7'), 'On time')
+        late = Transaction.objects.get(description='Late')
+        fields = {name: getattr(late, name) for name in warehouse.columns(Transaction)}
+        # Still uncommitted when the export runs
+        late.delete()
+        self.assertEqual(warehouse.export(['transactions'], fmt='csv', chunk_size=1)['transactions'], 2)
+        self.assertEqual(ExportWatermark.objects.get(table='transactions').gaps[0][:2], [fields['id'], fields['id']])
+
+        Transaction.objects.create(**fields)
+        self.assertEqual(warehouse.export(['transactions'], fmt='csv')['transactions'], 1)
+        self.assertEqual(warehouse.export(['transactions'], fmt='csv')['transactions'], 0)
+        self.assertEqual(sorted(row['description'] for row in self.exported_rows('transactions')),
+                         ['Late', 'On time', 'Opening deposit'])
+        self.assertEqual(ExportWatermark.objects.get(table='transactions').gaps, [])
+
+    def test_parquet_needs_pyarrow(self):
+        with mock.patch('bank.warehouse.pyarrow', None):
+            with self.assertRaises(warehouse.ExportError):
+                warehouse.export(fmt='parquet')
+            self.assertEqual(warehouse.default_format(), 'csv')
+
+
+class SeedAndLoadTests(BankTestCase):
+    def fingerprint(self):
+        return (
+            list(Customer.objects.order_by('id').values_list('name', 'dob')),
+            list(Account.objects.order_by('id').values_list('account_number', 'account_type', 'balance')),
+            Transaction.objects.count(),
+            list(Loan.objects.order_by('id').values_list('loan_type', 'amount', 'status')),
+        )
+
+    def test_seeding_is_deterministic_and_consistent(self):
+        with transaction.atomic():
+            seed_bank(12, seed=3, chunk_size=5, transactions_per_account=5)
+            first = self.fingerprint()
+            transaction.set_rollback(True)
+        field = Transaction._meta.get_field('created_at')
+        seen = []
+        bulk_create = Transaction.objects.bulk_create
+
+        def watched(*args, **kwargs):
+            seen.append(field.auto_now)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Transaction.objects, 'bulk_create', side_effect=watched):
+            self.assertEqual(seed_bank(12, seed=3, chunk_size=5, transactions_per_account=5), 12)
+        # The shared field definition is left alone while seeding
+        self.assertTrue(seen)
+        self.assertTrue(all(seen))
+        self.assertEqual(self.fingerprint(), first)
+        # Histories keep their own times, spread over the past year
+        times = Transaction.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        self.assertLess(times['last'], timezone.now() - datetime.timedelta(seconds=1))
+        self.assertGreater(times['last'] - times['first'], datetime.timedelta(days=30))
+        for account in Account.objects.all():
+            opening = account.transaction_set.order_by('created_at', 'id').first()
+            self.assertEqual(opening.description, 'Opening deposit')
+        self.assertEqual(seed_bank(12, seed=3, chunk_size=5), 0)
+
+        for account in Account.objects.all():
+            history = account.transaction_set.aggregate(
+                deposits=Sum('amount', filter=Q(transaction_type='deposit')),
+                withdrawals=Sum('amount', filter=Q(transaction_type='withdrawal')))
+            self.assertEqual((history['deposits'] or 0) - (history['withdrawals'] or 0), account.balance)
+            self.assertEqual(ledger.balance(ledger.account_book(account.id)), account.balance)
+
+    def test_replay_covers_every_url_without_errors(self):
+        self.assertEqual(loadtest.uncovered(), set())
+        seed_bank(10, chunk_size=10, transactions_per_account=3)
+        # Post card authorizations inline, not from the background thread
+        authorizer = Authorizer(flush_interval=0)
+        patcher = mock.patch.object(authorization, '_authorizer', authorizer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sessions = loadtest.open_sessions(loadtest.ClientDriver, 'unused', random.Random(0), customers=3)
+        self.assertEqual({session.role for session in sessions}, set(loadtest.WORKLOAD))
+        results = loadtest.replay(sessions, 150)
+        self.assertEqual(results[-1].requests, 150)
+        self.assertEqual({result.label: result.errors for result in results if result.errors}, {})
+        authorizer.flush()
+
+
+class DatabaseTuningTests(BankTestCase):
+    def test_pragmas_are_applied_to_new_connections(self):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        read_only = dict(database.pragmas(read_only=True))
+        self.assertEqual(read_only['query_only'], 1)
+        self.assertNotIn('journal_mode', read_only)
+
+    def test_only_marked_reads_outside_transactions_use_the_replica(self):
+        router = database.ReplicaRouter()
+        routed = database.reads_from_replica(lambda: router.db_for_read(Account))
+        self.assertEqual(router.db_for_read(Account), 'default')
+        # Test cases run inside a transaction, which keeps reads on the primary
+        self.assertEqual(routed(), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertEqual(routed(), 'replica')
+            self.assertEqual(router.db_for_read(Account), 'default')
+        self.assertEqual(database.reads_from_replica(lambda: router.db_for_write(Account))(), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'bank'))
+
+    def test_streamed_reads_stay_on_the_replica_after_the_view_returns(self):
+        make_customer(0)
+        pinned = database.reads_from_replica(lambda: database.pin_reads(Account.objects.all()))
+        unpinned = database.reads_from_replica(lambda: Account.objects.all())
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertEqual((pinned().db, unpinned().db), ('replica', 'default'))
+
+        self.client.login(username='customer0', password='secret-pass-1')
+        response = self.client.get(reverse('transaction_export'))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['description'] for row in rows], ['Opening deposit'])
+
+
+class ConnectionPoolTests(BankTestCase):
+    def wrapper(self, **pool):
+        from .db_backends.sqlite3.base import DatabaseWrapper
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = {**connections['default'].settings_dict, 'NAME': os.path.join(directory.name, 'pool.sqlite3'), 'POOL': pool}
+
+        def make():
+            return DatabaseWrapper(settings_dict, alias='pooltest')
+        first = make()
+        first.ensure_connection()
+        self.addCleanup(lambda: first._connection_pool.close_idle())
+        return make, first
+
+    def test_closed_connections_are_reused(self):
+        make, first = self.wrapper()
+        raw = first.connection
+        first.close()
+        second = make()
+        second.ensure_connection()
+        self.assertIs(second.connection, raw)
+        self.assertTrue(second.pool_reused)
+        self.assertEqual(pooling.stats()['pooltest'], {'size': 1, 'idle': 0, 'in_use': 1, 'max_size': 10})
+        second.close()
+
+    def test_pool_is_bounded_and_evicts_broken_or_idle_connections(self):
+        make, first = self.wrapper(MAX_SIZE=1, TIMEOUT=0.01, IDLE_TIMEOUT=60, HEALTH_CHECK_INTERVAL=0)
+        with self.assertRaises(pooling.PoolExhausted):
+            make().ensure_connection()
+        raw = first.connection
+        first.close()
+        raw.close()
+        second = make()
+        second.ensure_connection()
+        self.assertIsNot(second.connection, raw)
+        self.assertEqual(second.cursor().execute('SELECT 1').fetchone(), (1,))
+        pool = second._connection_pool
+        second.close()
+        pool.idle_timeout = 0
+        created = metrics.get('db_pool.created')
+        third = make()
+        third.ensure_connection()
+        self.assertEqual(metrics.get('db_pool.created'), created + 1)
+        third.close()
+
+
+class IdentityTests(BankTestCase):
+    def test_identity_is_cached_and_dropped_on_save(self):
+        customer = make_customer(0)
+        user = customer.user
+        first = identity.load(user.id)
+        self.assertEqual((first.role, first.customer_id), ('customer', customer.id))
+        with self.assertNumQueries(0):
+            identity.load(user.id)
+
+        user.role = 'teller'
+        user.save()
+        self.assertEqual(identity.load(user.id).role, 'teller')
+        customer.delete()
+        self.assertIsNone(identity.load(user.id).customer_id)
+
+    def test_password_change_ends_cached_sessions(self):
+        make_customer(0)
+        self.client.login(username='customer0', password='secret-pass-1')
+        self.assertEqual(self.client.get(reverse('customer_dashboard')).status_code, 200)
+        user = User.objects.get(username='customer0')
+        user.set_password('another-pass-2')
+        user.save()
+        self.assertEqual(self.client.get(reverse('customer_dashboard')).status_code, 302)
+
+
+class LoginTests(BankTestCase):
+    def test_older_hashes_are_upgraded_at_login(self):
+        user = User.objects.create_user(username='legacy', role='teller')
+        User.objects.filter(id=user.id).update(password=make_password('secret-pass-1', hasher='pbkdf2_sha256'))
+        self.assertTrue(self.client.login(username='legacy', password='secret-pass-1'))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$16384$'))
+
+        with override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 12):
+            self.assertTrue(self.client.login(username='legacy', password='secret-pass-1'))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$4096$'))
+        self.assertGreater(metrics.get('password_hash.scrypt.us'), 0)
+
+    @override_settings(LOGIN_FAILURE_LIMIT=2)
+    def test_repeated_failures_are_refused_before_hashing(self):
+        User.objects.create_user(username='teller', password='secret-pass-1', role='teller')
+        url = reverse('login')
+        for _ in range(2):
+            response = self.client.post(url, {'username': 'Teller', 'password': 'wrong-pass'})
+            self.assertEqual(response.content, b'Invalid login credentials')
+        verified = metrics.get('password_hash.scrypt.verify')
+        response = self.client.post(url, {'username': 'teller', 'password': 'secret-pass-1'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(metrics.get('password_hash.scrypt.verify'), verified)
+
+        # Failures from one address do not lock the user out elsewhere
+        response = self.client.post(url, {'username': 'teller', 'password': 'secret-pass-1'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post(url, {'username': 'teller', 'password': 'secret-pass-1'})
+        self.assertEqual(response.status_code, 429)
+
+        throttle.reset('teller', '127.0.0.1')
+        response = self.client.post(url, {'username': 'teller', 'password': 'secret-pass-1'})
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(LOGIN_FAILURE_LIMIT=1)
+    def test_unusual_usernames_are_counted_under_safe_keys(self):
+        username = 'Teller Ünïcode\n' + 'x' * 300
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            throttle.record_failure(username, '127.0.0.1')
+            self.assertTrue(throttle.is_throttled(username.upper(), '127.0.0.1'))
+        self.assertFalse(throttle.is_throttled('teller', '127.0.0.1'))
+
+    def test_per_process_cache_is_flagged_in_production(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'bank_cache'}}
+        with override_settings(DEBUG=False, CACHES=locmem):
+            self.assertEqual([error.id for error in throttle.check_shared_cache()], ['bank.W001'])
+        with override_settings(DEBUG=True, CACHES=locmem):
+            self.assertEqual(throttle.check_shared_cache(), [])
+        with override_settings(DEBUG=False, CACHES=shared):
+            self.assertEqual(throttle.check_shared_cache(), [])
+
+    @override_settings(LOGIN_IP_FAILURE_LIMIT=3)
+    def test_floods_from_one_address_are_refused(self):
+        User.objects.create_user(username='teller', password='secret-pass-1', role='teller')
+        url = reverse('login')
+        for index in range(3):
+            self.client.post(url, {'username': f'guess{index}', 'password': 'wrong-pass'})
+        response = self.client.post(url, {'username': 'teller', 'password': 'secret-pass-1'})
+        self.assertEqual(response.status_code, 429)
+        response = self.client.post(url, {'username': 'teller', 'password': 'secret-pass-1'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 302)
+
+
+def picture(color='red', size=(400, 300)):
+    out = io.BytesIO()
+    PILImage.new('RGB', size, color).save(out, format='PNG')
+    return out.getvalue()
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ProfilePictureTests(BankTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.media = media.name
+
+    def test_uploads_are_deduplicated_and_thumbnailed(self):
+        first, second = make_customer(0), make_customer(1)
+        for customer, upload_name in ((first, 'me.PNG'), (second, 'copy.png')):
+            customer.profile_picture = SimpleUploadedFile(upload_name, picture())
+            customer.save()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.profile_picture.name, second.profile_picture.name)
+        self.assertIsNotNone(images.digest_of(first.profile_picture.name))
+        self.assertEqual(len(os.listdir(os.path.join(self.media, 'profile_pictures'))), 1)
+
+        images.schedule(first.profile_picture.name)
+        self.assertEqual(len(os.listdir(os.path.join(self.media, 'thumbnails'))), 6)
+        self.client.login(username='customer0', password='secret-pass-1')
+        html = self.client.get(reverse('customer_dashboard')).content.decode()
+        urls = images.thumbnail_urls(first.profile_picture.name, 150)
+        self.assertIn(f'srcset="{urls["webp"]}, {urls["webp_2x"]} 2x"', html)
+        self.assertNotIn(first.profile_picture.url, html)
+
+        response = self.client.get(urls['webp'])
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(PILImage.open(io.BytesIO(b''.join(response.streaming_content))).size, (150, 150))
+        self.assertEqual(self.client.get(urls['webp'], HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_thumbnails_are_served_only_to_owner_and_staff(self):
+        owner = make_customer(0)
+        make_customer(1)
+        User.objects.create_user(username='teller', password='secret-pass-1', role='teller')
+        owner.profile_picture = SimpleUploadedFile('me.png', picture())
+        owner.save()
+        images.schedule(owner.profile_picture.name)
+        url = images.thumbnail_urls(owner.profile_picture.name, 64)['jpg']
+        etags = {}
+        for username, status in (('customer1', 404), ('customer0', 200), ('teller', 200)):
+            self.client.login(username=username, password='secret-pass-1')
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status, username)
+            etags[username] = response.get('ETag')
+        # Nor does a known ETag get past the check
+        self.client.login(username='customer1', password='secret-pass-1')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags['customer0']).status_code, 404)
+
+    def test_concurrent_writers_leave_one_file(self):
+        name = images.thumbnail_name('0' * 64, 64, 'jpg')
+        exists = default_storage.exists
+        self.assertEqual(images.save_once(default_storage, name, ContentFile(b'same')), name)
+        # The second writer checked before the first had saved
+        raced = [name]
+        with mock.patch.object(default_storage, 'exists', side_effect=lambda n: False if raced and n == raced.pop() else exists(n)):
+            self.assertEqual(images.save_once(default_storage, name, ContentFile(b'same')), name)
+        self.assertEqual(os.listdir(os.path.join(self.media, 'thumbnails')), [os.path.basename(name)])
+
+    def test_backfill_moves_older_uploads(self):
+        customer = make_customer(0)
+        default_storage.save('profile_pictures/old.png', ContentFile(picture('blue')))
+        Customer.objects.filter(id=customer.id).update(profile_picture='profile_pictures/old.png')
+        call_command('backfill_thumbnails', stdout=io.StringIO())
+        customer.refresh_from_db()
+        self.assertIsNotNone(images.thumbnail_urls(customer.profile_picture.name, 64))
+
+        out = io.StringIO()
+        call_command('backfill_thumbnails', stdout=out)
+        self.assertIn('0 customers moved to 1 content-addressed pictures; 0 thumbnails made', out.getvalue())
+
+
+class PostingTests(BankTestCase):
+    def test_non_finite_and_fractional_cent_amounts_are_rejected(self):
+        customer = make_customer(0)
+        account = customer.account_set.get()
+        for amount in ['NaN', 'sNaN', 'Infinity', '-Infinity', '0', '-5', '1.005']:
+            with self.subTest(amount=amount), self.assertRaises(ValueError):
+                post_transaction(account.id, 'deposit', Decimal(amount), 'Bad amount')
+        self.assertEqual(Account.objects.get(id=account.id).balance, Decimal('100.00'))
+
+        self.client.login(username='customer0', password='secret-pass-1')
+        for amount in ['NaN', 'Infinity', '1.005', 'abc']:
+            response = self.client.post(reverse('create_transaction'), {
+                'account': account.id, 'transaction_type': 'deposit', 'amount': amount, 'description': 'Bad amount'})
+            self.assertRedirects(response, reverse('create_transaction'))
+        self.assertEqual(Transaction.objects.filter(description='Bad amount').count(), 0)
+
+    def test_overdraft_is_refused_without_side_effects(self):
+        account = make_customer(0).account_set.get()
+        entries = JournalEntry.objects.count()
+        with self.assertRaises(InsufficientFunds) as raised:
+            post_transaction(account.id, 'withdrawal', Decimal('100.01'), 'Too much')
+        self.assertEqual(raised.exception.balance, Decimal('100.00'))
+        self.assertEqual(Account.objects.get(id=account.id).balance, Decimal('100.00'))
+        self.assertFalse(Transaction.objects.filter(description='Too much').exists())
+        self.assertEqual(JournalEntry.objects.count(), entries)
+        self.assertEqual(ledger.reconcile(ledger.account_book(account.id)), (Decimal('100.00'), Decimal('100.00')))
+
+        post_transaction(account.id, 'withdrawal', Decimal('100.00'), 'Everything')
+        self.assertEqual(Account.objects.get(id=account.id).balance, Decimal('0.00'))
+
+    def test_batches_are_netted_per_account(self):
+        first, second = [make_customer(index).account_set.get() for index in range(2)]
+        entries = JournalEntry.objects.count()
+        # The withdrawal alone would overdraw the first account; the batch does not
+        rows = post_many([
+            (first.id, 'withdrawal', Decimal('150'), 'Rent'),
+            (second.id, 'deposit', Decimal('20'), 'Refund'),
+            (first.id, 'deposit', Decimal('80'), 'Salary'),
+            (second.id, 'withdrawal', Decimal('5'), 'Fee'),
+        ])
+
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(Account.objects.get(id=first.id).balance, Decimal('30.00'))
+        self.assertEqual(Account.objects.get(id=second.id).balance, Decimal('115.00'))
+        self.assertEqual(JournalEntry.objects.count(), entries + 1)
+        entry = JournalEntry.objects.latest('id')
+        books = [ledger.account_book(first.id), ledger.account_book(second.id)]
+        self.assertEqual(dict(entry.legs.filter(book__in=books).values_list('book', 'amount')), {
+            books[0]: Decimal('-70.00'),
+            books[1]: Decimal('15.00'),
+        })
+        self.assertEqual(entry.legs.filter(book__startswith=ledger.CASH_BOOK).aggregate(total=Sum('amount'))['total'], Decimal('55.00'))
+        self.assertEqual(Transaction.objects.filter(journal_entry=entry).count(), 4)
+        for account in (first, second):
+            balance = Account.objects.get(id=account.id).balance
+            self.assertEqual(ledger.reconcile(ledger.account_book(account.id)), (balance, balance))
+
+    def test_batches_lock_accounts_in_id_order(self):
+        accounts = [make_customer(index).account_set.get() for index in range(3)]
+        postings = [(account.id, 'deposit', Decimal('1'), 'Interest') for account in reversed(accounts)]
+        with mock.patch('bank.posting._apply_delta', wraps=posting._apply_delta) as apply_delta:
+            post_many(postings)
+            post_many(list(reversed(postings)))
+        locked = [call.args[0]['id'] for call in apply_delta.call_args_list]
+        ids = sorted(account.id for account in accounts)
+        self.assertEqual(locked, ids + ids)
+
+    def test_batch_is_rolled_back_when_one_account_would_overdraw(self):
+        first, second = [make_customer(index).account_set.get() for index in range(2)]
+        entries = JournalEntry.objects.count()
+        transactions = Transaction.objects.count()
+        with self.assertRaises(InsufficientFunds) as raised:
+            post_many([
+                (first.id, 'deposit', Decimal('50'), 'Salary'),
+                (second.id, 'withdrawal', Decimal('500'), 'Car'),
+            ])
+
+        self.assertEqual(raised.exception.account_id, second.id)
+        self.assertEqual(Account.objects.get(id=first.id).balance, Decimal('100.00'))
+        self.assertEqual(Account.objects.get(id=second.id).balance, Decimal('100.00'))
+        self.assertEqual(JournalEntry.objects.count(), entries)
+        self.assertEqual(Transaction.objects.count(), transactions)
+        self.assertEqual(ledger.reconcile(ledger.CASH_BOOK), (Decimal('-200.00'), Decimal('-200.00')))
+
+    def test_opening_balances_are_journaled(self):
+        customer = make_customer(0)
+        User.objects.create_user(username='teller', password='secret-pass-1', role='teller')
+        self.client.login(username='teller', password='secret-pass-1')
+        response = self.client.post(reverse('create_account', args=[customer.user_id]),
+                                    {'account_type': 'checking', 'balance': '250.00'})
+        self.assertRedirects(response, reverse('teller_dashboard'), fetch_redirect_response=False)
+        account = customer.account_set.get(account_type='checking')
+        self.assertEqual(account.balance, Decimal('250.00'))
+        self.assertEqual(account.transaction_set.get().description, 'Opening balance')
+        self.assertEqual(ledger.reconcile(ledger.account_book(account.id)), (Decimal('250.00'), Decimal('250.00')))
+
+        response = self.client.post(reverse('create_account', args=[customer.user_id]),
+                                    {'account_type': 'savings', 'balance': '-5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(customer.account_set.count(), 2)
+
+    @override_settings(LEDGER_GL_SHARDS=4)
+    def test_general_ledger_balance_is_spread_over_shards(self):
+        accounts = [make_customer(index).account_set.get() for index in range(10)]
+        for account in accounts:
+            post_transaction(account.id, 'deposit', Decimal('5'), 'Deposit')
+        post_many([(account.id, 'withdrawal', Decimal('1'), 'Fee') for account in accounts])
+
+        rows = LedgerBalance.objects.filter(book__startswith=f'{ledger.CASH_BOOK}#')
+        self.assertGreater(rows.count(), 1)
+        self.assertFalse(LedgerBalance.objects.filter(book=ledger.CASH_BOOK).exists())
+        self.assertEqual(ledger.reconcile(ledger.CASH_BOOK), (Decimal('-1040.00'), Decimal('-1040.00')))
+        out = io.StringIO()
+        call_command('snapshot_ledger', '--reconcile', stdout=out)
+        self.assertIn('All books reconcile.', out.getvalue())
+
+    def test_snapshots_wait_for_legs_committed_behind_them(self):
+        account = make_customer(0).account_set.get()
+        book = ledger.account_book(account.id)
+        ledger.take_snapshots()
+        for amount in ('1', '2', '3'):
+            post_transaction(account.id, 'deposit', Decimal(amount), 'Deposit')
+        # The second deposit's leg has its id but has not committed yet
+        late = JournalLeg.objects.get(book=book, amount=Decimal('2'))
+        late_id = late.id
+        late.delete()
+
+        self.assertEqual(ledger.take_snapshots(), 2)
+        self.assertEqual(BalanceSnapshot.objects.filter(book=book).latest('last_leg_id').balance, Decimal('101.00'))
+        late.id = late_id
+        late.save(force_insert=True)
+        ledger.take_snapshots()
+        self.assertEqual(ledger.reconcile(book), (Decimal('106.00'), Decimal('106.00')))
+        self.assertEqual(BalanceSnapshot.objects.filter(book=book).latest('last_leg_id').balance, Decimal('106.00'))
+
+        post_transaction(account.id, 'withdrawal', Decimal('6'), 'Withdrawal')
+        JournalLeg.objects.filter(book=book, amount=Decimal('-6')).delete()
+        with override_settings(LEDGER_LATE_LEG_WINDOW=0):
+            # Missing for longer than the window: rolled back
+            ledger.take_snapshots()
+        self.assertEqual(BalanceSnapshot.objects.aggregate(last=Max('last_leg_id'))['last'],
+                         JournalLeg.objects.aggregate(last=Max('id'))['last'])
+
+
+
+class TransactionHistoryTests(BankTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = make_customer(0)
+        savings = self.customer.account_set.get()
+        checking = Account.objects.create(customer=self.customer, account_number='CHK0001', account_type='checking')
+        for account, amount in [(checking, '10'), (savings, '20'), (checking, '30'), (savings, '40'), (checking, '50')]:
+            post_transaction(account.id, 'deposit', Decimal(amount), f'Deposit {amount}')
+        post_transaction(make_customer(1).account_set.get().id, 'deposit', Decimal('60'), 'Someone else')
+        # Four rows across both accounts share a timestamp, so the id breaks the tie
+        noon = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        history = Transaction.objects.filter(customer=self.customer)
+        history.filter(amount__in=[20, 30, 40, 50]).update(created_at=noon)
+        history.filter(amount__in=[100, 10]).update(created_at=noon - datetime.timedelta(days=1))
+        self.expected = list(history.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.client.login(username='customer0', password='secret-pass-1')
+
+    def test_cursor_pages_cover_the_history_once_across_accounts(self):
+        for limit in (1, 2, 3, 4, 6, 10):
+            with self.subTest(limit=limit):
+                ids, cursor, pages = [], None, 0
+                while True:
+                    params = {'limit': limit}
+                    if cursor:
+                        params['cursor'] = cursor
+                    page = self.client.get(reverse('transaction_api'), params).json()
+                    pages += 1
+                    ids.extend(row['id'] for row in page['results'])
+                    cursor = page['next_cursor']
+                    if cursor is None:
+                        break
+                self.assertEqual(ids, self.expected)
+                # The last page is found without fetching an empty one
+                self.assertEqual(pages, -(-len(self.expected) // limit))
+
+        response = self.client.get(reverse('transaction_api'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_history_is_read_in_index_order(self):
+        plan = views.customer_transactions(self.customer.id).order_by(*views.TRANSACTION_ORDERING)[:50].explain()
+        self.assertIn('bank_txn_customer_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_export_streams_the_whole_history_as_ndjson(self):
+        response = self.client.get(reverse('transaction_export'))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('transactions.ndjson', response['Content-Disposition'])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], self.expected)
+        self.assertEqual(rows[0]['account_number'], 'CHK0001')
+        self.assertEqual({row['amount'] for row in rows}, {'100.00', '10.00', '20.00', '30.00', '40.00', '50.00'})
+        self.assertEqual(set(rows[0]), {'id', 'account_number', 'transaction_type', 'amount', 'description', 'created_at'})
+
+
+
+class AllocatorTests(BankTestCase):
+    def test_luhn_check_digits(self):
+        self.assertEqual(allocator.luhn_check_digit('7992739871'), '3')
+        self.assertTrue(allocator.is_luhn_valid('4111111111111111'))
+        self.assertFalse(allocator.is_luhn_valid('4111111111111112'))
+        numbers = allocator.allocate_card_numbers(50)
+        for number in numbers:
+            self.assertEqual(len(number), 16)
+            self.assertTrue(number.startswith('400000'))
+            self.assertTrue(allocator.is_luhn_valid(number), number)
+        self.assertEqual(len(set(numbers)), 50)
+
+    def test_permutation_stays_inside_its_domain(self):
+        # Three digits are cycle-walked inside the four-digit Feistel domain
+        for digits in (3, 4):
+            with self.subTest(digits=digits):
+                permute = allocator.FeistelPermutation(digits, 'test-key')
+                values = [permute(value) for value in range(10 ** digits)]
+                self.assertEqual(sorted(values), list(range(10 ** digits)))
+                self.assertNotEqual(values, sorted(values))
+                with self.assertRaises(ValueError):
+                    permute(10 ** digits)
+                with self.assertRaises(ValueError):
+                    permute(-1)
+
+    @override_settings(NUMBER_BLOCK_SIZE=5)
+    def test_numbers_are_unique_within_and_across_blocks(self):
+        numbers = allocator.NumberAllocator('test_numbers', 12, 'Account', 'account_number')
+        # A legacy account already holds the third number of the first block
+        Account.objects.create(customer=make_customer(0), account_number=numbers.format(2), account_type='checking')
+        allocated = []
+        for count in (3, 4, 1, 12):
+            with self.captureOnCommitCallbacks(execute=True):
+                allocated.extend(numbers.allocate(count))
+        self.assertEqual(len(allocated), 20)
+        self.assertEqual(len(set(allocated)), 20)
+        self.assertNotIn(numbers.format(2), allocated)
+        self.assertTrue(all(len(number) == 12 and number.isdigit() for number in allocated))
+        # Blocks of 5, 5 and 11: the rest of each block was used before a new one
+        self.assertEqual(NumberSequence.objects.get(name='test_numbers').next_value, 21)
+
+    @override_settings(NUMBER_BLOCK_SIZE=5)
+    def test_block_reserved_in_a_rolled_back_transaction_is_not_pooled(self):
+        numbers = allocator.NumberAllocator('test_numbers', 12, 'Account', 'account_number')
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(DatabaseError):
+                with transaction.atomic():
+                    rolled_back = numbers.allocate(2)
+                    raise DatabaseError('rolled back')
+        self.assertEqual(list(numbers.pool), [])
+        self.assertFalse(NumberSequence.objects.filter(name='test_numbers').exists())
+
+        # The reservation rolled back too, so the same block is reserved again
+        with self.captureOnCommitCallbacks(execute=True):
+            allocated = numbers.allocate(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            allocated += numbers.allocate(4)
+        self.assertEqual(allocated[:2], rolled_back)
+        self.assertEqual(len(set(allocated)), 6)
+        self.assertEqual(NumberSequence.objects.get(name='test_numbers').next_value, 10)
+
+    def test_account_form_allocates_a_number_only_when_saved(self):
+        customer = make_customer(0)
+        User.objects.create_user(username='teller', password='secret-pass-1', role='teller')
+        self.client.login(username='teller', password='secret-pass-1')
+        url = reverse('create_account', args=[customer.user_id])
+        with mock.patch('bank.allocator.next_account_number', wraps=allocator.next_account_number) as allocate:
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.client.post(url, {'account_type': 'checking', 'balance': '-1'})
+            self.assertEqual(allocate.call_count, 0)
+            self.client.post(url, {'account_type': 'checking', 'balance': '10'})
+        self.assertEqual(allocate.call_count, 1)
+        number = customer.account_set.get(account_type='checking').account_number
+        self.assertEqual((len(number), number.isdigit()), (12, True))
+
+
+class DashboardCacheTests(BankTestCase):
+    def test_warm_dashboard_skips_the_database_until_invalidated(self):
+        customer = make_customer(0)
+        self.client.login(username='customer0', password='secret-pass-1')
+        url = reverse('customer_dashboard')
+        self.client.get(url)
+        misses = metrics.get('dashboard_cache.miss')
+
+        with record_queries() as recorder:
+            response = self.client.get(url)
+        # The session and the user's identity come from the cache too
+        self.assertEqual(recorder.count, 0)
+        self.assertEqual(metrics.get('dashboard_cache.miss'), misses)
+
+        Loan.objects.create(customer=customer, loan_type='auto', amount=500, interest_rate=5, term_months=6)
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['loans']), 2)
+        self.assertEqual(metrics.get('dashboard_cache.miss'), misses + 1)
+
+
+class AsyncViewTests(BankTestCase):
+    async def test_async_views_match_sync_views(self):
+        await sync_to_async(make_customer)(0)
+        await sync_to_async(User.objects.create_user)(username='teller', password='secret-pass-1', role='teller')
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(await sync_to_async(User.objects.get)(username='customer0'))
+
+        response = await client.get(reverse('async_transaction_api'))
+        self.assertEqual([row['description'] for row in response.json()['results']], ['Opening deposit'])
+        response = await client.get(reverse('async_customer_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['accounts']), 1)
+        response = await client.get(reverse('async_teller_dashboard'))
+        self.assertEqual(response.status_code, 302)
+
+
+class AmortizationTests(BankTestCase):
+    def test_vectorized_schedule_matches_period_rows(self):
+        customer = make_customer(0)
+        loans = [
+            Loan.objects.create(customer=customer, loan_type='auto', amount=amount, interest_rate=rate, term_months=term)
+            for amount, rate, term in [
+                (Decimal('43541.53'), Decimal('25.00'), 12),
+                (Decimal('10000.00'), Decimal('0.00'), 7),
+                (Decimal('250000.00'), Decimal('6.75'), 360),
+            ]
+        ]
+        self.assertEqual(amortization.regenerate_schedules(Loan.objects.filter(loan_type='auto'), chunk_size=2), 3)
+
+        for loan in loans:
+            schedule = LoanSchedule.objects.get(loan=loan)
+            rows = list(amortization.schedule_rows(loan, schedule))
+            self.assertEqual(len(rows), loan.term_months)
+            self.assertEqual(sum(row[3] for row in rows), loan.amount)
+            self.assertEqual(sum(row[2] for row in rows), schedule.total_interest)
+            self.assertEqual(rows[-1][1], schedule.final_payment)
+            self.assertEqual(rows[-1][4], Decimal('0.00'))
@@ -0,0 +1,77 @@
+import hashlib
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+from . import metrics
+
+# Backends whose counts live in one worker process, so each worker would
+# allow its own LOGIN_FAILURE_LIMIT attempts
+PER_PROCESS_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def check_shared_cache(app_configs=None, **kwargs):
+    """Warn when the failure counters are not shared between worker processes."""
+    alias = getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if settings.DEBUG or backend not in PER_PROCESS_CACHES:
+        return []
+    return [checks.Warning(
+        f'Login throttling uses the per-process cache backend {backend}.',
+        hint='Failure limits are multiplied by the number of worker processes; '
+             'configure a shared backend such as Redis, memcached or the database cache.',
+        id='bank.W001',
+    )]
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '') if request is not None else ''
+
+
+def _user_key(username, ip):
+    # Per client IP too, so failures from elsewhere cannot lock the user out.
+    # Usernames are hashed: they may hold spaces, control characters or more
+    # bytes than memcached allows in a key.
+    digest = hashlib.sha256((username or '').lower().encode()).hexdigest()
+    return f'login_failures:user:{digest}:{ip}'
+
+
+def _limits(username, ip):
+    """``{cache key: limit}`` of the failure counters a login attempt is checked against."""
+    limits = {_user_key(username, ip): getattr(settings, 'LOGIN_FAILURE_LIMIT', 5)}
+    if ip:
+        limits[f'login_failures:ip:{ip}'] = getattr(settings, 'LOGIN_IP_FAILURE_LIMIT', 50)
+    return limits
+
+
+def is_throttled(username, ip):
+    """Whether ``username`` from ``ip``, or ``ip`` itself, has used up its failed attempts."""
+    limits = _limits(username, ip)
+    counts = _cache().get_many(list(limits))
+    return any(counts.get(key, 0) >= limit for key, limit in limits.items())
+
+
+def record_failure(username, ip):
+    cache = _cache()
+    window = getattr(settings, 'LOGIN_FAILURE_WINDOW', 900)
+    for key in _limits(username, ip):
+        # The window starts at the first failure and is not extended
+        if not cache.add(key, 1, timeout=window):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, timeout=window)
+    metrics.incr('login.failed')
+
+
+def reset(username, ip):
+    """Clear the username's failures from ``ip`` after a successful login; the IP's own are kept."""
+    _cache().delete(_user_key(username, ip))
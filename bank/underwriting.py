@@ -0,0 +1,223 @@
+import datetime
+import operator
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .decisions import CARD_DECISIONS, LOAN_DECISIONS, apply_decisions
+from .models import Account, CreditCard, Customer, Loan
+
+# Outcomes, in order of precedence: a failed 'reject' rule rejects outright,
+# a failed 'refer' rule leaves the application pending for a human.
+APPROVE, REFER, REJECT = 'approve', 'refer', 'reject'
+
+# Each rule checks one feature of an application against a constant,
+# optionally only for applications matching ``when``. Features are the
+# application's own fields plus ``age``, ``exposure`` (approved loans and
+# active card limits already held), ``exposure_after`` (exposure plus this
+# application), ``balance`` (sum of account balances) and
+# ``exposure_to_balance``. Override with settings.CREDIT_RULES.
+DEFAULT_RULES = {
+    'loan': [
+        {'name': 'minimum_age', 'field': 'age', 'op': '>=', 'value': 18, 'outcome': REJECT},
+        {'name': 'personal_limit', 'when': {'loan_type': 'personal'}, 'field': 'amount', 'op': '<=', 'value': 50000, 'outcome': REJECT},
+        {'name': 'auto_limit', 'when': {'loan_type': 'auto'}, 'field': 'amount', 'op': '<=', 'value': 100000, 'outcome': REJECT},
+        {'name': 'mortgage_limit', 'when': {'loan_type': 'mortgage'}, 'field': 'amount', 'op': '<=', 'value': 1000000, 'outcome': REJECT},
+        {'name': 'maximum_term', 'field': 'term_months', 'op': '<=', 'value': 360, 'outcome': REJECT},
+        {'name': 'exposure_cap', 'field': 'exposure_after', 'op': '<=', 'value': 2000000, 'outcome': REJECT},
+        {'name': 'balance_cover', 'field': 'exposure_to_balance', 'op': '<=', 'value': 20, 'outcome': REFER},
+    ],
+    'card': [
+        {'name': 'minimum_age', 'field': 'age', 'op': '>=', 'value': 18, 'outcome': REJECT},
+        {'name': 'standard_limit', 'when': {'card_type': 'standard'}, 'field': 'credit_limit', 'op': '<=', 'value': 10000, 'outcome': REJECT},
+        {'name': 'reward_limit', 'when': {'card_type': 'reward'}, 'field': 'credit_limit', 'op': '<=', 'value': 25000, 'outcome': REJECT},
+        {'name': 'exposure_cap', 'field': 'exposure_after', 'op': '<=', 'value': 2000000, 'outcome': REJECT},
+        {'name': 'balance_cover', 'field': 'exposure_to_balance', 'op': '<=', 'value': 10, 'outcome': REFER},
+    ],
+}
+
+# Features every application has, whatever its kind
+PROFILE_FEATURES = ('id', 'customer_id', 'age', 'exposure', 'exposure_after', 'balance', 'exposure_to_balance')
+
+OPERATORS = {
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    '==': operator.eq, '!=': operator.ne,
+}
+
+
+class RuleError(ValueError):
+    """Raised when a rule set cannot be compiled."""
+
+
+def _compile_rule(rule, features=None):
+    try:
+        name, field, outcome = rule['name'], rule['field'], rule['outcome']
+        compare = OPERATORS[rule['op']]
+        value = Decimal(str(rule['value']))
+        when = tuple((rule.get('when') or {}).items())
+    except (KeyError, ArithmeticError, AttributeError) as exc:
+        raise RuleError(f'Invalid rule {rule!r}: {exc}')
+    if outcome not in (REFER, REJECT):
+        raise RuleError(f'Rule {name} has unknown outcome {outcome!r}')
+    if features is not None:
+        # Caught here rather than as a KeyError for every applicant
+        unknown = sorted({field, *(key for key, _ in when)} - set(features))
+        if unknown:
+            raise RuleError(f'Rule {name} uses unknown features {", ".join(unknown)}')
+
+    if when:
+        def failed(features):
+            for key, expected in when:
+                if features[key] != expected:
+                    return False
+            return not compare(features[field], value)
+    else:
+        def failed(features):
+            return not compare(features[field], value)
+    return outcome, name, failed
+
+
+class RuleSet:
+    """
+    A list of declarative rules compiled once into plain closures. Pass the
+    names of the ``features`` applications will have to check every rule
+    only uses those.
+    """
+
+    def __init__(self, rules, features=None):
+        compiled = [_compile_rule(rule, features) for rule in rules]
+        # Rejections are checked before referrals whatever their order
+        self.rules = [rule for rule in compiled if rule[0] == REJECT] + [rule for rule in compiled if rule[0] == REFER]
+
+    def evaluate(self, features):
+        """Return ``(outcome, rule_name)``; ``rule_name`` is None on approval."""
+        for outcome, name, failed in self.rules:
+            if failed(features):
+                return outcome, name
+        return APPROVE, None
+
+
+def rule_set(kind, features=None):
+    rules = getattr(settings, 'CREDIT_RULES', {}).get(kind, DEFAULT_RULES[kind])
+    return RuleSet(rules, features)
+
+
+def age_on(dob, today):
+    return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+
+
+def _sums(queryset, field):
+    return {
+        row['customer_id']: row['total']
+        for row in queryset.values('customer_id').annotate(total=Sum(field)).order_by()
+    }
+
+
+class CustomerProfiles:
+    """
+    Age, exposure and balances for a batch of customers, loaded with one
+    grouped query per source instead of one query per applicant.
+    """
+
+    def __init__(self, customer_ids, today=None):
+        today = today or datetime.date.today()
+        customer_ids = set(customer_ids)
+        self.ages = {
+            pk: age_on(dob, today)
+            for pk, dob in Customer.objects.filter(id__in=customer_ids).values_list('id', 'dob')
+        }
+        loans = _sums(Loan.objects.filter(customer_id__in=customer_ids, status='approved'), 'amount')
+        cards = _sums(CreditCard.objects.filter(customer_id__in=customer_ids, status='active'), 'credit_limit')
+        self.exposure = {pk: (loans.get(pk) or 0) + (cards.get(pk) or 0) for pk in customer_ids}
+        self.balances = _sums(Account.objects.filter(customer_id__in=customer_ids), 'balance')
+
+    def features(self, customer_id, requested, fields):
+        exposure = self.exposure[customer_id]
+        balance = self.balances.get(customer_id) or Decimal(0)
+        exposure_after = exposure + requested
+        features = dict(fields)
+        features.update(
+            age=self.ages[customer_id],
+            exposure=exposure,
+            exposure_after=exposure_after,
+            balance=balance,
+            exposure_to_balance=exposure_after / balance if balance > 0 else Decimal('Infinity'),
+        )
+        return features
+
+    def approve(self, customer_id, amount):
+        # Later applications in the batch see this approval's exposure
+        self.exposure[customer_id] += amount
+
+
+class Underwriter:
+    kind = None
+    model = None
+    verbs = None
+    requested_field = None
+    fields = ()
+
+    def __init__(self, rules=None):
+        features = PROFILE_FEATURES + self.fields
+        self.rules = RuleSet(rules, features) if rules is not None else rule_set(self.kind, features)
+
+    def score(self, applications, profiles):
+        """
+        Yield ``(id, outcome, rule_name)`` for each application, given as
+        ``values()`` dicts with ``id``, ``customer_id`` and ``fields``.
+        """
+        evaluate = self.rules.evaluate
+        for row in applications:
+            customer_id, requested = row['customer_id'], row[self.requested_field]
+            features = profiles.features(customer_id, requested, row)
+            outcome, rule = evaluate(features)
+            if outcome == APPROVE:
+                profiles.approve(customer_id, requested)
+            yield row['id'], outcome, rule
+
+    def run(self, batch_size=2000, dry_run=False, today=None):
+        """
+        Score every pending application in id order, ``batch_size`` at a
+        time, and apply approvals and rejections through the bulk decision
+        path. Referred applications stay pending. Returns
+        ``(outcome_counts, rule_counts)``.
+        """
+        outcomes = {APPROVE: 0, REFER: 0, REJECT: 0}
+        rules = {}
+        last_id = 0
+        while True:
+            batch = list(
+                self.model.objects.filter(status='pending', id__gt=last_id)
+                .order_by('id')
+                .values('id', 'customer_id', *self.fields)[:batch_size]
+            )
+            if not batch:
+                return outcomes, rules
+            last_id = batch[-1]['id']
+            profiles = CustomerProfiles((row['customer_id'] for row in batch), today)
+            decisions = {}
+            for pk, outcome, rule in self.score(batch, profiles):
+                outcomes[outcome] += 1
+                if rule:
+                    rules[rule] = rules.get(rule, 0) + 1
+                if outcome != REFER:
+                    decisions[pk] = self.verbs[outcome]
+            if not dry_run:
+                apply_decisions(self.model, decisions)
+
+
+class LoanUnderwriter(Underwriter):
+    kind = 'loan'
+    model = Loan
+    verbs = LOAN_DECISIONS
+    requested_field = 'amount'
+    fields = ('loan_type', 'amount', 'interest_rate', 'term_months')
+
+
+class CardUnderwriter(Underwriter):
+    kind = 'card'
+    model = CreditCard
+    verbs = CARD_DECISIONS
+    requested_field = 'credit_limit'
+    fields = ('card_type', 'credit_limit')
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import async_views, views
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -15,14 +15,20 @@ urlpatterns = [
     path('teller_dashboard/', views.teller_dashboard, name='teller_dashboard'),
     path('loan_officer_dashboard/', views.loan_officer_dashboard, name='loan_officer_dashboard'),
     path('credit_card_manager_dashboard/', views.credit_card_manager_dashboard, name='credit_card_manager_dashboard'),
+    path('loans/decisions/', views.loan_decisions_api, name='loan_decisions'),
+    path('credit_cards/decisions/', views.credit_card_decisions_api, name='credit_card_decisions'),
+    path('credit_cards/authorize/', views.authorize_card_purchase, name='authorize_card_purchase'),
     path('financial_advisor_dashboard/', views.financial_advisor_dashboard, name='financial_advisor_dashboard'),
+    path('customers/<int:customer_id>/retirement_projection/', views.retirement_projection, name='retirement_projection'),
     path('admin_dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('metrics/', views.metrics_view, name='metrics'),
 
     # Customer management URLs
     path('create_customer/', views.create_customer, name='create_customer'),
     path('edit_customer/<int:customer_id>/', views.edit_customer, name='edit_customer'),
     path('delete_customer/<int:customer_id>/', views.delete_customer, name='delete_customer'),
     path('create_account/<int:user_id>/', views.create_account, name='create_account'),
+    path('import_customers/', views.import_customers_api, name='import_customers'),
 
     # Admin user management URLs
     path('add_user/', views.add_user, name='add_user'),
@@ -36,6 +42,18 @@ urlpatterns = [
     path('apply_retirement_plan/', views.apply_retirement_plan, name='apply_retirement_plan'),
     path('transactions/', views.transaction_list, name='transaction_list'),
     path('transactions/new/', views.create_transaction, name='create_transaction'),
+    path('transactions/api/', views.transaction_api, name='transaction_api'),
+    path('transactions/export/', views.transaction_export, name='transaction_export'),
+
+    # Native async versions of the read-heavy views, for ASGI deployments
+    path('async/customer_dashboard/', async_views.customer_dashboard, name='async_customer_dashboard'),
+    path('async/teller_dashboard/', async_views.teller_dashboard, name='async_teller_dashboard'),
+    path('async/loan_officer_dashboard/', async_views.loan_officer_dashboard, name='async_loan_officer_dashboard'),
+    path('async/credit_card_manager_dashboard/', async_views.credit_card_manager_dashboard, name='async_credit_card_manager_dashboard'),
+    path('async/financial_advisor_dashboard/', async_views.financial_advisor_dashboard, name='async_financial_advisor_dashboard'),
+    path('async/transactions/', async_views.transaction_list, name='async_transaction_list'),
+    path('async/transactions/api/', async_views.transaction_api, name='async_transaction_api'),
+    path('thumbnails/<str:name>', views.thumbnail, name='thumbnail'),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -2,12 +2,24 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from .models import User, Customer, Account, Loan, CreditCard, Investment, RetirementPlan, generate_account_number, Transaction
+from . import authorization, dashboard_cache, images, metrics, pooling, portfolio, retirement
+from .posting import post_transaction, InsufficientFunds
+from .pagination import keyset_page, InvalidCursor
+from .decisions import QUEUE_ORDERING, decide_credit_cards, decide_loans, queue
+from .querycount import query_budget
+from .database import pin_reads, reads_from_replica
+from .search import search_customers, prefix_range
+from .onboarding import credentials_email, generate_password, guess_format, import_customers, read_rows
 from .forms import UserForm, CustomerForm, AccountForm, LoanForm, CreditCardForm, InvestmentForm, RetirementPlanForm, LoginForm, EditUserForm
-from django.http import HttpResponse
-from django.core.mail import send_mail
-from django.utils.crypto import get_random_string
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
-from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.core.files.storage import default_storage
+from django.views.decorators.http import condition
+from decimal import Decimal, InvalidOperation
+import json
 
 
 # Check if user is a specific role
@@ -30,6 +42,8 @@ def login_view(request):
                     return redirect('admin_dashboard')
                 else:
                     return redirect('dashboard')
+            elif getattr(request, 'login_throttled', False):
+                return HttpResponse('Too many failed login attempts. Try again later.', status=429)
             else:
                 return HttpResponse('Invalid login credentials')
     else:
@@ -60,31 +74,83 @@ def dashboard(request):
     else:
         return HttpResponse('Unauthorized', status=401)
 
+def customer_id_or_404(request):
+    customer_id = request.identity.customer_id
+    if customer_id is None:
+        raise Http404('No Customer matches the given query.')
+    return customer_id
+
 # Customer dashboard
 @login_required
 @user_passes_test(check_role('customer'))
+@reads_from_replica
+@query_budget(9)
 def customer_dashboard(request):
-    customer = get_object_or_404(Customer, user=request.user)
-    accounts = Account.objects.filter(customer=customer)
-    loans = Loan.objects.filter(customer=customer)
-    credit_cards = CreditCard.objects.filter(customer=customer)
-    investments = Investment.objects.filter(customer=customer)
-    retirement_plans = RetirementPlan.objects.filter(customer=customer)
-    return render(request, 'customer_dashboard.html', {
-        'customer': customer,
-        'accounts': accounts,
-        'loans': loans,
-        'credit_cards': credit_cards,
-        'investments': investments,
-        'retirement_plans': retirement_plans
-    })
+    return render(request, 'customer_dashboard.html', dashboard_cache.get_dashboard_context(customer_id_or_404(request)))
+
+TRANSACTION_ORDERING = ('-created_at', '-id')
+TRANSACTION_FIELDS = ('id', 'account__account_number', 'transaction_type', 'amount', 'description', 'created_at')
+
+def customer_transactions(customer):
+    return Transaction.objects.filter(customer=customer)
+
+def transaction_row(values):
+    return {
+        'id': values['id'],
+        'account_number': values['account__account_number'],
+        'transaction_type': values['transaction_type'],
+        'amount': str(values['amount']),
+        'description': values['description'],
+        'created_at': values['created_at'].isoformat(),
+    }
+
+def page_size_param(request, default=50, maximum=500):
+    try:
+        return max(1, min(int(request.GET.get('limit', default)), maximum))
+    except ValueError:
+        return default
 
 @login_required
 @user_passes_test(check_role('customer'))
+@reads_from_replica
+@query_budget(4)
 def transaction_list(request):
-    accounts = Account.objects.filter(customer=request.user.customer)
-    transactions = Transaction.objects.filter(account__in=accounts)
-    return render(request, 'transaction_list.html', {'transactions': transactions})
+    transactions = customer_transactions(customer_id_or_404(request)).select_related('account')
+    try:
+        transactions, next_cursor = keyset_page(transactions, TRANSACTION_ORDERING, request.GET.get('cursor'), page_size_param(request))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return render(request, 'transaction_list.html', {'transactions': transactions, 'next_cursor': next_cursor})
+
+# Paginated JSON transaction history
+@login_required
+@user_passes_test(check_role('customer'))
+@reads_from_replica
+@query_budget(4)
+def transaction_api(request):
+    transactions = customer_transactions(customer_id_or_404(request)).values(*TRANSACTION_FIELDS)
+    try:
+        rows, next_cursor = keyset_page(transactions, TRANSACTION_ORDERING, request.GET.get('cursor'), page_size_param(request))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    return JsonResponse({'results': [transaction_row(row) for row in rows], 'next_cursor': next_cursor})
+
+# Full transaction history streamed as NDJSON
+@login_required
+@user_passes_test(check_role('customer'))
+@reads_from_replica
+def transaction_export(request):
+    # Streamed after the view returns, so bound to the replica now
+    transactions = (
+        pin_reads(customer_transactions(customer_id_or_404(request)))
+        .order_by(*TRANSACTION_ORDERING)
+        .values(*TRANSACTION_FIELDS)
+        .iterator(chunk_size=2000)
+    )
+    lines = (json.dumps(transaction_row(row)) + '\n' for row in transactions)
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="transactions.ndjson"'
+    return response
 
 @login_required
 @user_passes_test(check_role('customer'))
@@ -97,44 +163,100 @@ def create_transaction(request):
 
         try:
             amount = Decimal(amount)
-        except ValueError:
+        except (ValueError, TypeError, InvalidOperation):
             messages.error(request, 'Invalid amount.')
             return redirect('create_transaction')
 
-        account = Account.objects.get(id=account_id, customer=request.user.customer)
-
-        if transaction_type == 'withdrawal' and account.balance < amount:
-            messages.error(request, 'Insufficient funds. Your current balance is {}'.format(account.balance))
+        try:
+            post_transaction(account_id, transaction_type, amount, description, customer=customer_id_or_404(request))
+        except InsufficientFunds as exc:
+            messages.error(request, 'Insufficient funds. Your current balance is {}'.format(exc.balance))
+            return redirect('create_transaction')
+        except ValueError as exc:
+            messages.error(request, str(exc))
             return redirect('create_transaction')
-
-        if transaction_type == 'deposit':
-            account.balance += amount
-        elif transaction_type == 'withdrawal':
-            account.balance -= amount
-
-        account.save()
-
-        Transaction.objects.create(
-            account=account,
-            transaction_type=transaction_type,
-            amount=amount,
-            description=description
-        )
 
         messages.success(request, 'Transaction successful.')
         return redirect('transaction_list')
 
-    accounts = Account.objects.filter(customer=request.user.customer)
+    accounts = Account.objects.filter(customer_id=customer_id_or_404(request))
     return render(request, 'create_transaction.html', {'accounts': accounts})
 
+# Card purchase authorization against the card's open-to-buy. Most are
+# approved against escrow this process already holds, without queries; the
+# rest set aside more, and a card's first also creates its ledger balance row.
+@login_required
+@user_passes_test(check_role('customer'))
+@query_budget(10)
+def authorize_card_purchase(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST a JSON object with card_id, amount and description.'}, status=405)
+    try:
+        payload = json.loads(request.body)
+        card_id = int(payload['card_id'])
+        amount = Decimal(str(payload['amount']))
+        description = str(payload.get('description', 'Card purchase'))[:200]
+    except (ValueError, KeyError, TypeError, InvalidOperation):
+        return JsonResponse({'error': 'Expected card_id, amount and description.'}, status=400)
+    if not amount.is_finite() or amount <= 0 or amount != amount.quantize(Decimal('0.01')):
+        return JsonResponse({'error': 'Amount must be positive with at most two decimals.'}, status=400)
+    result = authorization.authorize(card_id, amount, description, customer_id=customer_id_or_404(request))
+    return JsonResponse(result.as_dict())
+
+
 
 # Bank Teller dashboard
+CUSTOMER_SORTS = {
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+    'email': ('email',),
+    '-email': ('-email',),
+    'newest': ('-id',),
+}
+
+def teller_querysets(query):
+    """Return the (customers, accounts) querysets matching a teller search."""
+    customers = Customer.objects.all()
+    accounts = Account.objects.select_related('customer')
+    if query:
+        if query.isdigit():
+            customers = customers.filter(
+                prefix_range('phone_number', query)
+                | Q(id__in=Account.objects.filter(prefix_range('account_number', query)).values('customer_id'))
+            )
+            accounts = accounts.filter(prefix_range('account_number', query) | Q(customer__in=customers))
+        else:
+            customers = search_customers(customers, query)
+            accounts = accounts.filter(customer__in=customers)
+    return customers, accounts
+
 @login_required
 @user_passes_test(check_role('teller'))
+@reads_from_replica
+@query_budget(4)
 def teller_dashboard(request):
-    accounts = Account.objects.all()
-    customers = Customer.objects.all()  # Add this to get all customers
-    return render(request, 'teller_dashboard.html', {'accounts': accounts, 'customers': customers})
+    query = request.GET.get('q', '').strip()
+    sort = request.GET.get('sort', 'name')
+    if sort not in CUSTOMER_SORTS:
+        sort = 'name'
+
+    customers, accounts = teller_querysets(query)
+    page_size = page_size_param(request, default=25, maximum=200)
+    try:
+        customers, next_customer_cursor = keyset_page(
+            customers, CUSTOMER_SORTS[sort], request.GET.get('cursor'), page_size)
+        accounts, next_account_cursor = keyset_page(
+            accounts, ('account_number',), request.GET.get('account_cursor'), page_size)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return render(request, 'teller_dashboard.html', {
+        'accounts': accounts,
+        'customers': customers,
+        'query': query,
+        'sort': sort,
+        'next_customer_cursor': next_customer_cursor,
+        'next_account_cursor': next_account_cursor,
+    })
 
 @login_required
 @user_passes_test(check_role('teller'))
@@ -146,20 +268,17 @@ def create_customer(request):
             username = customer.email.split('@')[0]
             password = generate_password()
 
-            user = User.objects.create_user(
-                username=username,
-                email=customer.email,
-                password=password
-            )
-            customer.user = user
-            customer.save()
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username=username,
+                    email=customer.email,
+                    password=password
+                )
+                customer.user = user
+                customer.save()
 
-            # Send credentials to customer via email
-            subject = 'Your Bank Account Credentials'
-            message = f'Your account has been created successfully. Your username is {username} and your password is {password}.'
-            from_email = 'yashbari99@gmail.com'
-            to_email = customer.email
-            send_mail(subject, message, from_email, [to_email])
+                # Queue the credentials email; send_queued_mail delivers it
+                credentials_email(customer.email, username, password, from_email='yashbari99@gmail.com').save()
 
             return redirect('create_account', user_id=user.id)  # Redirect to create_account view with user ID
     else:
@@ -167,9 +286,21 @@ def create_customer(request):
 
     return render(request, 'create_customer.html', {'customer_form': customer_form})
 
-# Function to generate a random password
-def generate_password():
-    return get_random_string(length=12, allowed_chars='abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%^&*()')
+# Bulk customer import from an uploaded CSV or NDJSON file
+@login_required
+@user_passes_test(check_role('teller'))
+def import_customers_api(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST a file field named "file".'}, status=405)
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'Missing "file" upload.'}, status=400)
+    fmt = request.POST.get('format') or guess_format(upload.name)
+    try:
+        result = import_customers(read_rows(upload.file, fmt))
+    except (ValueError, UnicodeDecodeError) as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(result.as_dict())
 
 @login_required
 @user_passes_test(check_role('teller'))
@@ -177,19 +308,27 @@ def create_account(request, user_id):
     user = get_object_or_404(User, id=user_id)
     customer = get_object_or_404(Customer, user=user)  # Get Customer associated with the User
     
+    # The number is only allocated for an account that is saved, not for
+    # every form shown
+    unsaved = Account(account_number='')
     if request.method == 'POST':
-        account_form = AccountForm(request.POST)
+        account_form = AccountForm(request.POST, instance=unsaved)
         if account_form.is_valid():
             account = account_form.save(commit=False)
             account.customer = customer
-            account.save()
+            account.account_number = generate_account_number()
+            # The opening amount is deposited, so it is journaled like any other
+            opening = account.balance
+            account.balance = 0
+            with transaction.atomic():
+                account.save()
+                if opening:
+                    post_transaction(account.id, 'deposit', opening, 'Opening balance', customer=customer)
             return redirect('teller_dashboard')  # Redirect to Teller Dashboard
     else:
-        account_form = AccountForm()
-    
-    account_number = generate_account_number()
+        account_form = AccountForm(instance=unsaved)
 
-    return render(request, 'create_account.html', {'account_form': account_form, 'customer': customer, 'account_number': account_number})
+    return render(request, 'create_account.html', {'account_form': account_form, 'customer': customer})
 
 @login_required
 @user_passes_test(check_role('teller'))
@@ -215,47 +354,140 @@ def delete_customer(request, customer_id):
 # Loan Officer dashboard
 @login_required
 @user_passes_test(check_role('loan_officer'))
+@reads_from_replica
+@query_budget(4)
 def loan_officer_dashboard(request):
-    loans = Loan.objects.all()
     if request.method == 'POST':
-        loan_id = request.POST.get('loan_id')
-        action = request.POST.get('action')
-        loan = Loan.objects.get(id=loan_id)
-        if action == 'approve':
-            loan.status = 'approved'
-        elif action == 'reject':
-            loan.status = 'rejected'
-        loan.save()
+        report_decisions(request, decide_loans(posted_decisions(request, 'loan_id')))
         return redirect('loan_officer_dashboard')
-    return render(request, 'loan_officer_dashboard.html', {'loans': loans})
+    return render_queue(request, Loan, 'loan_officer_dashboard.html', 'loans')
 
 # Credit Card Manager dashboard
 @login_required
 @user_passes_test(check_role('credit_card_manager'))
+@reads_from_replica
+@query_budget(4)
 def credit_card_manager_dashboard(request):
-    credit_cards = CreditCard.objects.all()
     if request.method == 'POST':
-        card_id = request.POST.get('card_id')
-        action = request.POST.get('action')
-        credit_card = CreditCard.objects.get(id=card_id)
-        if action == 'approve':
-            credit_card.status = 'active'
-        elif action == 'reject':
-            credit_card.status = 'rejected'
-        credit_card.save()
+        report_decisions(request, decide_credit_cards(posted_decisions(request, 'card_id')))
         return redirect('credit_card_manager_dashboard')
-    return render(request, 'credit_card_manager_dashboard.html', {'credit_cards': credit_cards})
+    return render_queue(request, CreditCard, 'credit_card_manager_dashboard.html', 'credit_cards')
+
+def queue_status(request, model):
+    statuses = [value for value, _ in model._meta.get_field('status').choices]
+    status = request.GET.get('status', 'pending')
+    return (status if status in statuses else 'pending'), statuses
+
+def render_queue(request, model, template_name, name):
+    status, statuses = queue_status(request, model)
+    try:
+        rows, next_cursor = keyset_page(queue(model, status), QUEUE_ORDERING, request.GET.get('cursor'), page_size_param(request))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return render(request, template_name, {name: rows, 'status': status, 'statuses': statuses, 'next_cursor': next_cursor})
+
+def posted_decisions(request, id_field):
+    # One action applied to every ticked row (or the single row's form)
+    action = request.POST.get('action')
+    return [{'id': pk, 'action': action} for pk in request.POST.getlist(id_field)]
+
+def report_decisions(request, result):
+    summary = result.as_dict()
+    messages.success(request, '{} application(s) updated.'.format(summary['updated']))
+    if summary['skipped']:
+        messages.warning(request, '{} application(s) were no longer pending and were left unchanged.'.format(len(summary['skipped'])))
+    if summary['invalid']:
+        messages.error(request, 'Unknown action.')
+
+LOAN_QUEUE_FIELDS = ('id', 'customer_id', 'customer__name', 'loan_type', 'amount', 'interest_rate', 'term_months', 'status', 'created_at')
+CARD_QUEUE_FIELDS = ('id', 'customer_id', 'customer__name', 'card_type', 'credit_limit', 'status')
+
+def queue_row(values):
+    row = dict(values)
+    row['customer_name'] = row.pop('customer__name')
+    for field in ('amount', 'interest_rate', 'credit_limit'):
+        if field in row:
+            row[field] = str(row[field])
+    if 'created_at' in row:
+        row['created_at'] = row['created_at'].isoformat()
+    return row
+
+def decisions_api(request, model, fields, decide):
+    """
+    GET pages through the queue of ``model``; POST applies a JSON body of
+    ``{"decisions": [{"id": 1, "action": "approve"}, ...]}`` in bulk and
+    reports which applications changed.
+    """
+    if request.method == 'POST':
+        try:
+            items = json.loads(request.body)['decisions']
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': 'Expected a JSON object with a "decisions" list.'}, status=400)
+        if not isinstance(items, list):
+            return JsonResponse({'error': '"decisions" must be a list.'}, status=400)
+        return JsonResponse(decide(items).as_dict())
+    status, _ = queue_status(request, model)
+    try:
+        rows, next_cursor = keyset_page(
+            queue(model, status).values(*fields), QUEUE_ORDERING, request.GET.get('cursor'), page_size_param(request))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    return JsonResponse({'results': [queue_row(row) for row in rows], 'next_cursor': next_cursor})
+
+# Bulk loan decisions, for officers and automated rules
+@login_required
+@user_passes_test(check_role('loan_officer'))
+def loan_decisions_api(request):
+    return decisions_api(request, Loan, LOAN_QUEUE_FIELDS, decide_loans)
+
+@login_required
+@user_passes_test(check_role('credit_card_manager'))
+def credit_card_decisions_api(request):
+    return decisions_api(request, CreditCard, CARD_QUEUE_FIELDS, decide_credit_cards)
 
 # Financial Advisor dashboard
 @login_required
 @user_passes_test(check_role('financial_advisor'))
+@reads_from_replica
+@query_budget(7)
 def financial_advisor_dashboard(request):
-    investments = Investment.objects.all()
-    return render(request, 'financial_advisor_dashboard.html', {'investments': investments})
+    try:
+        page = portfolio.customer_page(request.GET.get('cursor'), page_size_param(request))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return render(request, 'financial_advisor_dashboard.html', advisor_context(portfolio.book_summary(), page))
+
+def advisor_context(summary, page):
+    return {'summary': summary, 'horizons': portfolio.HORIZONS, 'customers': page['customers'], 'next_cursor': page['next_cursor']}
+
+def bounded_param(request, name, cast, default, low, high):
+    value = cast(request.GET.get(name, default))
+    if not low <= value <= high:
+        raise ValueError(name)
+    return value
+
+# Monte Carlo projection of a customer's retirement plans
+@login_required
+@user_passes_test(check_role('financial_advisor'))
+@reads_from_replica
+@query_budget(5)
+def retirement_projection(request, customer_id):
+    try:
+        retirement_age = bounded_param(request, 'retirement_age', int, 65, 40, 100)
+        growth = bounded_param(request, 'growth', float, 0, -10, 20)
+        paths = bounded_param(request, 'paths', int, getattr(settings, 'RETIREMENT_PATHS', 5000), 100, 50000)
+    except ValueError:
+        return JsonResponse({'error': 'retirement_age must be 40-100, growth -10 to 20 and paths 100-50000.'}, status=400)
+    try:
+        return JsonResponse(retirement.customer_projection(customer_id, retirement_age, growth, paths))
+    except Customer.DoesNotExist:
+        raise Http404('No Customer matches the given query.')
 
 # Admin dashboard
 @login_required
 @user_passes_test(check_role('admin'))
+@reads_from_replica
+@query_budget(3)
 def admin_dashboard(request):
     users = User.objects.all()
     return render(request, 'admin_dashboard.html', {'users': users})
@@ -309,7 +541,7 @@ def apply_loan(request):
         form = LoanForm(request.POST)
         if form.is_valid():
             loan = form.save(commit=False)
-            loan.customer = get_object_or_404(Customer, user=request.user)
+            loan.customer_id = customer_id_or_404(request)
             loan.save()
             return redirect('customer_dashboard')
     else:
@@ -323,7 +555,7 @@ def apply_credit_card(request):
         form = CreditCardForm(request.POST)
         if form.is_valid():
             credit_card = form.save(commit=False)
-            credit_card.customer = get_object_or_404(Customer, user=request.user)
+            credit_card.customer_id = customer_id_or_404(request)
             credit_card.save()
             return redirect('customer_dashboard')
     else:
@@ -337,7 +569,7 @@ def apply_investment(request):
         form = InvestmentForm(request.POST)
         if form.is_valid():
             investment = form.save(commit=False)
-            investment.customer = get_object_or_404(Customer, user=request.user)
+            investment.customer_id = customer_id_or_404(request)
             investment.save()
             return redirect('customer_dashboard')
     else:
@@ -351,9 +583,35 @@ def apply_retirement_plan(request):
         form = RetirementPlanForm(request.POST)
         if form.is_valid():
             retirement_plan = form.save(commit=False)
-            retirement_plan.customer = get_object_or_404(Customer, user=request.user)
+            retirement_plan.customer_id = customer_id_or_404(request)
             retirement_plan.save()
             return redirect('customer_dashboard')
     else:
         form = RetirementPlanForm()
     return render(request, 'apply_retirement_plan.html', {'form': form})
+
+# Shared counters (cache hit rates and the like) for operators
+@login_required
+@user_passes_test(check_role('admin'))
+def metrics_view(request):
+    return JsonResponse({**metrics.snapshot(), 'db_pools': pooling.stats()})
+
+# Profile picture thumbnails, shown to the picture's owner and to staff
+@login_required
+def thumbnail(request, name):
+    match = images.THUMBNAIL_NAME.match(name)
+    # Not 403: whether someone else's picture exists is not given away
+    if match is None or not images.may_view(request.identity, match.group('digest')):
+        raise Http404('No such thumbnail.')
+    return _thumbnail_file(request, name, match.group('ext'))
+
+# Names are content hashes, so never stale
+@condition(etag_func=lambda request, name, ext: name)
+def _thumbnail_file(request, name, ext):
+    try:
+        file = default_storage.open(f'{images.THUMBNAIL_DIR}/{name}', 'rb')
+    except FileNotFoundError:
+        raise Http404('No such thumbnail.')
+    response = FileResponse(file, content_type=images.CONTENT_TYPES[ext])
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
@@ -0,0 +1,217 @@
+import csv
+import datetime
+import gzip
+import os
+import shutil
+import time
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Account, CreditCardTransaction, ExportWatermark, Loan, Repayment, Transaction
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # Without pyarrow, tables are exported as gzipped CSV
+    pyarrow = None
+
+# Export name -> (model, date field partitioning its rows). Tables with a
+# date field only grow, so each run exports the rows past the id watermark,
+# plus rows that committed late into gaps the watermark had already passed
+# (ids are not committed in order on PostgreSQL). Tables without one are
+# updated in place and exported as a dated snapshot.
+TABLES = {
+    'transactions': (Transaction, 'created_at'),
+    'card_transactions': (CreditCardTransaction, 'created_at'),
+    'repayments': (Repayment, 'repayment_date'),
+    'loans': (Loan, None),
+    'accounts': (Account, None),
+}
+
+
+class ExportError(Exception):
+    """Raised when an export cannot be written in the requested format."""
+
+
+def root():
+    return getattr(settings, 'WAREHOUSE_ROOT', os.path.join(settings.BASE_DIR, 'warehouse'))
+
+
+def default_format():
+    return 'parquet' if pyarrow is not None else 'csv'
+
+
+def columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def _write_parquet(path, names, rows):
+    pyarrow.parquet.write_table(pyarrow.table(dict(zip(names, map(list, zip(*rows))))), path, compression='zstd')
+
+
+def _write_csv(path, names, rows):
+    with gzip.open(path, 'wt', compresslevel=6, newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(names)
+        writer.writerows(rows)
+
+
+WRITERS = {'parquet': ('.parquet', _write_parquet), 'csv': ('.csv.gz', _write_csv)}
+
+
+def _write(directory, first_id, fmt, names, rows):
+    suffix, write = WRITERS[fmt]
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'part-{first_id:012d}{suffix}')
+    # Renamed into place, so readers never see a partial file and a retried
+    # chunk replaces the file it wrote before
+    write(path + '.tmp', names, rows)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def _chunks(model, names, after, chunk_size, using):
+    """Rows with an id above ``after``, in id order, one short query per chunk."""
+    while True:
+        rows = list(
+            model.objects.using(using).filter(id__gt=after).order_by('id')
+            .values_list(*names)[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][0]
+
+
+def _advance(table, rows, **fields):
+    ExportWatermark.objects.filter(table=table).update(
+        last_id=rows[-1][0], rows=F('rows') + len(rows), updated_at=timezone.now(), **fields)
+
+
+# Gap ranges rechecked per query
+GAP_BATCH_SIZE = 500
+
+
+def late_row_window():
+    return getattr(settings, 'WAREHOUSE_LATE_ROW_WINDOW', 600)
+
+
+def _find_gaps(after, rows, now):
+    """``[first_id, last_id, now]`` for every run of ids missing from ``rows`` above ``after``."""
+    gaps = []
+    for row in rows:
+        if row[0] > after + 1:
+            gaps.append([after + 1, row[0] - 1, now])
+        after = row[0]
+    return gaps
+
+
+def _fill_gaps(gaps, ids):
+    """``gaps`` without ``ids``, splitting the ranges they fall in."""
+    remaining = []
+    for first, last, seen in gaps:
+        for found in sorted(pk for pk in ids if first <= pk <= last):
+            if found > first:
+                remaining.append([first, found - 1, seen])
+            first = found + 1
+        if first <= last:
+            remaining.append([first, last, seen])
+    return remaining
+
+
+def _write_by_date(table, date_index, fmt, names, rows):
+    by_date = defaultdict(list)
+    for row in rows:
+        by_date[row[date_index].date().isoformat()].append(row)
+    for date, partition in by_date.items():
+        _write(os.path.join(root(), table, f'date={date}'), partition[0][0], fmt, names, partition)
+
+
+def _export_new_rows(table, model, date_field, fmt, chunk_size, using):
+    names = columns(model)
+    date_index = names.index(date_field)
+    watermark, _ = ExportWatermark.objects.get_or_create(table=table)
+    now = time.time()
+    # Gaps stay open for the window, after which they are taken for rolled
+    # back inserts. Rows found in them were never exported, since their ids
+    # were missing when the watermark passed.
+    open_gaps = [gap for gap in watermark.gaps if now - gap[2] < late_row_window()]
+    gaps = []
+    exported = 0
+    for start in range(0, len(open_gaps), GAP_BATCH_SIZE):
+        ranges = open_gaps[start:start + GAP_BATCH_SIZE]
+        late = list(
+            model.objects.using(using).filter(reduce(or_, (Q(id__range=(first, last)) for first, last, _ in ranges)))
+            .order_by('id').values_list(*names)
+        )
+        if late:
+            _write_by_date(table, date_index, fmt, names, late)
+            exported += len(late)
+        gaps += _fill_gaps(ranges, [row[0] for row in late])
+    if exported or gaps != watermark.gaps:
+        ExportWatermark.objects.filter(table=table).update(
+            gaps=gaps, rows=F('rows') + exported, updated_at=timezone.now())
+
+    after = watermark.last_id
+    for rows in _chunks(model, names, after, chunk_size, using):
+        _write_by_date(table, date_index, fmt, names, rows)
+        gaps += _find_gaps(after, rows, now)
+        _advance(table, rows, gaps=gaps)
+        after = rows[-1][0]
+        exported += len(rows)
+    return exported
+
+
+def _export_snapshot(table, model, fmt, chunk_size, using, today):
+    names = columns(model)
+    watermark, _ = ExportWatermark.objects.get_or_create(table=table)
+    if watermark.snapshot_complete and watermark.snapshot_date == today:
+        return 0
+    if watermark.snapshot_complete or watermark.snapshot_date is None:
+        watermark.snapshot_date = today
+        watermark.snapshot_complete = False
+        watermark.last_id = 0
+        watermark.save()
+    # An unfinished snapshot resumes under its own date
+    directory = os.path.join(root(), table, f'snapshot={watermark.snapshot_date.isoformat()}')
+    exported = 0
+    for rows in _chunks(model, names, watermark.last_id, chunk_size, using):
+        _write(directory, rows[0][0], fmt, names, rows)
+        _advance(table, rows)
+        exported += len(rows)
+    ExportWatermark.objects.filter(table=table).update(snapshot_complete=True, updated_at=timezone.now())
+    return exported
+
+
+def reset(table):
+    """Forget ``table``'s watermark and delete its files, so it is exported afresh."""
+    ExportWatermark.objects.filter(table=table).delete()
+    shutil.rmtree(os.path.join(root(), table), ignore_errors=True)
+
+
+def export(tables=None, fmt=None, chunk_size=100000, using='default', today=None):
+    """
+    Export ``tables`` (names in ``TABLES``, default all) under ``root()`` as
+    hive-style partitions. Rows are read ``chunk_size`` at a time and the
+    watermark advances after each chunk's files are written, so memory stays
+    bounded and a rerun only reads rows it has not exported. Returns the
+    rows exported per table.
+    """
+    fmt = fmt or default_format()
+    if fmt == 'parquet' and pyarrow is None:
+        raise ExportError('Parquet export needs pyarrow; use the csv format instead.')
+    today = today or datetime.date.today()
+    exported = {}
+    for table in tables or TABLES:
+        model, date_field = TABLES[table]
+        if date_field is None:
+            exported[table] = _export_snapshot(table, model, fmt, chunk_size, using, today)
+        else:
+            exported[table] = _export_new_rows(table, model, date_field, fmt, chunk_size, using)
+    return exported
@@ -41,11 +41,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bank.querycount.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bank.identity.IdentityMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,13 +76,35 @@ WSGI_APPLICATION = 'bank_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# The bank.db_backends engines pool connections per process (see
+# bank/pooling.py for the POOL options), so a request reuses a connection
+# released by an earlier one; CONN_MAX_AGE stays 0 to release it at the end
+# of every request. cached_statements sizes SQLite's per-connection prepared
+# statement cache, which pooled connections carry across requests. For
+# PostgreSQL use 'bank.db_backends.postgresql' with the same POOL dict.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'bank.db_backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {'cached_statements': 256},
+        'POOL': {'MAX_SIZE': 10, 'IDLE_TIMEOUT': 300},
+    },
+    # Read-only connection to the same file for dashboard and report reads;
+    # point NAME at a snapshot copy to take them off the primary entirely
+    'replica': {
+        'ENGINE': 'bank.db_backends.sqlite3',
+        'NAME': f'file:{BASE_DIR / "db.sqlite3"}?mode=ro',
+        'OPTIONS': {'uri': True, 'cached_statements': 256},
+        'POOL': {'MAX_SIZE': 10, 'IDLE_TIMEOUT': 300},
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['bank.database.ReplicaRouter']
+
+# Overrides of the pragmas bank.database applies to each SQLite connection
+SQLITE_PRAGMAS = {}
+
 '''DATABASES = {
     'default': {
         'ENGINE': 'mysql.connector.django',
@@ -93,6 +117,21 @@ DATABASES = {
 }'''
 
 
+# Cache
+# Swap in 'django.core.cache.backends.filebased.FileBasedCache' with a
+# LOCATION directory to share the cache between local worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bank-app',
+    }
+}
+
+DASHBOARD_CACHE_ALIAS = 'default'
+DASHBOARD_CACHE_TIMEOUT = 300
+METRICS_CACHE_ALIAS = 'default'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -111,6 +150,26 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Passwords are hashed with Argon2 when argon2-cffi is installed and with
+# scrypt otherwise. The hashers after the first only check older passwords,
+# which are rehashed with the first at the user's next login.
+try:
+    import argon2  # noqa: F401
+    PASSWORD_HASHERS = ['bank.hashers.TimedArgon2PasswordHasher', 'bank.hashers.TimedScryptPasswordHasher']
+except ImportError:
+    PASSWORD_HASHERS = ['bank.hashers.TimedScryptPasswordHasher']
+PASSWORD_HASHERS += ['bank.hashers.TimedPBKDF2PasswordHasher', 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+PASSWORD_SCRYPT_WORK_FACTOR = 2 ** 14
+
+# Failed logins allowed per username from one client IP, and per client IP,
+# within the window (seconds); further attempts from that IP are refused
+# without checking the password. The counters live in DASHBOARD_CACHE_ALIAS,
+# which must be shared between workers in production (check bank.W001):
+# with LocMemCache each process keeps, and allows, its own count.
+LOGIN_FAILURE_LIMIT = 5
+LOGIN_IP_FAILURE_LIMIT = 50
+LOGIN_FAILURE_WINDOW = 900
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -129,6 +188,71 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Uploaded profile pictures and their thumbnails
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Query budgets declared with @query_budget are logged when exceeded;
+# set QUERY_BUDGET_STRICT to raise instead (the test suite does).
+QUERY_BUDGET_STRICT = False
+QUERY_N_PLUS_ONE_THRESHOLD = 5
+
+# Rows holding the running balance of each general ledger book, which
+# every posting updates; balances read from them add the rows up
+LEDGER_GL_SHARDS = 16
+# How long (seconds) snapshot rounds wait for a missing journal leg id to
+# commit before taking it for a rolled back entry
+LEDGER_LATE_LEG_WINDOW = 600
+
+# Account and card numbers are allocated in per-process blocks of this size
+NUMBER_BLOCK_SIZE = 100
+CARD_NUMBER_PREFIX = '400000'
+
+# Card authorization: each process approves against slices of up to
+# CARD_AUTH_ESCROW of a card's open-to-buy set aside in the database, for up
+# to CARD_AUTH_CACHE_SIZE cards, each for at most CARD_AUTH_CACHE_TTL
+# seconds. Approvals are written and posted in batches of up to
+# CARD_AUTH_BATCH_SIZE by a background thread that waits on its queue for up
+# to CARD_AUTH_FLUSH_INTERVAL seconds between sweeps for expired escrow.
+# Set CARD_AUTH_FLUSH_INTERVAL to 0 to write batches inline instead.
+CARD_AUTH_CACHE_SIZE = 10000
+CARD_AUTH_CACHE_TTL = 5
+CARD_AUTH_ESCROW = 2000
+CARD_AUTH_BATCH_SIZE = 200
+CARD_AUTH_FLUSH_INTERVAL = 1
+
+# Credit card statements: annual rate charged on revolving balances (%),
+# minimum payment floor, and days from cycle end to the payment due date
+CARD_APR = 24
+CARD_MINIMUM_PAYMENT = 25
+CARD_PAYMENT_DAYS = 25
+
+# Annual interest rate (percent) accrued daily on savings balances
+SAVINGS_INTEREST_RATE = 2
+
+# Monte Carlo paths per retirement projection, and the base seed that keeps
+# projections reproducible
+RETIREMENT_PATHS = 5000
+RETIREMENT_SEED = 0
+
+# Where export_warehouse writes its partitioned files, and how long (seconds)
+# it keeps looking for rows committed late into ids it has already passed
+WAREHOUSE_ROOT = BASE_DIR / 'warehouse'
+WAREHOUSE_LATE_ROW_WINDOW = 600
+
+# Sessions are read from the cache and written through to the database.
+# The logged-in user, role and Customer id are cached too (bank.identity),
+# dropped when the User or Customer is saved and otherwise kept this many
+# seconds, which bounds staleness after queryset.update() calls.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTHENTICATION_BACKENDS = ['bank.identity.CachedModelBackend']
+IDENTITY_CACHE_TIMEOUT = 300
+
+# Square profile picture thumbnail sizes (pixels), and the background
+# threads making them; 0 makes them inline, as the tests do
+THUMBNAIL_SIZES = (64, 150, 300)
+THUMBNAIL_WORKERS = 2
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 